@@ -5,15 +5,24 @@ Created by: rggentil
 Date: 18/04/16
 '''
 
+from datetime import datetime
+import gzip
+import hashlib
 import logging
+import random
 from flask import Flask, json, jsonify
 import flask
-from api_exchange_sim_constants import API_EX_SIM_PAIRS_STATS
+from api_exchange_sim_constants import API_EX_SIM_PAIRS_STATS, API_EX_SIM_TRADING_PAIRS
+from StringIO import StringIO
 
 
 API_EX_SIM_PATH = ''
 API_EX_SIM_HOST = '127.0.0.1'
 API_EX_SIM_PORT = 9071
+API_EX_SIM_STATS_BODY = json.dumps(json.loads(API_EX_SIM_PAIRS_STATS))
+API_EX_SIM_LAST_MODIFIED = datetime.utcnow().replace(microsecond=0)  # Stats don't change while the simulator runs
+API_EX_SIM_ORDER_BOOK_LIMIT = 50
+API_EX_SIM_ORDER_BOOK_LEVELS = 200
 
 
 logger = logging.getLogger("api_ex_sim")
@@ -75,7 +84,70 @@ def get_trading_stats():
     GET for trading pairs of the exchange
     """
     app.logger.info(flask.request.url)
-    return jsonify(json.loads(API_EX_SIM_PAIRS_STATS)), 200
+    return conditional_response(API_EX_SIM_STATS_BODY, API_EX_SIM_LAST_MODIFIED)
+
+
+@app.route("/market/orderbooks/<pair>", methods=['GET'])
+def get_order_book(pair):
+    """
+    GET for the order book of a pair of the exchange
+    """
+    app.logger.info(flask.request.url)
+    pair_stats = json.loads(API_EX_SIM_PAIRS_STATS)['result']
+    if pair not in pair_stats:
+        raise ApiExSimError('Trading pair {} not found'.format(pair), status_code=404, error_code=4004)
+    limit = flask.request.args.get('limit', API_EX_SIM_ORDER_BOOK_LIMIT, type=int)
+    last_price = float(pair_stats[pair]['last_price'])  # For the pairs without bids or asks in the stats
+    orderbook = get_simulated_order_book(pair, float(pair_stats[pair]['highest_bid']) or last_price * 0.999,
+                                         float(pair_stats[pair]['lowest_ask']) or last_price * 1.001, limit)
+    return conditional_response(json.dumps({'success': True, 'result': {'orderbook': orderbook}}),
+                                API_EX_SIM_LAST_MODIFIED)
+
+
+def get_simulated_order_book(pair, highest_bid, lowest_ask, limit):
+    """
+    Generate the order book of a pair, from its best bid and ask. Levels are random but always the same for the same
+    pair, so the book doesn't change while the simulator runs
+    :param pair: str with the pair
+    :param highest_bid: float, price of the first bid level
+    :param lowest_ask: float, price of the first ask level
+    :param limit: int, max number of levels of each side
+    :return: dict with the order book in the format of Cobinhood, levels are lists [price, count, size] of str
+    """
+    generator = random.Random(pair)
+    orderbook = {'sequence': 0, 'bids': [], 'asks': []}
+    for side, price, direction in (('bids', highest_bid, -1), ('asks', lowest_ask, 1)):
+        for _ in range(min(limit, API_EX_SIM_ORDER_BOOK_LEVELS)):
+            if price <= 0:
+                break
+            orderbook[side].append(['{:.10f}'.format(price), str(generator.randint(1, 5)),
+                                    '{:.4f}'.format(generator.expovariate(1.0) * 1000)])
+            price *= 1 + direction * generator.choice([0.001, 0.001, 0.002, 0.005, 0.02])
+    return orderbook
+
+
+def conditional_response(body, last_modified):
+    """
+    Build a json response with ETag and Last-Modified, that answers 304 Not Modified to conditional requests if the body
+    hasn't changed and that is compressed with gzip if the client accepts it, as real exchanges do
+    :param body: str with the json of the response
+    :param last_modified: datetime of the last change of the body
+    :return: flask.Response
+    """
+    response = flask.Response(body, mimetype='application/json')
+    response.set_etag(hashlib.md5(body).hexdigest())
+    response.last_modified = last_modified
+    response.make_conditional(flask.request)
+    if response.status_code == 200 and 'gzip' in flask.request.headers.get('Accept-Encoding', ''):
+        compressed_body = StringIO()
+        with gzip.GzipFile(fileobj=compressed_body, mode='wb') as f:
+            f.write(body)
+        response.set_data(compressed_body.getvalue())
+        response.headers['Content-Encoding'] = 'gzip'
+        response.headers['Vary'] = 'Accept-Encoding'
+    app.logger.info('Response %d, %d bytes', response.status_code,
+                    0 if response.status_code == 304 else len(response.get_data()))
+    return response
 
 
 if __name__ == '__main__':
@@ -17,7 +17,7 @@ import json
 from bdd.api_exchange_simulator.api_exchange_sim_constants import API_EX_SIM_PAIRS_STATS
 
 
-VOLUME_PAIRS_FILE = os.path.join('out', 'pairs_volume.json')
+VOLUME_PAIRS_FILE = os.path.join('out', 'pairs_volume_simulator.json')
 
 
 logger = logging.getLogger('behave')
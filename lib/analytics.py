@@ -0,0 +1,224 @@
+'''
+This module includes the class RollingAnalytics that keeps rolling statistics of the pairs of an exchange over the last
+samples of the stats: moving average of the volume, EMA, volatility and min/max of the price. The samples of the window
+are kept in ring buffers, numpy arrays with a row for each sample and a column for each pair, and every statistic is
+updated incrementally for all the pairs at once in each update, so the cost of an update doesn't depend on the length of
+the window. Min and max are kept by blocks of a window of samples: the min and max of the samples of the current block
+so far, and the min and max of the last samples of the previous block, computed once per block, so they cost amortized
+constant time.
+Created: rggentil
+Date: 06/06/18
+'''
+
+
+import logging
+import numpy as np
+
+
+DEFAULT_WINDOW = 144  # 24h of samples with the default interval of 10 minutes
+DEFAULT_EMA_SPAN = 12
+
+
+logger = logging.getLogger('rodbot')
+
+
+class RingBuffer(object):
+    '''
+    Ring buffer of the last samples of a value for several columns, with the running sum and sum of squares of each
+    column. Nan values are not counted.
+    '''
+
+    def __init__(self, size, columns=0):
+        '''
+        Constructor
+        :param size: int, number of samples of the buffer
+        :param columns: int, initial number of columns
+        '''
+        self.size = size
+        self.values = np.full((size, columns), np.nan)
+        self.sums = np.zeros(columns)
+        self.squares = np.zeros(columns)
+        self.counts = np.zeros(columns, dtype=np.intp)
+
+    def add_columns(self, columns):
+        '''
+        Add columns to the buffer, without samples
+        :param columns: int, number of columns to add
+        '''
+        self.values = np.hstack([self.values, np.full((self.size, columns), np.nan)])
+        self.sums = np.concatenate([self.sums, np.zeros(columns)])
+        self.squares = np.concatenate([self.squares, np.zeros(columns)])
+        self.counts = np.concatenate([self.counts, np.zeros(columns, dtype=np.intp)])
+
+    def push(self, position, values):
+        '''
+        Replace the oldest sample with a new one, updating the running sums with the difference
+        :param position: int, row of the oldest sample
+        :param values: numpy array with the new value of each column
+        :return: numpy array with the values replaced
+        '''
+        old_values = self.values[position].copy()
+        self.values[position] = values
+        old_valid, new_valid = ~np.isnan(old_values), ~np.isnan(values)
+        old_values, values = np.where(old_valid, old_values, 0), np.where(new_valid, values, 0)
+        self.sums += values - old_values
+        self.squares += values ** 2 - old_values ** 2
+        self.counts += new_valid.astype(np.intp) - old_valid
+        return np.where(old_valid, old_values, np.nan)
+
+    def resync(self):
+        '''
+        Compute again the running sums from the samples, to discard the rounding errors accumulated by the updates
+        '''
+        valid = ~np.isnan(self.values)
+        values = np.where(valid, self.values, 0)
+        self.sums = values.sum(axis=0)
+        self.squares = (values ** 2).sum(axis=0)
+        self.counts = valid.sum(axis=0)
+
+    def get_mean(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(self.counts > 0, self.sums / self.counts, np.nan)
+
+    def get_std(self):
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = self.sums / self.counts
+            variance = np.maximum(self.squares / self.counts - mean ** 2, 0)
+        return np.where(self.counts > 1, np.sqrt(variance * self.counts / np.maximum(self.counts - 1, 1)), np.nan)
+
+
+class RollingAnalytics(object):
+    '''
+    Rolling statistics of the pairs of an exchange over a window of the last samples
+    '''
+
+    def __init__(self, window=DEFAULT_WINDOW, ema_span=DEFAULT_EMA_SPAN):
+        '''
+        Constructor
+        :param window: int, number of samples of the window
+        :param ema_span: int, span of the exponential moving average of the price, in samples
+        '''
+        self.window = window
+        self.alpha = 2.0 / (ema_span + 1)
+        self.pairs = []
+        self.index = {}
+        self.samples = 0
+        self._volumes = RingBuffer(window)
+        self._prices = RingBuffer(window)
+        self._returns = RingBuffer(window)  # Log returns of the price
+        self._last_prices = np.empty(0)
+        self._ema = np.empty(0)
+        self._min = np.empty(0)
+        self._max = np.empty(0)
+        self._block_min = np.empty(0)  # Min of the samples of the current block
+        self._block_max = np.empty(0)
+        self._suffix_min = np.empty((window, 0))  # Min of the samples of the previous block from each position
+        self._suffix_max = np.empty((window, 0))
+        self._snapshot_pairs = None
+        self._snapshot_positions = None
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def _add_pairs(self, pair_ids):
+        '''
+        Add columns for new pairs
+        :param pair_ids: list of str with the pairs
+        '''
+        for pair_id in pair_ids:
+            self.index[pair_id] = len(self.pairs)
+            self.pairs.append(pair_id)
+        for ring_buffer in (self._volumes, self._prices, self._returns):
+            ring_buffer.add_columns(len(pair_ids))
+        nans = np.full(len(pair_ids), np.nan)
+        self._last_prices = np.concatenate([self._last_prices, nans])
+        self._ema = np.concatenate([self._ema, nans])
+        self._min = np.concatenate([self._min, nans])
+        self._max = np.concatenate([self._max, nans])
+        self._block_min = np.concatenate([self._block_min, nans])
+        self._block_max = np.concatenate([self._block_max, nans])
+        self._suffix_min = np.hstack([self._suffix_min, np.full((self.window, len(pair_ids)), np.nan)])
+        self._suffix_max = np.hstack([self._suffix_max, np.full((self.window, len(pair_ids)), np.nan)])
+
+    def _get_columns(self, snapshot, field):
+        '''
+        Get the values of a field of a snapshot in the order of the pairs of the analytics, nan for the pairs that are
+        not in the snapshot
+        '''
+        if self._snapshot_pairs is not snapshot.pairs and self._snapshot_pairs != snapshot.pairs:
+            new_pairs = [pair_id for pair_id in snapshot.pairs if pair_id not in self.index]
+            if new_pairs:
+                self._add_pairs(new_pairs)
+            self._snapshot_pairs = snapshot.pairs
+            self._snapshot_positions = np.array([snapshot.index.get(pair_id, -1) for pair_id in self.pairs],
+                                                dtype=np.intp)
+        positions = self._snapshot_positions
+        values = np.full(len(self.pairs), np.nan)
+        values[positions >= 0] = snapshot.columns[field][positions[positions >= 0]]
+        return values
+
+    def update(self, snapshot, delta=None):
+        '''
+        Add a sample with the stats of a snapshot. Running sums are updated with the difference between the new sample
+        and the sample that leaves the window, the EMA with the new sample, and min and max with the min and max of the
+        current block and of the rest of the previous block. The update is amortized constant time for each pair, the
+        first sample of each block scans the samples of the previous block once.
+        :param snapshot: MarketSnapshot
+        :param delta: MarketDelta of the snapshot. Not used, so this method can be a stats listener of ApiExchange
+        '''
+        volumes = self._get_columns(snapshot, 'base_volume')
+        prices = self._get_columns(snapshot, 'last_price')
+        prices[~(prices > 0)] = np.nan  # Pairs without trades
+        position = self.samples % self.window
+        if position == 0:  # New block, the buffer has the samples of the previous block
+            self._suffix_min = np.fmin.accumulate(self._prices.values[::-1], axis=0)[::-1]
+            self._suffix_max = np.fmax.accumulate(self._prices.values[::-1], axis=0)[::-1]
+            self._block_min, self._block_max = prices.copy(), prices.copy()
+        else:
+            self._block_min = np.fmin(self._block_min, prices)
+            self._block_max = np.fmax(self._block_max, prices)
+        self._volumes.push(position, volumes)
+        self._prices.push(position, prices)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            returns = np.log(prices / self._last_prices)
+        self._returns.push(position, returns)
+        new_price = ~np.isnan(prices)
+        self._last_prices[new_price] = prices[new_price]
+        first_price = new_price & np.isnan(self._ema)
+        self._ema[first_price] = prices[first_price]
+        update_ema = new_price & ~first_price
+        self._ema[update_ema] += self.alpha * (prices[update_ema] - self._ema[update_ema])
+        # The window is the current block and the samples of the previous block after the position
+        if position + 1 < self.window:
+            self._min = np.fmin(self._block_min, self._suffix_min[position + 1])
+            self._max = np.fmax(self._block_max, self._suffix_max[position + 1])
+        else:
+            self._min, self._max = self._block_min.copy(), self._block_max.copy()
+        self.samples += 1
+        if self.samples % self.window == 0:
+            for ring_buffer in (self._volumes, self._prices, self._returns):
+                ring_buffer.resync()
+        logger.debug('Rolling analytics updated with sample %d of %d pairs', self.samples, len(self.pairs))
+
+    def get_columns(self):
+        '''
+        Get the statistics of all the pairs
+        :return: dict statistic-numpy array with a value for each pair of self.pairs, nan if there aren't samples.
+                 Statistics are volume_ma, moving average of the base volume; price_ema, exponential moving average of
+                 the last price; volatility, standard deviation of the log returns of the last price; price_min and
+                 price_max, min and max of the last price
+        '''
+        return {'volume_ma': self._volumes.get_mean(),
+                'price_ema': self._ema.copy(),
+                'volatility': self._returns.get_std(),
+                'price_min': self._min.copy(),
+                'price_max': self._max.copy()}
+
+    def get_pair_stats(self, pair_id):
+        '''
+        Get the statistics of a pair
+        :param pair_id: str with the pair in the form XXX-YYY
+        :return: dict statistic-float, see get_columns
+        '''
+        i = self.index[pair_id]
+        return {name: float(values[i]) for name, values in self.get_columns().iteritems()}
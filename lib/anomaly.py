@@ -0,0 +1,122 @@
+'''
+This module includes the class AnomalyDetector that reports the pairs of an exchange whose volume or change in 24h jump
+far from their usual values. The mean and variance of each field of each pair are kept with Welford's streaming
+algorithm, in arrays with a value for each pair, so each update is scored and added to the statistics of all the pairs
+at once, without keeping any history.
+Created: rggentil
+Date: 06/08/18
+'''
+
+
+from collections import namedtuple
+import logging
+import numpy as np
+
+
+DEFAULT_FIELDS = ('base_volume', 'percent_changed_24hr')
+DEFAULT_THRESHOLD = 4.0
+DEFAULT_MIN_SAMPLES = 10
+
+
+logger = logging.getLogger('rodbot')
+
+
+AnomalyEvent = namedtuple('AnomalyEvent', ['pair', 'field', 'value', 'mean', 'z_score'])
+
+
+class AnomalyDetector(object):
+    '''
+    Streaming detector of anomalies in the stats of the pairs of an exchange, by z-score
+    '''
+
+    def __init__(self, fields=DEFAULT_FIELDS, threshold=DEFAULT_THRESHOLD, min_samples=DEFAULT_MIN_SAMPLES):
+        '''
+        Constructor
+        :param fields: tuple of str, fields of the stats that are checked
+        :param threshold: float, min absolute z-score of a value to be reported
+        :param min_samples: int, min number of samples of a pair before its values are scored
+        '''
+        self.fields = tuple(fields)
+        self.threshold = threshold
+        self.min_samples = min_samples
+        self.pairs = []
+        self.index = {}
+        self.last_events = []
+        self._counts = {field: np.zeros(0, dtype=np.intp) for field in self.fields}
+        self._means = {field: np.zeros(0) for field in self.fields}
+        self._squares = {field: np.zeros(0) for field in self.fields}  # Sum of squares of differences from the mean
+        self._last_snapshot = None
+        self._snapshot_pairs = None
+        self._snapshot_positions = None
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def _get_positions(self, snapshot):
+        '''
+        Get the position in a snapshot of each pair of the detector, -1 for the pairs that are not in the snapshot.
+        New pairs of the snapshot are added to the detector.
+        '''
+        if self._snapshot_pairs is not snapshot.pairs and self._snapshot_pairs != snapshot.pairs:
+            new_pairs = [pair_id for pair_id in snapshot.pairs if pair_id not in self.index]
+            for pair_id in new_pairs:
+                self.index[pair_id] = len(self.pairs)
+                self.pairs.append(pair_id)
+            for field in self.fields:
+                self._counts[field] = np.concatenate([self._counts[field], np.zeros(len(new_pairs), dtype=np.intp)])
+                self._means[field] = np.concatenate([self._means[field], np.zeros(len(new_pairs))])
+                self._squares[field] = np.concatenate([self._squares[field], np.zeros(len(new_pairs))])
+            self._snapshot_pairs = snapshot.pairs
+            self._snapshot_positions = np.array([snapshot.index.get(pair_id, -1) for pair_id in self.pairs],
+                                                dtype=np.intp)
+        return self._snapshot_positions
+
+    def update(self, snapshot, delta=None):
+        '''
+        Score the values of a snapshot against the statistics of the previous ones and add them to the statistics. The
+        same snapshot is only counted once, so stats that haven't changed between updates don't shrink the variance
+        nor report the same anomalies again.
+        :param snapshot: MarketSnapshot
+        :param delta: MarketDelta of the snapshot. Not used, so this method can be a stats listener of ApiExchange
+        :return: list of AnomalyEvent, by pair and field. They are kept in last_events too
+        '''
+        if snapshot is self._last_snapshot:
+            self.last_events = []
+            return self.last_events
+        self._last_snapshot = snapshot
+        positions = self._get_positions(snapshot)
+        found = positions >= 0
+        events = []
+        for field in self.fields:
+            values = np.full(len(self.pairs), np.nan)
+            values[found] = snapshot.columns[field][positions[found]]
+            counts, means, squares = self._counts[field], self._means[field], self._squares[field]
+            valid = ~np.isnan(values)
+            with np.errstate(invalid='ignore', divide='ignore'):
+                stds = np.sqrt(squares / (counts - 1))
+                z_scores = (values - means) / stds
+                anomalous = valid & (counts >= self.min_samples) & (stds > 0) & (np.abs(z_scores) >= self.threshold)
+            events.extend(AnomalyEvent(self.pairs[i], field, float(values[i]), float(means[i]), float(z_scores[i]))
+                          for i in np.flatnonzero(anomalous))
+            # Welford's update, only for the pairs with a value
+            counts[valid] += 1
+            differences = values[valid] - means[valid]
+            means[valid] += differences / counts[valid]
+            squares[valid] += differences * (values[valid] - means[valid])
+        events.sort(key=lambda event: (self.index[event.pair], self.fields.index(event.field)))
+        logger.debug('Anomaly detector updated with %d pairs, %d anomalies', len(self.pairs), len(events))
+        self.last_events = events
+        return events
+
+    def get_stats(self, pair_id, field):
+        '''
+        Get the statistics of a field of a pair
+        :param pair_id: str with the pair in the form XXX-YYY
+        :param field: str, one of fields
+        :return: tuple (number of samples, mean, standard deviation), mean and deviation are nan without samples
+        '''
+        i = self.index[pair_id]
+        count = int(self._counts[field][i])
+        mean = float(self._means[field][i]) if count else np.nan
+        std = float(np.sqrt(self._squares[field][i] / (count - 1))) if count > 1 else np.nan
+        return count, mean, std
@@ -7,69 +7,350 @@ Date: 04/12/18
 '''
 
 
+from collections import namedtuple, OrderedDict
+from datetime import datetime
+import decoders
+from email.utils import mktime_tz, parsedate_tz
+import hashlib
 import logging
+import market_delta
+import market_snapshot
+from multiprocessing.pool import ThreadPool
+import numpy as np
+import order_book
 import pair
 import requests
+from requests.adapters import HTTPAdapter
+import resilience
+import screener
+import view_cache
+from time import time
+import warnings
 
 
 COBINHOOD = "cobinhood"
 SIMULATOR = "simulator"
 API_URLS = {COBINHOOD: "https://api.cobinhood.com/v1",
             SIMULATOR: "http://localhost:9071"}
+DEFAULT_POOL_SIZE = 10
+DEFAULT_TIMEOUT = (3.05, 10)  # (connect, read) seconds, see requests docs about timeouts
+DEFAULT_MAX_IN_FLIGHT = 4
+DEFAULT_PAIRS_TTL = 3600  # seconds, trading pairs are not listed or delisted very often
+VOLUME_CURRENCIES = ('USD', 'BTC', 'ETH')
+BASIC_PAIRS = ('BTC-USDT', 'ETH-USDT', 'ETH-BTC')
+STATS_PATH = '/market/stats'
+TRADING_PAIRS_PATH = '/market/trading_pairs'
+ORDER_BOOK_PATH = '/market/orderbooks/{}?limit={}'
+DEFAULT_ORDER_BOOK_LIMIT = 50  # levels of each side
+RETRYABLE_STATUS_CODES = frozenset([429, 500, 502, 503, 504])
 
 
 logger = logging.getLogger('rodbot')
 
 
+CachedResponse = namedtuple('CachedResponse', ['etag', 'last_modified', 'body_hash', 'data'])
+
+
 class ApiExchangeError(Exception):
     '''
     Error class to report errors in Asset
     '''
 
 
+class TransientHttpError(requests.HTTPError):
+    '''
+    Error raised for the responses whose status code means that the request can be retried, like 503 Service
+    Unavailable or 429 Too Many Requests
+    '''
+
+    def __init__(self, response):
+        super(TransientHttpError, self).__init__('Status code {}'.format(response.status_code), response=response)
+        self.retry_after = parse_retry_after(response.headers.get('Retry-After'))
+
+
+TRANSIENT_ERRORS = (requests.ConnectionError, requests.Timeout, TransientHttpError)
+
+
 class ApiExchange(object):
     '''
     Class to model the api interface of the exchange to operate with
     '''
 
-    def __init__(self, exchange):
+    def __init__(self, exchange, pool_size=DEFAULT_POOL_SIZE, timeout=DEFAULT_TIMEOUT,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, pairs_ttl=DEFAULT_PAIRS_TTL, delta_thresholds=None,
+                 retry_policy=None, circuit_breaker=None, decoder=None, view_cache_size=view_cache.DEFAULT_MAX_SIZE):
         '''
         Constructor
+        :param exchange: str with the name of the exchange, one of API_URLS
+        :param pool_size: int, max number of connections kept alive in the pool of the http session
+        :param timeout: float or tuple (connect, read) with the timeout in seconds of every request
+        :param max_in_flight: int, max number of requests performed at the same time, i.e. the order books of several
+                              pairs. It should not be greater than pool_size, otherwise some connections are not kept
+                              alive
+        :param pairs_ttl: float, seconds that the trading pairs of the exchange are cached
+        :param delta_thresholds: dict field-float with the minimum change of each field of the stats since it was last
+                                 included in a delta to be included in the delta of the updates. Optional, by default
+                                 any change is included
+        :param retry_policy: RetryPolicy of the requests. Optional, by default connection errors and timeouts are
+                             retried with the default policy
+        :param circuit_breaker: CircuitBreaker of the requests. Optional, a default one for the exchange by default
+        :param decoder: JsonDecoder of the responses. Optional, with the fastest json backend installed by default
+        :param view_cache_size: int, max number of views derived from the snapshot (volumes, sorted pairs...) that are
+                                cached until the next update
         '''
         self.exchange = exchange
-        self.last_pair_stats = self.get_pairs_stats()
-        self.btc_usd = pair.Pair(pair_name='BTC-USDT', exchange=exchange)
-        self.eth_usd = pair.Pair(pair_name='ETH-USDT', exchange=exchange)
-        self.eth_btc = pair.Pair(pair_name='ETH-BTC', exchange=exchange)
-        self.update_basic_pairs()
+        self.timeout = timeout
+        self.session = new_session(pool_size)
+        self.retry_policy = retry_policy or resilience.RetryPolicy(retry_on=TRANSIENT_ERRORS)
+        self.circuit_breaker = circuit_breaker or resilience.CircuitBreaker(exchange)
+        # Order books have their own breaker, failing books don't stop the requests of the stats
+        self.order_book_breaker = resilience.CircuitBreaker('{} order books'.format(exchange))
+        self.decoder = decoder or decoders.JsonDecoder()
+        self.max_in_flight = max_in_flight
+        self._request_pool = None
+        self._cached_responses = {}  # path-CachedResponse of the last json received
+        self.transfer_stats = {'requests': 0, 'not_modified': 0, 'unchanged': 0, 'bytes': 0}
+        self.pairs_ttl = pairs_ttl
+        self._pairs_index = None
+        self._pairs_index_expiry = 0
+        self.last_pair_stats = None
+        self.snapshot = None
+        self.views = view_cache.ViewCache(view_cache_size)
+        self.delta_thresholds = delta_thresholds
+        self._delta_tracker = market_delta.DeltaTracker(delta_thresholds)
+        self.last_delta = None
+        self.last_update_time = None
+        self.stale = False
+        self.set_pair_stats(self.get_pairs_stats())
+        self.pair_registry = pair.PairRegistry(exchange)
+        self.tracked_pairs = OrderedDict()  # pair-Pair
+        self._track_counts = {}  # pair-int, number of calls to track not released by untrack
+        self._subscriptions = []  # List of tuples (set of pairs, callback)
+        self._stats_listeners = []
+        self.btc_usd, self.eth_usd, self.eth_btc = self.track(BASIC_PAIRS)
+
+    def track(self, pairs, callback=None):
+        '''
+        Track pairs of the exchange. Tracked pairs are kept updated with the stats of every update, all of them at once
+        from the market snapshot, without any request for them. Each call has to be released with a call to untrack,
+        pairs are tracked while any call hasn't been released.
+        :param pairs: list of str with the pairs in the form XXX-YYY
+        :param callback: callable(pair, changes) called on every update in which one of the pairs changes, pair is the
+                         Pair and changes a dict field-tuple (old value, new value), old value is None for pairs new in
+                         the exchange and new value is None for pairs removed from the exchange. Optional
+        :return: list of Pair, one for each pair
+        '''
+        pairs = list(pairs)
+        for pair_id in pairs:
+            if pair_id not in self.tracked_pairs:
+                self.tracked_pairs[pair_id] = pair.Pair(pair_name=pair_id, exchange=self.exchange,
+                                                        registry=self.pair_registry)
+            self._track_counts[pair_id] = self._track_counts.get(pair_id, 0) + 1
+        if callback is not None:
+            self._subscriptions.append((frozenset(pairs), callback))
+        self.update_tracked_pairs()
+        return [self.tracked_pairs[pair_id] for pair_id in pairs]
+
+    def untrack(self, pairs, callback=None):
+        '''
+        Release a call to track for some pairs. Pairs stop being tracked when all the calls to track them have been
+        released, but the basic pairs are always tracked. Releasing more calls than the calls done has no effect. The
+        Pair objects of the pairs that stop being tracked must not be used anymore.
+        :param pairs: list of str with the pairs in the form XXX-YYY
+        :param callback: callable passed to track. Optional, if provided it's not called for the pairs anymore
+        '''
+        pairs = frozenset(pairs)
+        for pair_id in pairs.intersection(self.tracked_pairs):
+            self._track_counts[pair_id] = max(self._track_counts[pair_id] - 1, 0)
+            if not self._track_counts[pair_id] and pair_id not in BASIC_PAIRS:
+                del self.tracked_pairs[pair_id]
+                del self._track_counts[pair_id]
+                self.pair_registry.remove(pair_id)
+        if callback is None:
+            return
+        subscriptions = []
+        for subscribed_pairs, subscribed_callback in self._subscriptions:
+            if subscribed_callback == callback:
+                subscribed_pairs = subscribed_pairs - pairs
+            if subscribed_pairs:
+                subscriptions.append((subscribed_pairs, subscribed_callback))
+        self._subscriptions = subscriptions
+
+    def update_tracked_pairs(self):
+        '''
+        Update the values of the tracked pairs. Instead of performing a request for each pair take the values of the
+        last market snapshot, all the pairs of the registry of the exchange are updated at once.
+        '''
+        logger.debug('Updating tracked pairs from exchange %s', self.exchange)
+        for pair_id in self.pair_registry.update_from_snapshot(self.snapshot):
+            logger.warning('Pair %s not found in stats of exchange "%s"', pair_id, self.exchange)
 
     def update_basic_pairs(self):
         '''
-        Update values of paris BTC-USD, ETH-USD, ETH-BTC. Instead of performing 3 requests take the values of the last
-        pair stats.
+        Deprecated, basic pairs are tracked pairs, use update_tracked_pairs
+        '''
+        warnings.warn('update_basic_pairs is deprecated, use update_tracked_pairs', DeprecationWarning, stacklevel=2)
+        self.update_tracked_pairs()
+
+    def notify_tracked_pairs(self, delta):
+        '''
+        Update the tracked pairs changed or removed in an update and call the callbacks subscribed to them. The values
+        of the pairs removed from the exchange are cleared. Errors of the callbacks are logged but they don't stop the
+        update.
+        :param delta: MarketDelta of the update
+        '''
+        changed_pairs = delta.changed_pairs.intersection(self.tracked_pairs)
+        removed = {pair_id: {field: (value, None) for field, value in self.pair_registry.clear(pair_id).iteritems()}
+                   for pair_id in self.tracked_pairs if pair_id in delta.removed}
+        if not changed_pairs and not removed:
+            return
+        self.update_tracked_pairs()
+        for subscribed_pairs, callback in list(self._subscriptions):
+            for pair_id in sorted(changed_pairs.union(removed).intersection(subscribed_pairs)):
+                if pair_id in removed:
+                    changes = removed[pair_id]
+                else:
+                    changes = delta.changed.get(pair_id) or \
+                        {field: (None, value) for field, value in self.snapshot.get_pair_values(pair_id).iteritems()}
+                try:
+                    callback(self.tracked_pairs[pair_id], changes)
+                except Exception:
+                    logger.error('UNKNOWN ERROR in callback of pair %s of exchange "%s"', pair_id, self.exchange,
+                                 exc_info=True)
+
+    def add_stats_listener(self, listener):
+        '''
+        Add a listener of the stats of the exchange, it's called on every update with fresh stats, even if they haven't
+        changed, but not if the stats couldn't be requested
+        :param listener: callable(snapshot, delta) with the MarketSnapshot and the MarketDelta of the update
+        '''
+        self._stats_listeners.append(listener)
+
+    def remove_stats_listener(self, listener):
+        self._stats_listeners = [added for added in self._stats_listeners if added != listener]
+
+    def notify_stats_listeners(self, delta):
+        '''
+        Call the stats listeners with the snapshot and delta of an update. Errors of the listeners are logged but they
+        don't stop the update.
+        :param delta: MarketDelta of the update
+        '''
+        for listener in list(self._stats_listeners):
+            try:
+                listener(self.snapshot, delta)
+            except Exception:
+                logger.error('UNKNOWN ERROR in stats listener of exchange "%s"', self.exchange, exc_info=True)
+
+    def request(self, path, headers=None, circuit_breaker=None):
+        '''
+        Perform a GET request to the api of the exchange. All the requests share the same http session, so the
+        connections are kept alive and reused between polls instead of doing a new TCP/TLS handshake every time.
+        Transient errors are retried with the retry policy, and requests are not done while the circuit breaker of the
+        exchange is open.
+        :param path: str with the path of the endpoint, i.e. '/market/stats'
+        :param headers: dict with the headers of the request, besides the headers of the session. Optional
+        :param circuit_breaker: CircuitBreaker of the request. Optional, the circuit breaker of the exchange by default
+        :return: requests.Response
         '''
-        logger.debug('Updating basic pairs from exchange %s', self.exchange)
-        self.btc_usd.update_values(self.last_pair_stats)
-        self.eth_usd.update_values(self.last_pair_stats)
-        self.eth_btc.update_values(self.last_pair_stats)
+        url = '{}{}'.format(API_URLS[self.exchange], path)
+        circuit_breaker = circuit_breaker or self.circuit_breaker
+        try:
+            return circuit_breaker.call(self.retry_policy.call, self._get, url, headers)
+        except resilience.CircuitOpenError:
+            logger.warning('Circuit breaker of %s open, not requesting url: %s', circuit_breaker.name, url)
+            raise ApiExchangeError('Circuit breaker of {} is open'.format(circuit_breaker.name))
+        except TRANSIENT_ERRORS:
+            logger.error('Error requesting url: %s', url, exc_info=True)
+            raise ApiExchangeError
+        except requests.HTTPError as error:
+            logger.error('Error requesting url: %s, %s', url, error)
+            raise ApiExchangeError
+        except Exception:
+            logger.error('UNKNOWN ERROR requesting url: %s', url, exc_info=True)
+            raise ApiExchangeError
+
+    def _get(self, url, headers=None):
+        '''
+        Perform a GET request with the http session
+        :param url: str with the url
+        :param headers: dict with the headers of the request. Optional
+        :return: requests.Response
+        :raise: TransientHttpError if the status code of the response is one of RETRYABLE_STATUS_CODES, HTTPError for
+                the rest of error status codes, like 403 Forbidden or 404 Not Found, they are not retried but they are
+                failures for the circuit breaker
+        '''
+        response = self.session.get(url, timeout=self.timeout, headers=headers)
+        if response.status_code in RETRYABLE_STATUS_CODES:
+            raise TransientHttpError(response)
+        if response.status_code >= 400:
+            raise requests.HTTPError('Status code {}'.format(response.status_code), response=response)
+        return response
+
+    def get_request_pool(self):
+        '''
+        :return: ThreadPool of max_in_flight threads used to perform requests concurrently
+        '''
+        if self._request_pool is None:
+            self._request_pool = ThreadPool(processes=self.max_in_flight)
+        return self._request_pool
+
+    def request_json(self, path):
+        '''
+        Perform a conditional GET request to the api of the exchange and get the json of the response. The ETag and
+        Last-Modified of the last response of the path are sent back, so the exchange can answer 304 Not Modified
+        without body if it supports them. Otherwise, if the body is the same as the last one, it's not parsed again.
+        :param path: str with the path of the endpoint
+        :return: tuple (json of the response, boolean True if it has changed since the last request)
+        '''
+        cached = self._cached_responses.get(path)
+        headers = {}
+        if cached is not None:
+            if cached.etag:
+                headers['If-None-Match'] = cached.etag
+            if cached.last_modified:
+                headers['If-Modified-Since'] = cached.last_modified
+        response = self.request(path, headers=headers)
+        self.transfer_stats['requests'] += 1
+        if response.status_code == 304 and cached is not None:
+            self.transfer_stats['not_modified'] += 1
+            logger.debug('Response of %s not modified in exchange "%s"', path, self.exchange)
+            return cached.data, False
+        content = response.content
+        self.transfer_stats['bytes'] += int(response.headers.get('Content-Length', len(content)))
+        body_hash = hashlib.sha1(content).digest()
+        if cached is not None and body_hash == cached.body_hash:
+            self.transfer_stats['unchanged'] += 1
+            logger.debug('Response of %s unchanged in exchange "%s"', path, self.exchange)
+            return cached.data, False
+        data = self.decoder.loads(content)
+        self._cached_responses[path] = CachedResponse(response.headers.get('ETag'),
+                                                      response.headers.get('Last-Modified'), body_hash, data)
+        return data, True
+
+    def close(self):
+        '''
+        Close the http session and the connections of its pool, and stop the threads used for concurrent requests
+        '''
+        if self._request_pool is not None:
+            self._request_pool.close()
+            self._request_pool.join()
+            self._request_pool = None
+        self.session.close()
 
     def get_all_pairs(self):
         '''
         Get all tradeables pairs of the exchange
         :return list_pairs: list of string with string of the pairs
+        :raise: ApiExchangeError if the pairs can't be requested or they are not valid
         '''
-        api_url = API_URLS[self.exchange]
         logger.debug('Requesting all trading pairs')
         if self.exchange == COBINHOOD or self.exchange == SIMULATOR:
-            url = '{}/market/trading_pairs'.format(api_url)
+            response = self.request(TRADING_PAIRS_PATH)
             try:
-                r = requests.get(url)
-            except requests.ConnectionError:
-                logger.error('Error requesting url: %s', url, exc_info=True)
+                list_pairs = parse_trading_pairs(response)
+            except (ValueError, KeyError, TypeError):
+                logger.error('Invalid trading pairs received from exchange "%s"', self.exchange, exc_info=True)
                 raise ApiExchangeError
-            except Exception:
-                logger.error('UNKNOWN ERROR requesting url: %s', url, exc_info=True)
-            list_pairs = [pair['id'] for pair in r.json()['result']['trading_pairs']]
         else:
             list_pairs = []
         logger.debug('Available pairs in exchange "%s": %s', self.exchange, list_pairs)
@@ -78,35 +359,122 @@ class ApiExchange(object):
     def get_pairs_stats(self, pair='all'):
         '''
         Get stats of the pairs. This stats should include: volume, high24h, low24h, last price, highest bid,
-        lowest ask and percentage change 24h.
+        lowest ask and percentage change 24h. If the stats haven't changed since the last request, the same dict is
+        returned again, so the stats of several pairs are got decoding the stats of all the pairs only once.
         :param pair: str. Pair of the stats. Optional, if not provided all stats are returned
         :return: pair_stats: dict with the stats of the pair or of all the pairs
         '''
         logger.debug('Requesting trading stats')
-        api_url = API_URLS[self.exchange]
         if self.exchange == COBINHOOD or self.exchange == SIMULATOR:
-            url = '{}/market/stats'.format(api_url)
             try:
-                r = requests.get(url)
-            except requests.ConnectionError:
-                logger.error('Error requesting url: %s', url, exc_info=True)
+                pair_stats = self.request_json(STATS_PATH)[0]['result']
+            except (ValueError, KeyError):
+                logger.error('Invalid stats received from exchange "%s"', self.exchange, exc_info=True)
                 raise ApiExchangeError
-            except Exception:
-                logger.error('UNKNOWN ERROR requesting url: %s', url, exc_info=True)
-            if pair == 'all':
-                pair_stats = r.json()['result']
-            else:
-                pair_stats = r.json()['result'][pair]
+            if pair != 'all':
+                pair_stats = pair_stats[pair]  # KeyError if the pair is not in the stats
         else:
             pair_stats = {}
         logger.debug('Pair stats in exchange "%s": %s', self.exchange, pair_stats)
         return pair_stats
 
+    def get_order_book(self, pair_id, limit=DEFAULT_ORDER_BOOK_LIMIT):
+        '''
+        Get the order book of a pair. The REST api only gives whole books, not the changes since the last one, so the
+        book is built from scratch every time. Requests of books go through order_book_breaker, not the circuit
+        breaker of the stats.
+        :param pair_id: str with the pair in the form XXX-YYY
+        :param limit: int, max number of levels of each side of the book
+        :return: OrderBook
+        :raise: ApiExchangeError if the book can't be requested or it's not valid
+        '''
+        if self.exchange != COBINHOOD and self.exchange != SIMULATOR:
+            return order_book.OrderBook(pair_id)
+        response = self.request(ORDER_BOOK_PATH.format(pair_id, limit), circuit_breaker=self.order_book_breaker)
+        try:
+            return order_book.OrderBook.from_json(pair_id, self.decoder.loads(response.content)['result']['orderbook'])
+        except (ValueError, KeyError, TypeError):
+            logger.error('Invalid order book of pair %s received from exchange "%s"', pair_id, self.exchange,
+                         exc_info=True)
+            raise ApiExchangeError
+
+    def get_order_books(self, pairs, limit=DEFAULT_ORDER_BOOK_LIMIT):
+        '''
+        Get the order books of several pairs. The exchange doesn't have an endpoint for several books, so they are
+        requested concurrently. The books that can't be got are left out, the rest are returned anyway.
+        :param pairs: list of str with the pairs in the form XXX-YYY
+        :param limit: int, max number of levels of each side of the books
+        :return: dict pair-OrderBook
+        '''
+        logger.debug('Requesting order books of %s', pairs)
+
+        def get_pair_order_book(pair_id):
+            try:
+                return self.get_order_book(pair_id, limit)
+            except ApiExchangeError:
+                logger.warning('Order book of pair %s not available in exchange "%s"', pair_id, self.exchange)
+                return None
+
+        books = self.get_request_pool().map(get_pair_order_book, list(pairs))
+        return {book.pair: book for book in books if book is not None}
+
     def update_stats(self):
         '''
-        Method to update stats of the pairs of the exchange
+        Method to update stats of the pairs of the exchange. Tracked pairs are only updated if they have changed,
+        stats listeners are called on every update.
+        If the stats haven't changed since the last update the snapshot is not built again and the delta is empty.
+        If the stats can't be requested, the last snapshot is kept and flagged as stale, and the delta is empty too.
+        :return: MarketDelta with the changes since the previous update
+        '''
+        try:
+            pair_stats = self.get_pairs_stats()
+        except ApiExchangeError:
+            if not self.stale:
+                logger.warning('Keeping stats of exchange "%s" from %s', self.exchange,
+                               datetime.fromtimestamp(self.last_update_time).isoformat())
+            self.stale = True
+            self.last_delta = market_delta.MarketDelta(sequence=self.last_delta.sequence + 1)
+            return self.last_delta
+        return self.update_pair_stats(pair_stats)
+
+    def get_full_delta(self):
+        '''
+        Get a delta with all the pairs of the exchange and the values the next deltas are based on, i.e. to start a
+        stream of deltas
+        :return: MarketDelta
+        '''
+        return self._delta_tracker.get_full_delta(self.last_delta.sequence)
+
+    def update_pair_stats(self, pair_stats):
+        '''
+        Update the snapshot with the stats requested in an update, and notify the tracked pairs and the stats listeners
+        :param pair_stats: dict with the stats of all the pairs, as returned by get_pairs_stats
+        :return: MarketDelta with the changes since the previous update, empty if the stats are the same dict
+        '''
+        if pair_stats is self.last_pair_stats:
+            self.last_update_time = time()
+            self.stale = False
+            self.last_delta = market_delta.MarketDelta(sequence=self.last_delta.sequence + 1)
+            self.notify_stats_listeners(self.last_delta)
+            return self.last_delta
+        self.set_pair_stats(pair_stats)
+        self.notify_tracked_pairs(self.last_delta)
+        self.notify_stats_listeners(self.last_delta)
+        return self.last_delta
+
+    def set_pair_stats(self, pair_stats):
+        '''
+        Store the stats of all the pairs of the exchange and build the market snapshot from them, so numeric values are
+        parsed only once for each update. The delta with the previous snapshot is stored in last_delta.
+        :param pair_stats: dict with the stats of all the pairs, as returned by get_pairs_stats
         '''
-        self.last_pair_stats = self.get_pairs_stats()
+        self.last_update_time = time()
+        self.stale = False
+        self.last_pair_stats = pair_stats
+        self.snapshot = market_snapshot.MarketSnapshot.from_stats(pair_stats)
+        self.views.bump()
+        sequence = self.last_delta.sequence + 1 if self.last_delta is not None else 0
+        self.last_delta = self._delta_tracker.update(self.snapshot, sequence)
 
     def get_pairs_by_volume(self, currency=''):
         '''
@@ -115,17 +483,57 @@ class ApiExchange(object):
         be to take the mid range price between asks and bids
         :param currency: str with the short code of the currency we want the volume. If not provided, take default,
                          which is the pair itself.
-        :return: dict pair-volume
+        :return: dict pair-volume. It's shared by all the callers until the next update, so it must not be modified
         '''
+        def compute():
+            if not currency:
+                pairs_volume = self.snapshot.to_dict(self.snapshot.columns['base_volume'])
+            else:
+                pairs_volume = self.snapshot.to_dict(self.get_volumes([currency])[0])
+            logger.debug('Pairs by volume "%s" in exchange "%s": %s', currency, self.exchange, pairs_volume)
+            return pairs_volume
+
         logger.debug('Getting pairs by volume')
-        if not currency:
-            pairs_volume = {k: float(v['base_volume']) for k, v in self.last_pair_stats.iteritems()}
-        else:
-            currency_multipliers = get_currency_multiplier(self.last_pair_stats, currency)
-            pairs_volume = {k: float(v['base_volume']) * float(v["last_price"]) * currency_multipliers[k]
-                            for k, v in self.last_pair_stats.iteritems()}
-        logger.debug('Pairs by volume "%s" in exchange "%s": %s', currency, self.exchange, pairs_volume)
-        return pairs_volume
+        return self.views.get(('pairs_by_volume', currency), compute)
+
+    def get_volumes(self, currencies=VOLUME_CURRENCIES):
+        '''
+        Get the volume of all the pairs in several currencies at once. The volume in the quote currency of every pair
+        is computed once and then converted to each currency with the rate of its quote currency, in one numpy
+        expression for all the pairs. Volumes are cached until the next stats update, so they are only computed once
+        for each snapshot.
+        :param currencies: list of str with the short code of the currencies
+        :return: numpy array with one row for each currency and one column for each pair of the snapshot
+        '''
+        new_currencies = [currency for currency in currencies if ('volumes', currency) not in self.views]
+        if new_currencies:
+            for currency, volumes in zip(new_currencies, self.compute_volumes(new_currencies)):
+                self.views.put(('volumes', currency), volumes)
+        return np.array([self.views.get(('volumes', currency), lambda: self.compute_volumes([currency])[0])
+                         for currency in currencies], dtype=np.float64).reshape(len(currencies), len(self.snapshot))
+
+    def compute_volumes(self, currencies):
+        '''
+        Compute the volume of all the pairs in several currencies, see get_volumes
+        :param currencies: list of str with the short code of the currencies
+        :return: read-only numpy array with one row for each currency and one column for each pair of the snapshot
+        '''
+        columns = self.snapshot.columns
+        quote_rates = np.array([get_quote_rates(self.snapshot, currency) for currency in currencies],
+                               dtype=np.float64).reshape(len(currencies), len(self.snapshot.quote_currencies))
+        volumes = columns['base_volume'] * columns['last_price'] * quote_rates[:, self.snapshot.quote_index]
+        volumes.flags.writeable = False  # Shared by all the callers until next update
+        return volumes
+
+    def get_pairs_by_volumes(self, currencies=VOLUME_CURRENCIES):
+        '''
+        Method for obtaining the volume of the pairs of the exchange in several currencies with only one calculation
+        :param currencies: list of str with the short code of the currencies, USD, BTC and ETH by default
+        :return: dict currency-dict pair-volume
+        '''
+        logger.debug('Getting pairs by volume in %s', currencies)
+        return {currency: self.snapshot.to_dict(volumes)
+                for currency, volumes in zip(currencies, self.get_volumes(currencies))}
 
     def get_pairs_volume_sorted(self, currency='USD', reverse=True):
         '''
@@ -134,12 +542,109 @@ class ApiExchange(object):
                          In USD by default, other options can be BTC or ETH.
         :param reverse: boolean, for the reverse order of the list in ascending or descendin order. Descending (reverse)
                         by default
-        :return: list of tuples (pair, volume) in order
+        :return: list of tuples (pair, volume) in order, without the pairs whose volume can't be converted to the
+                 currency. It's shared by all the callers until the next update, so it must not be modified
         '''
+        def compute():
+            list_pairs_volume = [(k, v) for k, v in self.get_pairs_by_volume(currency=currency).iteritems()
+                                 if not np.isnan(v)]
+            logger.debug('List of pairs volume sorted: %s', list_pairs_volume)
+            return sorted(list_pairs_volume, key=lambda x: x[1], reverse=reverse)
+
         logger.debug('Getting list of pairs volume "%s" in exchange "%s" sorted: ', currency, self.exchange)
-        list_pairs_volume = [(k, v) for k, v in self.get_pairs_by_volume(currency=currency).iteritems()]
-        logger.debug('List of pairs volume sorted: %s', list_pairs_volume)
-        return sorted(list_pairs_volume, key=lambda x: x[1], reverse=reverse)
+        return self.views.get(('pairs_volume_sorted', currency, reverse), compute)
+
+    def get_top_pairs(self, k, currency='USD', bottom=False):
+        '''
+        Get the k pairs with more volume, or with less volume. Only the k pairs are sorted, they are selected from the
+        rest with a partial selection, so it's cheaper than sorting all the pairs.
+        :param k: int, number of pairs
+        :param currency: str, currency of the volume. In USD by default
+        :param bottom: boolean, True for getting the pairs with less volume, in ascending order
+        :return: list of tuples (pair, volume), in descending order of volume (ascending if bottom). It's shared by all
+                 the callers until the next update, so it must not be modified
+        '''
+        def compute():
+            volumes = self.get_volumes([currency])[0]
+            top_k = min(k, len(volumes))
+            if top_k <= 0:
+                return []
+            keys = volumes if bottom else -volumes
+            selected = np.argpartition(keys, top_k - 1)[:top_k]
+            selected = selected[np.argsort(keys[selected], kind='mergesort')]
+            return [(self.snapshot.pairs[i], float(volumes[i])) for i in selected]
+
+        return self.views.get(('top_pairs', k, currency, bottom), compute)
+
+    def get_currency_multiplier(self, to_currency):
+        '''
+        Get the multiplier of the volume of each pair to get it in a currency, see get_currency_multiplier function
+        :param to_currency: str. Currency in which we want the output
+        :return: dict pair-float multiplier. It's shared by all the callers until the next update, so it must not be
+                 modified
+        '''
+        return self.views.get(('currency_multiplier', to_currency),
+                              lambda: get_currency_multiplier(self.snapshot, to_currency))
+
+    def screen(self, filters='', sort_by=None, limit=None):
+        '''
+        Screen the pairs of the exchange, i.e. screen('spread < 0.5% and volume_usd > 10k', sort_by='-range_24h').
+        The filters are evaluated over whole columns of the snapshot, and both the derived columns and the result of
+        each screen are cached until the next update, so running the same screens on every update is cheap.
+        :param filters: str with the filters or Screen, see Screen. A Screen is parsed only once, so it's better for
+                        screens run many times
+        :param sort_by: str, column to sort the pairs, with prefix - for descending order. Ignored if filters is a
+                        Screen. Optional
+        :param limit: int, max number of pairs. Ignored if filters is a Screen. Optional
+        :return: list of str with the pairs selected. It's shared by all the callers until the next update, so it must
+                 not be modified
+        :raise: ScreenerError if any filter or column is not valid
+        '''
+        screen = filters if isinstance(filters, screener.Screen) else screener.Screen(filters, sort_by, limit)
+        return self.views.get(('screen', screen.key), lambda: screen.run(self.get_column, self.snapshot.pairs))
+
+    def get_column(self, name):
+        '''
+        Get a column of the snapshot: a field of the stats, one of screener.DERIVED_COLUMNS or volume_<currency>, i.e.
+        volume_usd. Derived columns are cached until the next update.
+        :param name: str, name of the column
+        :return: numpy array with a value for each pair of the snapshot. It's shared by all the callers until the next
+                 update, so it must not be modified
+        :raise: ScreenerError if the column is not known
+        '''
+        if name in self.snapshot.columns:
+            return self.snapshot.columns[name]
+        if name.startswith(screener.VOLUME_COLUMN_PREFIX):
+            try:
+                return self.get_volumes([name[len(screener.VOLUME_COLUMN_PREFIX):].upper()])[0]
+            except AttributeError:
+                raise screener.ScreenerError('Unknown screen column "{}"'.format(name))
+        return self.views.get(('column', name), lambda: screener.compute_column(self.snapshot.columns, name))
+
+    def get_pairs_index(self):
+        '''
+        Get the set of trading pairs of the exchange. The set is cached for pairs_ttl seconds, so the trading pairs are
+        only requested when the cache has expired or it has been invalidated.
+        :return: frozenset of str with the pairs
+        '''
+        if self._pairs_index is None or time() >= self._pairs_index_expiry:
+            logger.debug('Pairs index of exchange "%s" expired, refreshing it', self.exchange)
+            self.set_pairs_index(self.get_all_pairs())
+        return self._pairs_index
+
+    def set_pairs_index(self, list_pairs):
+        '''
+        Store the trading pairs of the exchange in the cache of pairs for pairs_ttl seconds
+        :param list_pairs: list of str with the pairs
+        '''
+        self._pairs_index = frozenset(list_pairs)
+        self._pairs_index_expiry = time() + self.pairs_ttl
+
+    def invalidate_pairs_index(self):
+        '''
+        Invalidate the cache of trading pairs, so they are requested again the next time they are needed
+        '''
+        self._pairs_index = None
 
     def is_pair_in_exchange(self, pair_id):
         '''
@@ -150,60 +655,113 @@ class ApiExchange(object):
         if not pair.check_pair_is_valid(pair_id):
             return False
         else:
-            return pair_id in self.get_all_pairs()
+            return pair_id in self.get_pairs_index()
+
+    def are_pairs_in_exchange(self, pair_ids):
+        '''
+        Check if several pairs are in the exchange, with only one access to the cache of pairs
+        :param pair_ids: list of str of the pairs in the form 'XXX-YYY'
+        :return: dict pair-boolean
+        '''
+        pairs_index = self.get_pairs_index()
+        return {pair_id: pair.check_pair_is_valid(pair_id) and pair_id in pairs_index for pair_id in pair_ids}
 
     def get_pairs_without_volume(self):
         '''
         Get a list of pairs whose volume is 0
-        :return: list of pairs
+        :return: list of pairs. It's shared by all the callers until the next update, so it must not be modified
         '''
-        return [k for k, v in self.get_pairs_by_volume().iteritems() if v == 0]
+        return self.views.get(('pairs_without_volume',), lambda: [
+            self.snapshot.pairs[i] for i in np.flatnonzero(self.snapshot.columns['base_volume'] == 0)])
+
+
+def new_session(pool_size=DEFAULT_POOL_SIZE):
+    '''
+    Create the http session used to request the exchange, with a pool of keep-alive connections and compressed
+    responses
+    :param pool_size: int, max number of connections to keep in the pool
+    :return: requests.Session
+    '''
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    session.headers.update({'Connection': 'keep-alive', 'Accept-Encoding': 'gzip, deflate'})
+    return session
+
+
+def parse_trading_pairs(response):
+    '''
+    Get the list of pairs from the response of the trading pairs endpoint
+    :param response: requests.Response of TRADING_PAIRS_PATH
+    :return: list of str with the pairs
+    '''
+    return [trading_pair['id'] for trading_pair in response.json()['result']['trading_pairs']]
+
+
+def parse_retry_after(value):
+    '''
+    Function to parse the Retry-After header of a response
+    :param value: str with the seconds to wait or the http date to retry at, or None
+    :return: float, seconds to wait before retrying, None if there is no header or it's not valid
+    '''
+    if not value:
+        return None
+    try:
+        return max(float(value), 0.)
+    except ValueError:
+        retry_date = parsedate_tz(value)
+        return max(mktime_tz(retry_date) - time(), 0.) if retry_date is not None else None
 
 
 def get_currency_multiplier(pairs_stats, to_currency):
     '''
     Function to know how to multiply pair volume in order to get the volume in a desired currency
-    :param pairs_stats: dict with the stats of the pairs
+    :param pairs_stats: MarketSnapshot or dict with the stats of the pairs
     :param to_currency: str. Currency in which we want the output
     :return: dict with each pair and the float multiplier factor
     '''
     logger.debug('Getting currency multiplier to calculate volume')
-    to_currency = 'USDT' if to_currency == 'USD' else to_currency
-    pairs_multiplier_factor = dict()
-    for pair in pairs_stats.keys():
-        base_currency_pair = pair.split('-')[1]
-        if base_currency_pair == to_currency:
-            pairs_multiplier_factor[pair] = 1
-        elif base_currency_pair == 'ETH':
-            if to_currency == 'BTC':
-                pairs_multiplier_factor[pair] = float(pairs_stats['ETH-BTC']['last_price'])
-            elif to_currency == 'USDT':
-                pairs_multiplier_factor[pair] = float(pairs_stats['ETH-USDT']['last_price'])
-            else:
-                logger.error("Exchange to currency %s not available", to_currency)
-                raise AttributeError("Exchange to currency %s not available" % to_currency)
-        elif base_currency_pair == 'BTC':
-            if to_currency == 'ETH':
-                pairs_multiplier_factor[pair] = 1 / float(pairs_stats['ETH-BTC']['last_price'])
-            elif to_currency == 'USDT':
-                pairs_multiplier_factor[pair] = float(pairs_stats['BTC-USDT']['last_price'])
-            else:
-                logger.error("Exchange to currency %s not available", to_currency)
-                raise AttributeError("Exchange to currency %s not available" % to_currency)
-        elif 'USD' in base_currency_pair:
-            if to_currency == 'ETH':
-                pairs_multiplier_factor[pair] = 1 / float(pairs_stats['ETH-USDT']['last_price'])
-            elif to_currency == 'BTC':
-                pairs_multiplier_factor[pair] = 1 / float(pairs_stats['BTC-USDT']['last_price'])
-            else:
-                logger.error("Exchange to currency %s not available", to_currency)
-                raise AttributeError("Exchange to currency %s not available" % to_currency)
-        else:
-            pair_trade = '{}-{}'.format(base_currency_pair, to_currency)
-            pairs_multiplier_factor[pair] = float(pairs_stats[pair_trade]['last_price'])
+    if not isinstance(pairs_stats, market_snapshot.MarketSnapshot):
+        pairs_stats = market_snapshot.MarketSnapshot.from_stats(pairs_stats)
+    pairs_multiplier_factor = pairs_stats.to_dict(get_quote_rates(pairs_stats, to_currency)[pairs_stats.quote_index])
     logger.debug('Currency multipliers: %s', pairs_multiplier_factor)
     return pairs_multiplier_factor
 
 
+def is_currency_available(snapshot, currency):
+    '''
+    Function to know if amounts of the market can be converted to a currency
+    :param snapshot: MarketSnapshot
+    :param currency: str with the short code of the currency, USD for USDT
+    :return: bool. True if the currency is in any pair with a last price or the market is empty, False otherwise
+    '''
+    currency = 'USDT' if currency == 'USD' else currency
+    return not snapshot.quote_currencies or currency in snapshot.get_conversion_graph()
+
+
+def get_quote_rates(snapshot, to_currency):
+    '''
+    Function to know how to multiply an amount of each quote currency of the market in order to get it in a desired
+    currency. The rates come from the conversion graph of the snapshot, so any currency listed in the exchange can be
+    used. There are only a few quote currencies, so this is much cheaper than getting the rate pair by pair.
+    :param snapshot: MarketSnapshot
+    :param to_currency: str. Currency in which we want the output
+    :return: numpy array with the rate of each currency of snapshot.quote_currencies, nan if there is no conversion
+    '''
+    to_currency = 'USDT' if to_currency == 'USD' else to_currency
+    if not is_currency_available(snapshot, to_currency):
+        logger.error("Exchange to currency %s not available", to_currency)
+        raise AttributeError("Exchange to currency %s not available" % to_currency)
+    conversion_rates = snapshot.get_conversion_rates(to_currency)
+    quote_rates = np.array([conversion_rates.get(quote_currency, np.nan)
+                            for quote_currency in snapshot.quote_currencies], dtype=np.float64)
+    if np.isnan(quote_rates).any():
+        logger.warning('No conversion to %s for quote currencies %s', to_currency,
+                       [c for c, r in zip(snapshot.quote_currencies, quote_rates) if np.isnan(r)])
+    logger.debug('Quote currency rates to %s: %s', to_currency, quote_rates)
+    return quote_rates
+
+
 if __name__ == "__main__":
     print ApiExchange(COBINHOOD).get_pairs_volume_sorted()
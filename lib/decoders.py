@@ -0,0 +1,53 @@
+'''
+This module includes the class JsonDecoder used by ApiExchange to decode the json of the responses of the exchanges.
+The backend is the fastest json library installed: ujson, simplejson or the json module of the standard library.
+Created: rggentil
+Date: 06/01/18
+'''
+
+
+from collections import OrderedDict
+import json
+import logging
+
+
+logger = logging.getLogger('rodbot')
+
+
+BACKENDS = OrderedDict()
+try:
+    import ujson
+    BACKENDS['ujson'] = ujson.loads
+except ImportError:
+    pass
+try:
+    import simplejson
+    BACKENDS['simplejson'] = simplejson.loads
+except ImportError:
+    pass
+BACKENDS['json'] = json.loads
+DEFAULT_BACKEND = next(iter(BACKENDS))
+
+
+class JsonDecoder(object):
+    '''
+    Decoder of json documents with a pluggable backend
+    '''
+
+    def __init__(self, backend=DEFAULT_BACKEND):
+        '''
+        Constructor
+        :param backend: str, one of BACKENDS. The fastest one installed by default
+        '''
+        if backend not in BACKENDS:
+            raise ValueError('Json backend "{}" not available, use one of {}'.format(backend, list(BACKENDS)))
+        self.backend = backend
+        self._loads = BACKENDS[backend]
+
+    def loads(self, content):
+        '''
+        Decode a json document
+        :param content: str with the json
+        :return: decoded json
+        '''
+        return self._loads(content)
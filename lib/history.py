@@ -0,0 +1,313 @@
+'''
+This module includes the class HistoryStore that keeps the history of the market snapshots of an exchange on disk.
+The history is append-only and split in chunks. Every chunk is a directory with the pairs of the chunk, a file with the
+time of each snapshot and a file per field with the float64 values of the pairs of the chunk:
+
+    <directory>/<exchange>/index             float64 time of the first snapshot of each chunk
+    <directory>/<exchange>/chunk_000000/
+        pairs.txt                            pairs of the chunk, one per line, the line is the position of the pair
+        time.f64                             float64 time of each snapshot (row)
+        base_volume.f64, last_price.f64...   float64 rows x pairs, while snapshots are appended to the chunk
+        base_volume.by_pair.f64...           float64 pairs x rows, once the chunk is finished
+
+Appending a snapshot only writes its row at the end of the files of the last chunk. When a chunk is finished, because
+it's full or the pairs have changed, its files are rewritten with one row per pair, so the history of a pair in the
+chunk is contiguous. The class HistoryReader reads the history memory-mapping the files, so the history of a pair in a
+time window is a view of the pages of the files, shared by all the processes reading them, without reading anything
+else. Only the last chunk, which is still growing, is read with a value per row.
+Created: rggentil
+Date: 05/22/18
+'''
+
+
+import logging
+import numpy as np
+import os
+from market_snapshot import FIELDS
+from snapshot_writer import write_atomic
+from time import time
+
+
+HISTORY_DIR = os.path.join('out', 'history')
+CHUNK_ROWS = 1024
+INDEX_FILE = 'index'
+PAIRS_FILE = 'pairs.txt'
+TIME_FILE = 'time.f64'
+FIELD_FILE = '{}.f64'
+FIELD_BY_PAIR_FILE = '{}.by_pair.f64'
+CHUNK_DIR = 'chunk_{:06d}'
+ITEM_SIZE = np.dtype(np.float64).itemsize
+
+
+logger = logging.getLogger('rodbot')
+
+
+class HistoryStore(object):
+    '''
+    Append-only store of the history of the market snapshots of an exchange
+    '''
+
+    def __init__(self, exchange, directory=HISTORY_DIR, chunk_rows=CHUNK_ROWS):
+        '''
+        Constructor. If there is history of the exchange in the directory, new snapshots are appended to it.
+        :param exchange: str with the exchange
+        :param directory: str, directory of the history of all the exchanges
+        :param chunk_rows: int, max number of snapshots in each chunk
+        '''
+        self.exchange = exchange
+        self.directory = directory
+        self.path = os.path.join(directory, exchange)
+        self.chunk_rows = chunk_rows
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self._chunk = None
+        self._chunk_pairs = ()
+        self._chunk_index = {}
+        self._chunk_files = {}
+        self._chunk_len = 0
+        chunk_times = self.get_chunk_times()
+        if len(chunk_times):
+            chunk = len(chunk_times) - 1
+            if is_chunk_finished(self.get_chunk_path(chunk)):
+                # The process died while finishing the chunk, the next snapshot starts a new one
+                finish_chunk(self.get_chunk_path(chunk))
+                self._chunk = chunk
+            else:
+                self._open_chunk(chunk)
+
+    def get_chunk_times(self):
+        '''
+        Get the time index of the chunks
+        :return: numpy array with the time of the first snapshot of each chunk
+        '''
+        return read_floats(os.path.join(self.path, INDEX_FILE))
+
+    def get_chunk_path(self, chunk):
+        return os.path.join(self.path, CHUNK_DIR.format(chunk))
+
+    def _open_chunk(self, chunk, pairs=None):
+        '''
+        Open the files of a chunk to append snapshots to it. The files are truncated to the rows with time, so the
+        partial rows written before a crash are discarded and new rows are aligned in all the files.
+        :param chunk: int, number of the chunk
+        :param pairs: list of str with the pairs of the chunk. Optional, only for new chunks
+        '''
+        self.close()
+        chunk_path = self.get_chunk_path(chunk)
+        if pairs is not None:
+            if not os.path.isdir(chunk_path):  # It may exist without index if the process died while starting it
+                os.makedirs(chunk_path)
+            with open(os.path.join(chunk_path, PAIRS_FILE), 'w') as f:
+                f.write('\n'.join(pairs).encode('utf-8'))
+        self._chunk = chunk
+        self._chunk_pairs = read_pairs(chunk_path)
+        self._chunk_index = {pair_id: i for i, pair_id in enumerate(self._chunk_pairs)}
+        self._chunk_files = {name: open(os.path.join(chunk_path, name), 'ab')
+                             for name in [FIELD_FILE.format(field) for field in FIELDS] + [TIME_FILE]}
+        self._chunk_len = os.path.getsize(os.path.join(chunk_path, TIME_FILE)) // ITEM_SIZE
+        for name, f in self._chunk_files.iteritems():
+            f.truncate(self._chunk_len * ITEM_SIZE * (1 if name == TIME_FILE else len(self._chunk_pairs)))
+
+    def append(self, snapshot, timestamp=None):
+        '''
+        Append a snapshot to the history. A new chunk is started when the last one is full or when the snapshot has
+        pairs that are not in the last chunk, and the last one is finished. Pairs of the chunk that are not in the
+        snapshot get nan values.
+        :param snapshot: MarketSnapshot
+        :param timestamp: float, time of the snapshot in seconds since epoch. Optional, now by default
+        '''
+        timestamp = time() if timestamp is None else timestamp
+        if not self._chunk_files or self._chunk_len >= self.chunk_rows or \
+                any(pair_id not in self._chunk_index for pair_id in snapshot.pairs):
+            if self._chunk_files:
+                self.close()
+                finish_chunk(self.get_chunk_path(self._chunk))
+            chunk = 0 if self._chunk is None else self._chunk + 1
+            logger.debug('Starting history chunk %d of exchange "%s"', chunk, self.exchange)
+            self._open_chunk(chunk, snapshot.pairs)
+            with open(os.path.join(self.path, INDEX_FILE), 'ab') as f:
+                f.write(np.float64(timestamp).tobytes())
+        if snapshot.pairs == self._chunk_pairs:
+            positions = None
+        else:
+            positions = np.array([self._chunk_index[pair_id] for pair_id in snapshot.pairs], dtype=np.intp)
+        for field in FIELDS:
+            if positions is None:
+                row = snapshot.columns[field]
+            else:
+                row = np.full(len(self._chunk_pairs), np.nan)
+                row[positions] = snapshot.columns[field]
+            field_file = self._chunk_files[FIELD_FILE.format(field)]
+            field_file.write(row.astype(np.float64).tobytes())
+            field_file.flush()
+        # Time is written the last one, rows are only visible for readers once their time is written
+        self._chunk_files[TIME_FILE].write(np.float64(timestamp).tobytes())
+        self._chunk_files[TIME_FILE].flush()
+        self._chunk_len += 1
+
+    def read(self, pair_id, start=None, end=None, fields=FIELDS):
+        '''
+        Read the history of a pair in a time window, see HistoryReader.read
+        '''
+        return HistoryReader(self.exchange, directory=self.directory).read(pair_id, start, end, fields)
+
+    def close(self):
+        '''
+        Close the files of the chunk opened to append snapshots
+        '''
+        for f in self._chunk_files.values():
+            f.close()
+        self._chunk_files = {}
+
+
+class HistoryReader(object):
+    '''
+    Reader of the history of the market snapshots of an exchange through memory-mapped files
+    '''
+
+    def __init__(self, exchange, directory=HISTORY_DIR):
+        '''
+        Constructor
+        :param exchange: str with the exchange
+        :param directory: str, directory of the history of all the exchanges
+        '''
+        self.exchange = exchange
+        self.path = os.path.join(directory, exchange)
+        self._chunks = {}  # Maps of the chunks that are full, they don't change anymore
+
+    def get_chunk(self, chunk, chunk_times):
+        '''
+        Get the memory maps of a chunk. The maps of the last chunk are done again every time since it can grow.
+        :param chunk: int, number of the chunk
+        :param chunk_times: numpy array with the time index of the chunks
+        :return: tuple (tuple of str with the pairs, numpy memmap with the times, dict field-numpy memmap pairs x rows),
+                 None if the chunk is empty. The values of a pair are contiguous in finished chunks, in the last chunk
+                 they are a transposed view of the rows
+        '''
+        if chunk in self._chunks:
+            return self._chunks[chunk]
+        chunk_path = os.path.join(self.path, CHUNK_DIR.format(chunk))
+        pairs = read_pairs(chunk_path)
+        rows = os.path.getsize(os.path.join(chunk_path, TIME_FILE)) // ITEM_SIZE
+        if not rows or not pairs:
+            return None
+        times = np.memmap(os.path.join(chunk_path, TIME_FILE), dtype=np.float64, mode='r', shape=(rows,))
+        fields = {field: map_field(chunk_path, field, rows, len(pairs)) for field in FIELDS}
+        chunk_maps = (pairs, times, fields)
+        # Chunks that were not finished because the process died are read by rows, but not kept, to read them
+        # contiguously once they are finished
+        if chunk < len(chunk_times) - 1 and all(values.flags.c_contiguous for values in fields.values()):
+            self._chunks[chunk] = chunk_maps
+        return chunk_maps
+
+    def iter_slices(self, pair_id, start=None, end=None, fields=FIELDS):
+        '''
+        Get the history of a pair in a time window as views of the memory maps, without copying any data. There is a
+        view for each chunk of the window. The views of finished chunks are contiguous, the view of the last chunk is
+        a strided array since the values of a pair are a column of its rows.
+        :param pair_id: str with the pair
+        :param start: float, start time of the window (included). Optional, from the beginning by default
+        :param end: float, end time of the window (excluded). Optional, until the end by default
+        :param fields: list of str with the fields to read
+        :return: generator of tuples (numpy array with the times, dict field-numpy array with the values)
+        '''
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        chunk_times = read_floats(os.path.join(self.path, INDEX_FILE))
+        first_chunk = max(np.searchsorted(chunk_times, start, side='right') - 1, 0)
+        last_chunk = np.searchsorted(chunk_times, end, side='left')
+        for chunk in range(first_chunk, last_chunk):
+            chunk_maps = self.get_chunk(chunk, chunk_times)
+            if chunk_maps is None or pair_id not in chunk_maps[0]:
+                continue
+            pairs, times, chunk_fields = chunk_maps
+            position = pairs.index(pair_id)
+            first_row, last_row = np.searchsorted(times, [start, end])
+            if first_row < last_row:
+                yield (times[first_row:last_row],
+                       {field: chunk_fields[field][position, first_row:last_row] for field in fields})
+
+    def read(self, pair_id, start=None, end=None, fields=FIELDS):
+        '''
+        Read the history of a pair in a time window in contiguous arrays. Only the rows of the window are read, but
+        unlike iter_slices the values are copied.
+        :param pair_id: str with the pair
+        :param start: float, start time of the window (included). Optional, from the beginning by default
+        :param end: float, end time of the window (excluded). Optional, until the end by default
+        :param fields: list of str with the fields to read
+        :return: tuple (numpy array with the times, dict field-numpy array with the values)
+        '''
+        slices = list(self.iter_slices(pair_id, start, end, fields))
+        return (np.concatenate([np.asarray(times) for times, _ in slices]) if slices else np.empty(0),
+                {field: np.concatenate([np.asarray(values[field]) for _, values in slices]) if slices else np.empty(0)
+                 for field in fields})
+
+
+def read_pairs(chunk_path):
+    '''
+    Function to read the pairs of a chunk
+    :param chunk_path: str, path of the chunk
+    :return: tuple of str with the pairs
+    '''
+    with open(os.path.join(chunk_path, PAIRS_FILE), 'r') as f:
+        pairs = f.read().decode('utf-8')
+    return tuple(pairs.split('\n')) if pairs else ()
+
+
+def is_chunk_finished(chunk_path):
+    '''
+    Function to check if a chunk is finished, or it was being finished when the process died
+    :param chunk_path: str, path of the chunk
+    :return: boolean
+    '''
+    return any(os.path.exists(os.path.join(chunk_path, FIELD_BY_PAIR_FILE.format(field))) for field in FIELDS)
+
+
+def finish_chunk(chunk_path):
+    '''
+    Function to rewrite the files of the fields of a chunk with one row of values per pair, so the history of a pair
+    in the chunk is contiguous. Each file is written atomically before removing the file by rows, and fields already
+    rewritten are skipped, so it can be done again if the process died while doing it.
+    :param chunk_path: str, path of the chunk
+    '''
+    pairs = read_pairs(chunk_path)
+    rows = os.path.getsize(os.path.join(chunk_path, TIME_FILE)) // ITEM_SIZE
+    for field in FIELDS:
+        rows_path = os.path.join(chunk_path, FIELD_FILE.format(field))
+        by_pair_path = os.path.join(chunk_path, FIELD_BY_PAIR_FILE.format(field))
+        if not os.path.exists(by_pair_path):
+            # Partial rows without time are left out
+            values = np.fromfile(rows_path, dtype=np.float64, count=rows * len(pairs)).reshape(rows, len(pairs))
+            write_atomic(by_pair_path, values.T.tobytes())
+        if os.path.exists(rows_path):
+            os.remove(rows_path)
+
+
+def map_field(chunk_path, field, rows, pairs_count):
+    '''
+    Function to memory-map the values of a field of a chunk
+    :param chunk_path: str, path of the chunk
+    :param field: str with the field
+    :param rows: int, number of rows of the chunk
+    :param pairs_count: int, number of pairs of the chunk
+    :return: numpy memmap pairs x rows, a transposed view of the rows if the chunk is not finished
+    '''
+    by_pair_path = os.path.join(chunk_path, FIELD_BY_PAIR_FILE.format(field))
+    if not os.path.exists(by_pair_path):
+        try:
+            return np.memmap(os.path.join(chunk_path, FIELD_FILE.format(field)), dtype=np.float64, mode='r',
+                             shape=(rows, pairs_count)).T
+        except (IOError, OSError):  # The file by rows is removed if the chunk has been finished meanwhile
+            pass
+    return np.memmap(by_pair_path, dtype=np.float64, mode='r', shape=(pairs_count, rows))
+
+
+def read_floats(file_path):
+    '''
+    Function to read float64 values from a binary file
+    :param file_path: str, path of the file
+    :return: numpy array
+    '''
+    if not os.path.exists(file_path):
+        return np.empty(0)
+    return np.fromfile(file_path, dtype=np.float64)
@@ -0,0 +1,290 @@
+'''
+This module includes the class MarketDelta with the changes between two market snapshots of an exchange: pairs added,
+pairs removed and the fields changed in each pair. Consumers can use it to skip the work for what hasn't changed, and
+it can be written as a stream of json lines to be read from other processes. A stream starts with a full delta, with
+the values of all the pairs, so readers can rebuild the market applying the deltas in order.
+Created: rggentil
+Date: 05/18/18
+'''
+
+
+from collections import namedtuple
+import json
+import logging
+import numpy as np
+from market_snapshot import FIELDS
+
+
+logger = logging.getLogger('rodbot')
+
+
+ReportedValues = namedtuple('ReportedValues', ['pairs', 'index', 'columns'])  # Duck-typed MarketSnapshot
+
+
+class MarketDelta(object):
+    '''
+    Changes between two consecutive market snapshots
+    '''
+
+    def __init__(self, added=(), removed=(), changed=None, sequence=0, values=None, full=False):
+        '''
+        Constructor
+        :param added: list of str with the pairs that are new in the market
+        :param removed: list of str with the pairs that are not in the market anymore
+        :param changed: dict pair-dict field-tuple (old value, new value) with the fields changed of each pair
+        :param sequence: int, number of the delta in the sequence of deltas of the exchange
+        :param values: dict pair-dict field-float with the values of the added pairs
+        :param full: boolean, True if the delta has all the pairs of the market, as added pairs, instead of the changes
+                     since a previous delta
+        '''
+        self.added = tuple(added)
+        self.removed = tuple(removed)
+        self.changed = changed or {}
+        self.sequence = sequence
+        self.values = values or {}
+        self.full = full
+
+    def __nonzero__(self):
+        return bool(self.full or self.added or self.removed or self.changed)
+
+    def __eq__(self, other):
+        return isinstance(other, MarketDelta) and self.to_dict() == other.to_dict()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'MarketDelta(added={}, removed={}, changed={})'.format(self.added, self.removed, len(self.changed))
+
+    @property
+    def changed_pairs(self):
+        '''
+        Pairs that are new or have any field changed
+        :return: set of str with the pairs
+        '''
+        return set(self.changed).union(self.added)
+
+    def to_dict(self):
+        '''
+        Get the delta as a dict that can be serialized to json
+        :return: dict
+        '''
+        return {'sequence': self.sequence, 'full': self.full, 'added': list(self.added), 'removed': list(self.removed),
+                'changed': {pair_id: {field: [to_json_value(value) for value in values]
+                                      for field, values in fields.iteritems()}
+                            for pair_id, fields in self.changed.iteritems()},
+                'values': {pair_id: {field: to_json_value(value) for field, value in fields.iteritems()}
+                           for pair_id, fields in self.values.iteritems()}}
+
+    @classmethod
+    def from_dict(cls, delta_dict):
+        '''
+        Build the delta from a dict obtained with to_dict
+        :param delta_dict: dict
+        :return: MarketDelta
+        '''
+        return cls(added=delta_dict['added'], removed=delta_dict['removed'], sequence=delta_dict['sequence'],
+                   changed={pair_id: {field: tuple(from_json_value(value) for value in values)
+                                      for field, values in fields.iteritems()}
+                            for pair_id, fields in delta_dict['changed'].iteritems()},
+                   values={pair_id: {field: from_json_value(value) for field, value in fields.iteritems()}
+                           for pair_id, fields in delta_dict.get('values', {}).iteritems()},
+                   full=delta_dict.get('full', False))
+
+    def apply(self, market):
+        '''
+        Apply the delta to the values of the pairs of a market
+        :param market: dict pair-dict field-float with the values of the market before the delta, it's updated in place.
+                       A full delta replaces all of them
+        :return: dict market
+        '''
+        if self.full:
+            market.clear()
+        for pair_id in self.removed:
+            market.pop(pair_id, None)
+        for pair_id in self.added:
+            market[pair_id] = dict(self.values.get(pair_id, {}))
+        for pair_id, fields in self.changed.iteritems():
+            pair_values = market.setdefault(pair_id, {})
+            for field, (_, value) in fields.iteritems():
+                pair_values[field] = value
+        return market
+
+
+def get_market_delta(old_snapshot, new_snapshot, thresholds=None, sequence=0):
+    '''
+    Function to get the changes between two market snapshots. Fields are compared with a vectorized comparison of the
+    columns of the pairs that are in both snapshots.
+    :param old_snapshot: MarketSnapshot, the previous one. If None all the pairs of new_snapshot are added in a full
+                         delta
+    :param new_snapshot: MarketSnapshot, the current one
+    :param thresholds: dict field-float with the minimum absolute change of the field to be considered changed.
+                       Optional, by default any change is reported
+    :param sequence: int, number of the delta
+    :return: MarketDelta
+    '''
+    if old_snapshot is None:
+        return MarketDelta(added=new_snapshot.pairs, values=get_values(new_snapshot, new_snapshot.pairs),
+                           sequence=sequence, full=True)
+    thresholds = thresholds or {}
+    if old_snapshot.pairs == new_snapshot.pairs:
+        added, removed = (), ()
+        common_pairs = new_snapshot.pairs
+        old_positions = new_positions = slice(None)
+    else:
+        added = [pair_id for pair_id in new_snapshot.pairs if pair_id not in old_snapshot.index]
+        removed = [pair_id for pair_id in old_snapshot.pairs if pair_id not in new_snapshot.index]
+        common_pairs = [pair_id for pair_id in new_snapshot.pairs if pair_id in old_snapshot.index]
+        old_positions = np.array([old_snapshot.index[pair_id] for pair_id in common_pairs], dtype=np.intp)
+        new_positions = np.array([new_snapshot.index[pair_id] for pair_id in common_pairs], dtype=np.intp)
+    changed = {}
+    for field in FIELDS:
+        old_values = old_snapshot.columns[field][old_positions]
+        new_values = new_snapshot.columns[field][new_positions]
+        field_changed = np.abs(new_values - old_values) > thresholds.get(field, 0)
+        field_changed |= np.isnan(new_values) != np.isnan(old_values)
+        for i in np.flatnonzero(field_changed):
+            changed.setdefault(common_pairs[i], {})[field] = (float(old_values[i]), float(new_values[i]))
+    delta = MarketDelta(added=added, removed=removed, changed=changed, sequence=sequence,
+                        values=get_values(new_snapshot, added))
+    logger.debug('Market delta %d: %s', sequence, delta)
+    return delta
+
+
+def get_values(snapshot, pairs):
+    '''
+    Function to get the values of some pairs of a snapshot
+    :param snapshot: MarketSnapshot or ReportedValues
+    :param pairs: list of str with the pairs
+    :return: dict pair-dict field-float
+    '''
+    return {pair_id: {field: float(snapshot.columns[field][snapshot.index[pair_id]]) for field in FIELDS}
+            for pair_id in pairs}
+
+
+def to_json_value(value):
+    '''
+    Function to get a float that can be written in json, nan is not valid json so it's written as null
+    '''
+    return None if value is None or np.isnan(value) else value
+
+
+def from_json_value(value):
+    return np.nan if value is None else value
+
+
+class DeltaTracker(object):
+    '''
+    Deltas of the consecutive snapshots of an exchange. With thresholds, fields are compared with the last value
+    reported in a delta instead of the value of the previous snapshot, so a field that changes a bit less than its
+    threshold in every update is reported once the changes add up to the threshold.
+    '''
+
+    def __init__(self, thresholds=None):
+        '''
+        Constructor
+        :param thresholds: dict field-float with the minimum absolute change of the field to be considered changed.
+                           Optional, by default any change is reported
+        '''
+        self.thresholds = thresholds
+        self.reported = None  # Last value of each field of each pair reported in a delta
+
+    def get_full_delta(self, sequence=0):
+        '''
+        Get a full delta with the values reported so far, the ones the next deltas are based on, to start a stream
+        :param sequence: int, number of the delta
+        :return: MarketDelta
+        '''
+        if self.reported is None:
+            return MarketDelta(sequence=sequence, full=True)
+        return get_market_delta(None, self.reported, sequence=sequence)
+
+    def update(self, snapshot, sequence=0):
+        '''
+        Get the delta of a new snapshot. The old values of the changes are the last values reported.
+        :param snapshot: MarketSnapshot, the current one
+        :param sequence: int, number of the delta
+        :return: MarketDelta
+        '''
+        delta = get_market_delta(self.reported, snapshot, self.thresholds, sequence)
+        if not self.thresholds or self.reported is None:
+            self.reported = snapshot
+            return delta
+        # Unchanged fields keep their reported value, new pairs and changed fields take the value of the snapshot
+        reported = self.reported
+        if reported.pairs == snapshot.pairs:
+            common = reported_positions = slice(None)
+        else:
+            common = np.array([pair_id in reported.index for pair_id in snapshot.pairs], dtype=bool)
+            reported_positions = np.array([reported.index[pair_id] for pair_id in snapshot.pairs
+                                           if pair_id in reported.index], dtype=np.intp)
+        columns = {}
+        for field in FIELDS:
+            column = snapshot.columns[field].copy()
+            column[common] = reported.columns[field][reported_positions]
+            columns[field] = column
+        for pair_id, fields in delta.changed.iteritems():
+            i = snapshot.index[pair_id]
+            for field in fields:
+                columns[field][i] = snapshot.columns[field][i]
+        self.reported = ReportedValues(snapshot.pairs, snapshot.index, columns)
+        return delta
+
+
+class DeltaStream(object):
+    '''
+    Stream of market deltas written as json lines in a file, one line per delta, so other processes can follow it.
+    Every time the stream is opened it starts with a full delta, so readers can rebuild the market from the last full
+    delta even if the sequence of the deltas starts again after a restart. Empty deltas are not written, there are no
+    heartbeats in the stream.
+    '''
+
+    def __init__(self, file_path, full_delta=None):
+        '''
+        Constructor
+        :param file_path: str, path of the file. Deltas are appended to it
+        :param full_delta: MarketDelta with all the pairs of the market, written first. Optional, i.e. to append only
+                           deltas to a stream still open
+        '''
+        self.file_path = file_path
+        self._file = open(file_path, 'a')
+        if full_delta is not None:
+            self.write(full_delta)
+
+    def write(self, delta):
+        '''
+        Append a delta to the stream, if it's not empty
+        :param delta: MarketDelta
+        '''
+        if not delta:
+            return
+        self._file.write(json.dumps(delta.to_dict(), separators=(',', ':')) + '\n')
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+def read_delta_stream(file_path):
+    '''
+    Function to read the deltas of a stream
+    :param file_path: str, path of the file of the stream
+    :return: generator of MarketDelta
+    '''
+    with open(file_path, 'r') as f:
+        for line in f:
+            if line.endswith('\n'):  # Skip last line if it's still being written
+                yield MarketDelta.from_dict(json.loads(line))
+
+
+def read_market(file_path):
+    '''
+    Function to rebuild the values of the market of an exchange from its stream, applying the deltas from the last full
+    delta of the stream
+    :param file_path: str, path of the file of the stream
+    :return: dict pair-dict field-float
+    '''
+    market = {}
+    for delta in read_delta_stream(file_path):
+        delta.apply(market)
+    return market
@@ -0,0 +1,131 @@
+'''
+This module includes the class MarketSnapshot that keeps the stats of all the pairs of an exchange in columns. The stats
+returned by the exchange are a dict of dicts whose numeric values are strings, so the snapshot parses every numeric
+field only once, when it is built, into a float numpy array with one position for each pair.
+Created: rggentil
+Date: 05/08/18
+'''
+
+
+import logging
+import numpy as np
+
+
+FIELDS = ('base_volume', 'last_price', 'highest_bid', 'lowest_ask', 'high_24hr', 'low_24hr', 'percent_changed_24hr')
+
+
+logger = logging.getLogger('rodbot')
+
+
+class MarketSnapshot(object):
+    '''
+    Columnar representation of the stats of the pairs of an exchange at a given moment
+    '''
+
+    def __init__(self, pairs, columns):
+        '''
+        Constructor
+        :param pairs: list of str with the pairs, the position of each pair is its index in the columns
+        :param columns: dict field-numpy array of floats, all of them with one value for each pair
+        '''
+        self.pairs = tuple(pairs)
+        self.index = {pair_id: i for i, pair_id in enumerate(self.pairs)}
+        self.columns = columns
+        quotes = [pair_id.split('-')[1] for pair_id in self.pairs]
+        self.quote_currencies = tuple(sorted(set(quotes)))
+        quote_positions = {currency: i for i, currency in enumerate(self.quote_currencies)}
+        self.quote_index = np.array([quote_positions[currency] for currency in quotes], dtype=np.intp)
+        self._conversion_graph = None
+        self._conversion_rates = {}
+
+    @classmethod
+    def from_stats(cls, pairs_stats):
+        '''
+        Build the snapshot from the stats of the pairs as they are returned by the exchange. Pairs are sorted by name
+        so the index of a pair is the same between snapshots if the pairs of the exchange don't change.
+        :param pairs_stats: dict pair-dict with the stats of the pair
+        :return: MarketSnapshot
+        '''
+        pairs = sorted(pairs_stats)
+        columns = {field: np.array([pairs_stats[pair_id][field] for pair_id in pairs], dtype=np.float64)
+                   for field in FIELDS}
+        logger.debug('Built market snapshot of %d pairs', len(pairs))
+        return cls(pairs, columns)
+
+    def __len__(self):
+        return len(self.pairs)
+
+    def __contains__(self, pair_id):
+        return pair_id in self.index
+
+    def get_value(self, pair_id, field):
+        '''
+        Get the value of a field of a pair
+        :param pair_id: str with the pair in the form XXX-YYY
+        :param field: str, one of FIELDS
+        :return: float
+        '''
+        return float(self.columns[field][self.index[pair_id]])
+
+    def get_pair_values(self, pair_id):
+        '''
+        Get all the values of a pair, in the same form as the stats of the exchange but with float values
+        :param pair_id: str with the pair in the form XXX-YYY
+        :return: dict field-float
+        '''
+        i = self.index[pair_id]
+        return {field: float(column[i]) for field, column in self.columns.iteritems()}
+
+    def get_conversion_graph(self):
+        '''
+        Get the graph of conversions between the currencies of the market. Every pair XXX-YYY with a last price is an
+        edge in both directions: XXX can be converted to YYY at last price and YYY to XXX at its inverse. The graph is
+        built only once for each snapshot.
+        :return: dict currency-list of tuples (other currency, rate to convert other currency to currency, liquidity of
+                 the pair, its volume in currency)
+        '''
+        if self._conversion_graph is None:
+            graph = {}
+            for pair_id, last_price, base_volume in zip(self.pairs, self.columns['last_price'].tolist(),
+                                                        self.columns['base_volume'].tolist()):
+                if not last_price > 0:
+                    continue
+                base_currency, quote_currency = pair_id.split('-')
+                graph.setdefault(quote_currency, []).append((base_currency, last_price, base_volume * last_price))
+                graph.setdefault(base_currency, []).append((quote_currency, 1 / last_price, base_volume))
+            self._conversion_graph = graph
+        return self._conversion_graph
+
+    def get_conversion_rates(self, to_currency):
+        '''
+        Get the rates to convert the currencies of the market to a currency. Each rate is resolved through the path of
+        the conversion graph with less conversions and, among those, through the pair with more liquidity, i.e. more
+        volume, compared in to_currency. Rates are cached until the next snapshot.
+        :param to_currency: str. Currency in which we want the output
+        :return: dict currency-float rate, currencies not connected with to_currency are not included
+        '''
+        if to_currency not in self._conversion_rates:
+            graph = self.get_conversion_graph()
+            rates = {to_currency: 1.0}
+            frontier = [to_currency] if to_currency in graph else []
+            while frontier:  # Breadth first search, a level of the graph in every iteration
+                candidates = {}
+                for currency in frontier:
+                    for other_currency, rate, liquidity in graph[currency]:
+                        liquidity *= rates[currency]  # From currency to to_currency, to compare paths of any pairs
+                        if other_currency not in rates and \
+                                (other_currency not in candidates or liquidity > candidates[other_currency][0]):
+                            candidates[other_currency] = (liquidity, rate * rates[currency])
+                rates.update((currency, rate) for currency, (liquidity, rate) in candidates.iteritems())
+                frontier = list(candidates)
+            logger.debug('Conversion rates to %s: %s', to_currency, rates)
+            self._conversion_rates[to_currency] = rates
+        return self._conversion_rates[to_currency]
+
+    def to_dict(self, values):
+        '''
+        Get a dict pair-value from an array with a value for each pair of the snapshot
+        :param values: numpy array with the same length as the snapshot
+        :return: dict pair-float
+        '''
+        return dict(zip(self.pairs, values.tolist()))
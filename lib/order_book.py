@@ -0,0 +1,218 @@
+'''
+This module includes the class OrderBook to keep the order book of a pair and get to know its depth: the size offered
+near the mid price, the cumulative size of the levels and the gaps between them. Each side of the book is kept as sorted
+arrays of price levels, so these metrics are computed for all the levels at once, and updates of single levels are
+inserted in or deleted from their sorted position without building the book again.
+Created: rggentil
+Date: 06/11/18
+'''
+
+
+import logging
+import numpy as np
+
+
+BID = 'bid'
+ASK = 'ask'
+INITIAL_CAPACITY = 16
+
+
+logger = logging.getLogger('rodbot')
+
+
+class BookSide(object):
+    '''
+    Price levels of a side of an order book, sorted from the best price to the worst one. Levels are kept in arrays
+    with spare capacity, sorted by key: the price for the asks and the price with negative sign for the bids, so both
+    sides are searched in ascending order.
+    '''
+
+    def __init__(self, levels=(), descending=False):
+        '''
+        Constructor
+        :param levels: list of [price, count, size] of the levels, as str or float, in any order
+        :param descending: boolean, True for the bids, that are sorted from the highest price to the lowest one
+        '''
+        self.descending = descending
+        levels = np.array(levels, dtype=np.float64).reshape(-1, 3)
+        levels = levels[levels[:, 2] > 0]
+        keys = -levels[:, 0] if descending else levels[:, 0]
+        order = np.argsort(keys, kind='mergesort')
+        self.length = len(levels)
+        capacity = max(INITIAL_CAPACITY, 2 * self.length)
+        self._keys = np.zeros(capacity)
+        self._counts = np.zeros(capacity)
+        self._sizes = np.zeros(capacity)
+        self._keys[:self.length] = keys[order]
+        self._counts[:self.length] = levels[order, 1]
+        self._sizes[:self.length] = levels[order, 2]
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def keys(self):
+        return self._keys[:self.length]
+
+    @property
+    def prices(self):
+        return -self.keys if self.descending else self.keys.copy()
+
+    @property
+    def counts(self):
+        return self._counts[:self.length]
+
+    @property
+    def sizes(self):
+        return self._sizes[:self.length]
+
+    def get_key(self, price):
+        return -price if self.descending else price
+
+    def apply_update(self, price, size, count=0):
+        '''
+        Set the size of a price level. The level is found by binary search and inserted or deleted shifting the levels
+        after it, the rest of the book doesn't change.
+        :param price: float, price of the level
+        :param size: float, new size of the level, 0 to delete it
+        :param count: int, number of orders of the level
+        '''
+        key = self.get_key(price)
+        i = np.searchsorted(self.keys, key)
+        exists = i < self.length and self._keys[i] == key
+        if size <= 0:
+            if exists:
+                for values in (self._keys, self._counts, self._sizes):
+                    values[i:self.length - 1] = values[i + 1:self.length]
+                self.length -= 1
+        elif exists:
+            self._counts[i], self._sizes[i] = count, size
+        else:
+            if self.length == len(self._keys):
+                self._keys, self._counts, self._sizes = [np.concatenate([values, np.zeros(len(values))])
+                                                         for values in (self._keys, self._counts, self._sizes)]
+            for values in (self._keys, self._counts, self._sizes):
+                values[i + 1:self.length + 1] = values[i:self.length]
+            self._keys[i], self._counts[i], self._sizes[i] = key, count, size
+            self.length += 1
+
+    def get_best_price(self):
+        '''
+        :return: float, price of the best level, None if the side is empty
+        '''
+        return float(abs(self._keys[0])) if self.length else None
+
+    def get_cumulative_sizes(self):
+        '''
+        :return: numpy array with the size of each level plus the sizes of the better levels
+        '''
+        return np.cumsum(self.sizes)
+
+    def get_depth(self, limit_prices):
+        '''
+        Get the size of the levels up to some prices
+        :param limit_prices: numpy array with the worst prices of the levels counted
+        :return: numpy array with the size of the levels up to each price
+        '''
+        cumulative_sizes = np.concatenate([[0.], self.get_cumulative_sizes()])
+        return cumulative_sizes[np.searchsorted(self.keys, self.get_key(limit_prices), side='right')]
+
+    def get_gaps(self):
+        '''
+        :return: numpy array with the price difference between each level and the next one
+        '''
+        return np.diff(self.keys)
+
+
+class OrderBook(object):
+    '''
+    Order book of a pair of an exchange
+    '''
+
+    def __init__(self, pair, bids=(), asks=(), sequence=0):
+        '''
+        Constructor
+        :param pair: str with the pair in the form XXX-YYY
+        :param bids: list of [price, count, size] of the bid levels
+        :param asks: list of [price, count, size] of the ask levels
+        :param sequence: int, sequence of the book in the exchange, updates with older sequences are discarded
+        '''
+        self.pair = pair
+        self.sequence = sequence
+        self.sides = {BID: BookSide(bids, descending=True), ASK: BookSide(asks)}
+
+    @classmethod
+    def from_json(cls, pair, orderbook):
+        '''
+        Build the book from the json of the exchange
+        :param pair: str with the pair in the form XXX-YYY
+        :param orderbook: dict with the sequence, bids and asks of the book, levels are lists [price, count, size]
+        :return: OrderBook
+        '''
+        return cls(pair, orderbook['bids'], orderbook['asks'], int(orderbook.get('sequence', 0)))
+
+    @property
+    def bids(self):
+        return self.sides[BID]
+
+    @property
+    def asks(self):
+        return self.sides[ASK]
+
+    def get_mid_price(self):
+        '''
+        :return: float, mean of the best bid and the best ask, None if any side is empty
+        '''
+        if not self.bids or not self.asks:
+            return None
+        return (self.bids.get_best_price() + self.asks.get_best_price()) / 2
+
+    def apply_updates(self, bids=(), asks=(), sequence=None):
+        '''
+        Apply the changes of some levels of the book
+        :param bids: list of [price, count, size] with the new values of the bid levels, size 0 removes the level
+        :param asks: list of [price, count, size] with the new values of the ask levels, size 0 removes the level
+        :param sequence: int, sequence of the update. Optional, if provided updates not after the book are discarded
+        :return: boolean, True if the update has been applied
+        '''
+        if sequence is not None:
+            if sequence <= self.sequence:
+                logger.debug('Discarding update %d of order book of %s at %d', sequence, self.pair, self.sequence)
+                return False
+            self.sequence = sequence
+        for side, levels in ((self.bids, bids), (self.asks, asks)):
+            for price, count, size in levels:
+                side.apply_update(float(price), float(size), float(count))
+        return True
+
+    def get_depth(self, distances):
+        '''
+        Get the size offered in each side of the book near the mid price
+        :param distances: float or numpy array of floats with the distances to the mid price, relative to it, i.e. 0.01
+                          for the levels within 1% of the mid price
+        :return: tuple of numpy arrays (bid sizes, ask sizes) with the size of the levels within each distance
+        '''
+        distances = np.atleast_1d(np.asarray(distances, dtype=np.float64))
+        mid_price = self.get_mid_price()
+        if mid_price is None:
+            return np.zeros(len(distances)), np.zeros(len(distances))
+        return (self.bids.get_depth(mid_price * (1 - distances)),
+                self.asks.get_depth(mid_price * (1 + distances)))
+
+    def get_gap_metrics(self):
+        '''
+        Get the gaps of the book: the spread and the biggest difference of price between consecutive levels of each
+        side, relative to the mid price, and the size of the levels before the biggest gap of each side, that is the
+        size that has to be traded to jump the gap
+        :return: dict metric-float, empty if any side of the book is empty
+        '''
+        mid_price = self.get_mid_price()
+        if mid_price is None:
+            return {}
+        metrics = {'spread': (self.asks.get_best_price() - self.bids.get_best_price()) / mid_price}
+        for name, side in ((BID, self.bids), (ASK, self.asks)):
+            gaps = side.get_gaps()
+            i = int(np.argmax(gaps)) if len(gaps) else None
+            metrics['max_{}_gap'.format(name)] = float(gaps[i] / mid_price) if i is not None else 0.
+            metrics['{}_gap_depth'.format(name)] = float(side.get_cumulative_sizes()[i]) if i is not None else 0.
+        return metrics
@@ -1,42 +1,156 @@
 '''
 This module includes the class Pair to modelize the concept of Pair for future trading. It's not used now, but probably
 we'll need it when we have to follow up pairs in different exchanges, with different orders.
+The values of the pairs are kept in a PairRegistry of the exchange, in an array with a row for each pair, and a Pair is
+a light view of its row. All the pairs of the registry are updated at once from a market snapshot. A pair without a
+registry has its own one, so its values are not shared with any other pair and are freed with it.
 Created: rggentil
 Date: 04/12/18
 '''
 
 
 import logging
+from market_snapshot import FIELDS
+import numpy as np
 import re
 
 
+PAIR_REGEX = re.compile(r'^\w{3,5}-\w{3,5}$')
+INITIAL_CAPACITY = 16
+PAIR_FIELDS = (('volume', 'base_volume'), ('high_24h', 'high_24hr'), ('low_24h', 'low_24hr'),
+               ('last_price', 'last_price'), ('highest_bid', 'highest_bid'), ('lowest_ask', 'lowest_ask'),
+               ('percent_changed_24h', 'percent_changed_24hr'))  # (attribute of Pair, field of the stats)
+FIELD_COLUMNS = {field: i for i, field in enumerate(FIELDS)}
+
+
 logger = logging.getLogger(__name__)
 
 
+_currencies = {}  # Currency codes are interned, all the pairs share the same str for the same currency
+
+
+class PairRegistry(object):
+    '''
+    Registry of the values of the pairs of an exchange, in an array with a row for each pair and a column for each
+    field of the stats
+    '''
+
+    def __init__(self, exchange='', capacity=INITIAL_CAPACITY):
+        '''
+        Constructor
+        :param exchange: str exchange of the pairs
+        :param capacity: int, number of rows allocated, the array grows when they are used
+        '''
+        self.exchange = exchange
+        self.pairs = []  # Pair of each row, None for the rows of the pairs removed
+        self.index = {}
+        self.values = np.full((capacity, len(FIELDS)), np.nan)
+        self._free_rows = []  # Rows of the pairs removed, they are reused by the next pairs added
+        self._snapshot_pairs = None
+        self._snapshot_rows = None
+        self._snapshot_positions = None
+        self._missing_pairs = None
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, pair_id):
+        return pair_id in self.index
+
+    def get_row(self, pair_id):
+        '''
+        Get the row of a pair, adding it to the registry if it's not in it. New pairs take the row of a pair removed if
+        there is any, so the array doesn't grow when pairs are added and removed.
+        :param pair_id: str with the pair in the form XXX-YYY
+        :return: int, row of the pair
+        '''
+        row = self.index.get(pair_id)
+        if row is None:
+            if self._free_rows:
+                row = self._free_rows.pop()
+                self.pairs[row] = pair_id
+            else:
+                row = len(self.pairs)
+                if row == len(self.values):
+                    values = np.full((2 * len(self.values), len(FIELDS)), np.nan)
+                    values[:row] = self.values
+                    self.values = values
+                self.pairs.append(pair_id)
+            self.index[pair_id] = row
+            self._snapshot_pairs = None
+        return row
+
+    def remove(self, pair_id):
+        '''
+        Remove a pair from the registry. Its values are cleared and its row is reused by the next pair added, so the
+        Pair objects that were using it must not be used anymore. Other pairs keep their rows.
+        :param pair_id: str with the pair in the form XXX-YYY
+        '''
+        row = self.index.pop(pair_id, None)
+        if row is not None:
+            self.pairs[row] = None
+            self.values[row] = np.nan
+            self._free_rows.append(row)
+            self._snapshot_pairs = None
+
+    def clear(self, pair_id):
+        '''
+        Clear the values of a pair, i.e. when it's not in the exchange anymore. The pair keeps its row.
+        :param pair_id: str with the pair in the form XXX-YYY
+        :return: dict field-float with the values the pair had, without the fields that hadn't been updated
+        '''
+        row = self.index[pair_id]
+        values = {field: float(self.values[row, column]) for field, column in FIELD_COLUMNS.iteritems()
+                  if not np.isnan(self.values[row, column])}
+        self.values[row] = np.nan
+        return values
+
+    def update_from_snapshot(self, snapshot):
+        '''
+        Update the values of all the pairs of the registry from a market snapshot, one vectorized copy for each field.
+        The rows of the pairs found in the snapshot and their positions in it are kept while the pairs of the snapshot
+        and of the registry don't change, rows of the pairs removed are not copied.
+        :param snapshot: MarketSnapshot of the exchange
+        :return: list of str with the pairs of the registry that are not in the snapshot, they are not updated
+        '''
+        if self._snapshot_pairs is not snapshot.pairs and self._snapshot_pairs != snapshot.pairs:
+            rows = np.array(sorted(self.index.values()), dtype=np.intp)
+            positions = np.array([snapshot.index.get(self.pairs[row], -1) for row in rows], dtype=np.intp)
+            found = positions >= 0
+            self._snapshot_pairs = snapshot.pairs
+            self._snapshot_rows, self._snapshot_positions = rows[found], positions[found]
+            self._missing_pairs = [self.pairs[row] for row in rows[~found]]
+        for field, column in FIELD_COLUMNS.iteritems():
+            self.values[self._snapshot_rows, column] = snapshot.columns[field][self._snapshot_positions]
+        return list(self._missing_pairs)
+
+
 class Pair(object):
     '''
     This class represents a pair of an exchange
     '''
 
-    def __init__(self, pair_name, exchange):
+    __slots__ = ('pair_name', 'exchange', 'base_currency', 'quote_currency', 'registry', 'row', 'last_price_usd',
+                 'in_order_book', 'my_balance_p1', 'my_balance_p2')
+
+    def __init__(self, pair_name, exchange, registry=None):
         '''
         Constructor
         :param pair_name: str with the pair in form XXX-YYY
         :param exchange: str exchange of the pair
+        :param registry: PairRegistry of the values of the pair, pairs with the same name in a registry share their
+                         values. Optional, by default the pair has its own registry
         '''
-        if check_pair_is_valid(pair_name):
-            self.pair_name = pair_name
-        else:
+        if not check_pair_is_valid(pair_name):
             raise AttributeError
+        self.pair_name = pair_name
         self.exchange = exchange
-        self.volume = None
-        self.high_24h = None
-        self.low_24h = None
-        self.last_price = None
+        base_currency, quote_currency = pair_name.split('-')
+        self.base_currency = _currencies.setdefault(base_currency, base_currency)
+        self.quote_currency = _currencies.setdefault(quote_currency, quote_currency)
+        self.registry = registry if registry is not None else PairRegistry(exchange, capacity=1)
+        self.row = self.registry.get_row(pair_name)
         self.last_price_usd = None  # of the first currency of the pair
-        self.highest_bid = None
-        self.lowest_ask = None
-        self.percent_changed_24h = None
         self.in_order_book = None
         self.my_balance_p1 = None
         self.my_balance_p2 = None
@@ -44,22 +158,36 @@ class Pair(object):
     def update_values(self, values_data=None):
         '''
         Function to update the values of the pair by either requesting the pair or processing a json
-        :param values_data: dict with the values. Optional, if not a request is performed
+        :param values_data: dict with the values, or dict pair-dict with the values of all the pairs
         '''
         logger.debug('Updatig values for pair %s', self.pair_name)
-        if values_data:
-            try:
-                self.volume = float(values_data["base_volume"])
-                self.high_24h = float(values_data["high_24hr"])
-                self.low_24h = float(values_data["low_24hr"])
-                self.last_price = float(values_data["last_price"])
-                self.highest_bid = float(values_data["highest_bid"])
-                self.lowest_ask = float(values_data["lowest_ask"])
-                self.percent_changed_24h = float(values_data["percent_changed_24hr"])
-            except KeyError:  # This is the cases that we received a dict with all the pairs
-                self.update_values(values_data[self.pair_name])
-        else:
+        if not values_data:
             raise AttributeError('This function needs data to update, otherwise it fails, need to work on it')
+        if self.pair_name in values_data:  # This is the cases that we received a dict with all the pairs
+            values_data = values_data[self.pair_name]
+        self.registry.values[self.row] = [float(values_data[field]) for field in FIELDS]
+
+
+def field_property(field):
+    '''
+    Function to get the property of a Pair to access a field of its row in the registry
+    :param field: str, field of the stats
+    :return: property, its value is None if the field hasn't been updated
+    '''
+    column = FIELD_COLUMNS[field]
+
+    def get_value(self):
+        value = self.registry.values[self.row, column]
+        return None if np.isnan(value) else float(value)
+
+    def set_value(self, value):
+        self.registry.values[self.row, column] = np.nan if value is None else value
+
+    return property(get_value, set_value)
+
+
+for attribute, field in PAIR_FIELDS:
+    setattr(Pair, attribute, field_property(field))
 
 
 def check_pair_is_valid(pair):
@@ -68,4 +196,4 @@ def check_pair_is_valid(pair):
     :param pair: pair to check
     :return: bool. True if it's OK, False otherwisw
     '''
-    return re.search(r'^\w{3,5}-\w{3,5}$', pair) is not None
+    return PAIR_REGEX.match(pair) is not None
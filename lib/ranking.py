@@ -0,0 +1,133 @@
+'''
+This module includes the class VolumeRanking that keeps the pairs of an exchange ordered by volume between updates of
+the stats. Instead of sorting all the pairs every time, only the pairs whose volume has changed are moved in the
+ranking, and the changes in the top of the ranking are reported as events.
+Created: rggentil
+Date: 05/15/18
+'''
+
+
+from bisect import bisect_left, insort
+from collections import namedtuple
+import logging
+import numpy as np
+
+
+ENTERED = 'entered'
+DROPPED = 'dropped'
+UP = 'up'
+DOWN = 'down'
+DEFAULT_TOP_N = 10
+DEFAULT_THRESHOLD = 0.0
+
+
+logger = logging.getLogger('rodbot')
+
+
+RankEvent = namedtuple('RankEvent', ['kind', 'pair', 'old_rank', 'new_rank'])
+
+
+class VolumeRanking(object):
+    '''
+    Ranking of pairs by volume, in descending order, maintained incrementally
+    '''
+
+    def __init__(self, top_n=DEFAULT_TOP_N, threshold=DEFAULT_THRESHOLD):
+        '''
+        Constructor
+        :param top_n: int, size of the top of the ranking whose changes are reported
+        :param threshold: float, relative change of the volume of a pair needed to move it in the ranking, i.e. 0.01
+                          for 1%. 0 by default, so any change moves the pair
+        '''
+        self.top_n = top_n
+        self.threshold = threshold
+        self._keys = []  # Sorted list of tuples (-volume, pair)
+        self._volumes = {}  # Volume of each pair in the ranking
+        self._pairs = ()
+        self._values = np.empty(0)
+
+    def __len__(self):
+        return len(self._keys)
+
+    def update(self, pairs, volumes):
+        '''
+        Update the ranking with the volumes of a new snapshot. When pairs are the same as in the previous update (the
+        usual case, since the index of the market snapshot is stable) the changed volumes are found with a vectorized
+        comparison and only those pairs are moved. Pairs with nan volume are not ranked.
+        :param pairs: list of str with the pairs
+        :param volumes: numpy array with the volume of each pair
+        :return: list of RankEvent with the changes in the top_n pairs
+        '''
+        old_top = self.get_top()
+        pairs = tuple(pairs)
+        if pairs == self._pairs:
+            changed = np.abs(volumes - self._values) > self.threshold * np.abs(self._values)
+            changed |= np.isnan(volumes) != np.isnan(self._values)
+            changed_positions = np.flatnonzero(changed)
+            values = self._values.copy()
+        else:
+            for pair_id in set(self._volumes).difference(pairs):
+                self._remove(pair_id)
+            changed_positions = range(len(pairs))
+            values = np.array(volumes, dtype=np.float64)
+        for i in changed_positions:
+            pair_id, volume = pairs[i], float(volumes[i])
+            self._remove(pair_id)
+            if not np.isnan(volume):
+                insort(self._keys, (-volume, pair_id))
+                self._volumes[pair_id] = volume
+            values[i] = volume
+        self._pairs, self._values = pairs, values
+        logger.debug('Volume ranking updated, %d pairs moved', len(changed_positions))
+        return get_rank_events(old_top, self.get_top())
+
+    def _remove(self, pair_id):
+        '''
+        Remove a pair from the ranking, if it's in it
+        :param pair_id: str with the pair
+        '''
+        volume = self._volumes.pop(pair_id, None)
+        if volume is not None:
+            del self._keys[bisect_left(self._keys, (-volume, pair_id))]
+
+    def get_top(self, n=None):
+        '''
+        Get the pairs with more volume
+        :param n: int, number of pairs. Optional, top_n by default
+        :return: list of tuples (pair, volume) in descending order
+        '''
+        return [(pair_id, -volume) for volume, pair_id in self._keys[:self.top_n if n is None else n]]
+
+    def get_rank(self, pair_id):
+        '''
+        Get the position of a pair in the ranking
+        :param pair_id: str with the pair
+        :return: int, 1 for the pair with more volume, None if the pair is not in the ranking
+        '''
+        if pair_id not in self._volumes:
+            return None
+        return bisect_left(self._keys, (-self._volumes[pair_id], pair_id)) + 1
+
+
+def get_rank_events(old_top, new_top):
+    '''
+    Function to compare two tops of the ranking and get the changes between them
+    :param old_top: list of tuples (pair, volume) of the previous top
+    :param new_top: list of tuples (pair, volume) of the current top
+    :return: list of RankEvent
+    '''
+    old_ranks = {pair_id: rank for rank, (pair_id, _) in enumerate(old_top, 1)}
+    new_ranks = {pair_id: rank for rank, (pair_id, _) in enumerate(new_top, 1)}
+    events = []
+    for pair_id, new_rank in sorted(new_ranks.iteritems(), key=lambda x: x[1]):
+        old_rank = old_ranks.get(pair_id)
+        if old_rank is None:
+            events.append(RankEvent(ENTERED, pair_id, None, new_rank))
+        elif new_rank < old_rank:
+            events.append(RankEvent(UP, pair_id, old_rank, new_rank))
+        elif new_rank > old_rank:
+            events.append(RankEvent(DOWN, pair_id, old_rank, new_rank))
+    for pair_id, old_rank in sorted(old_ranks.iteritems(), key=lambda x: x[1]):
+        if pair_id not in new_ranks:
+            events.append(RankEvent(DROPPED, pair_id, old_rank, None))
+    return events
@@ -0,0 +1,151 @@
+'''
+This module includes the classes RetryPolicy and CircuitBreaker used by ApiExchange to deal with the errors of the
+exchanges. Transient errors are retried a few times with exponential backoff and jitter inside the same poll, instead
+of losing the data of a whole interval. If an exchange keeps failing the circuit breaker opens and the requests to it
+fail fast, without waiting for timeouts, until the exchange is tried again after reset_timeout.
+Created: rggentil
+Date: 05/30/18
+'''
+
+
+import logging
+import random
+import threading
+from time import sleep, time
+
+
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_BASE_DELAY = 0.25  # seconds
+DEFAULT_MAX_DELAY = 4.0  # seconds
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_RESET_TIMEOUT = 60.0  # seconds
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+logger = logging.getLogger('rodbot')
+
+
+class CircuitOpenError(Exception):
+    '''
+    Error raised when a call is not done because the circuit breaker is open
+    '''
+
+
+class RetryPolicy(object):
+    '''
+    Policy of retries of a call with exponential backoff and full jitter
+    '''
+
+    def __init__(self, max_retries=DEFAULT_MAX_RETRIES, base_delay=DEFAULT_BASE_DELAY, max_delay=DEFAULT_MAX_DELAY,
+                 retry_on=(Exception,)):
+        '''
+        Constructor
+        :param max_retries: int, max number of retries after the first attempt
+        :param base_delay: float, max delay in seconds before the first retry, it's doubled in every retry
+        :param max_delay: float, max delay in seconds before any retry
+        :param retry_on: tuple of exception classes that are retried, the rest are raised straight away
+        '''
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+
+    def get_delay(self, retry):
+        '''
+        Get the delay before a retry. It's random between 0 and the exponential backoff, so clients that failed at the
+        same time don't retry at the same time.
+        :param retry: int, number of the retry, starting at 0
+        :return: float, seconds
+        '''
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** retry))
+
+    def call(self, func, *args, **kwargs):
+        '''
+        Call a function, retrying it if it raises one of the retry_on errors. If the error has a retry_after attribute
+        that is not None, like the errors of the responses with Retry-After header, the retry waits at least
+        retry_after seconds, and it's not retried if retry_after is greater than max_delay.
+        :param func: callable
+        :return: the result of func. The error of the last attempt is raised if all of them fail
+        '''
+        retry = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except self.retry_on as error:
+                retry_after = getattr(error, 'retry_after', None)
+                if retry >= self.max_retries or (retry_after is not None and retry_after > self.max_delay):
+                    raise
+                delay = max(self.get_delay(retry), retry_after or 0)
+                retry += 1
+                logger.warning('Error %r, retry %d of %d in %.2f seconds', error, retry, self.max_retries, delay)
+                sleep(delay)
+
+
+class CircuitBreaker(object):
+    '''
+    Circuit breaker of the calls to a service. It opens after failure_threshold consecutive failures and calls are
+    rejected while it's open. After reset_timeout a call is allowed to test the service (half open): the breaker is
+    closed if it succeeds and opened again if it fails.
+    '''
+
+    def __init__(self, name, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        '''
+        Constructor
+        :param name: str, name of the service, i.e. the exchange
+        :param failure_threshold: int, number of consecutive failures that open the breaker
+        :param reset_timeout: float, seconds that the breaker is open before testing the service again
+        '''
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        '''
+        Check if a call can be done. Only one call is allowed while the breaker is half open.
+        :return: boolean
+        '''
+        with self._lock:
+            if self.state == OPEN and time() - self.opened_at >= self.reset_timeout:
+                logger.info('Circuit breaker of %s half open, testing it again', self.name)
+                self.state = HALF_OPEN
+                return True
+            return self.state == CLOSED
+
+    def record_success(self):
+        with self._lock:
+            if self.state != CLOSED:
+                logger.info('Circuit breaker of %s closed', self.name)
+            self.state = CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                logger.error('Circuit breaker of %s open after %d failures, retrying in %s seconds', self.name,
+                             self.failures, self.reset_timeout)
+                self.state = OPEN
+                self.opened_at = time()
+
+    def call(self, func, *args, **kwargs):
+        '''
+        Call a function through the breaker
+        :param func: callable
+        :return: the result of func
+        :raise: CircuitOpenError if the breaker is open, or the error raised by func
+        '''
+        if not self.allow_request():
+            raise CircuitOpenError('Circuit breaker of {} is open'.format(self.name))
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record_failure()
+            raise
+        self.record_success()
+        return result
@@ -0,0 +1,146 @@
+'''
+This module includes the class Poller that runs a task periodically in its own thread, so that several exchanges can be
+polled from the same rodbot process, each one with its own interval, and a slow or failing exchange doesn't delay the
+others.
+Runs are scheduled on fixed ticks of the wall clock, so the time spent by the task doesn't delay the next runs, and
+pollers with the same interval run at the same time.
+Created: rggentil
+Date: 05/02/18
+'''
+
+
+import logging
+import math
+import threading
+from time import sleep, time
+
+
+SLEEP_THRESHOLD = 0.05  # Event.wait of python 2 polls every 50 ms at most, last part of the wait is done with sleep
+
+
+logger = logging.getLogger('rodbot')
+
+
+class StopPolling(Exception):
+    '''
+    Error raised by the task to stop its poller, i.e. when the exchange polled can't be used
+    '''
+
+
+class Poller(threading.Thread):
+    '''
+    Thread that runs a task every interval seconds until it is stopped
+    '''
+
+    def __init__(self, name, interval, task, stop_event=None, align=True):
+        '''
+        Constructor
+        :param name: str, name of the poller, i.e. the exchange polled
+        :param interval: float, seconds between two runs of the task
+        :param task: callable without arguments to run every interval
+        :param stop_event: threading.Event to stop the poller. Optional, several pollers can share the same event
+        :param align: boolean, True to run on the multiples of interval of the wall clock, so that pollers with the
+                      same interval run at the same time. Otherwise ticks start when the poller is started
+        '''
+        threading.Thread.__init__(self, name=name)
+        self.daemon = True
+        self.interval = interval
+        self.task = task
+        self.stop_event = stop_event or threading.Event()
+        self.align = align
+        self.runs = 0
+        self.errors = 0
+        self.overruns = 0
+        self.last_lateness = 0
+        self.max_lateness = 0
+        self._sum_lateness = 0
+        self._sum_squared_lateness = 0
+
+    def get_first_tick(self, now):
+        '''
+        Get the time of the first run of the task
+        :param now: float, current time
+        :return: float, time of the first tick
+        '''
+        if self.align:
+            return math.ceil(now / self.interval) * self.interval
+        return now
+
+    def run(self):
+        '''
+        Run the task on every tick until the poller is stopped, or until the task raises StopPolling. Other errors of the
+        task are logged but they don't stop the poller. If a run of the task takes longer than the interval, the ticks
+        missed are skipped and counted as overruns instead of running the task late several times in a row.
+        '''
+        logger.debug('Starting poller %s every %s seconds', self.name, self.interval)
+        next_tick = self.get_first_tick(time())
+        while self.wait_until(next_tick):
+            self.add_lateness(time() - next_tick)
+            try:
+                self.task()
+            except StopPolling:
+                self.runs += 1
+                break
+            except Exception:
+                self.errors += 1
+                logger.error('UNKNOWN ERROR in poller %s', self.name, exc_info=True)
+            self.runs += 1
+            next_tick += self.interval
+            now = time()
+            if now >= next_tick:
+                missed = int((now - next_tick) // self.interval) + 1
+                self.overruns += missed
+                next_tick += missed * self.interval
+                logger.warning('Poller %s overrun, %d ticks skipped', self.name, missed)
+            elif next_tick - now > 2 * self.interval:  # Wall clock set back, ticks are computed again from now
+                logger.warning('Poller %s clock changed, rescheduling', self.name)
+                next_tick = self.get_first_tick(now)
+        logger.debug('Poller %s stopped: %s', self.name, self.get_metrics())
+
+    def wait_until(self, tick):
+        '''
+        Wait until the time of a tick, or until the poller is stopped
+        :param tick: float, time of the tick
+        :return: boolean, True if the tick is reached, False if the poller is stopped
+        '''
+        remaining = tick - time()
+        while remaining > SLEEP_THRESHOLD:
+            if self.stop_event.wait(remaining - SLEEP_THRESHOLD):
+                return False
+            remaining = tick - time()
+        if remaining > 0:
+            sleep(remaining)
+        return not self.stop_event.is_set()
+
+    def add_lateness(self, lateness):
+        '''
+        Add the lateness of a run to the metrics
+        :param lateness: float, seconds between the tick and the actual start of the run
+        '''
+        self.last_lateness = lateness
+        self.max_lateness = max(self.max_lateness, lateness)
+        self._sum_lateness += lateness
+        self._sum_squared_lateness += lateness ** 2
+
+    def get_metrics(self):
+        '''
+        Get the metrics of the poller
+        :return: dict with the runs, errors and overruns (ticks skipped), and the lateness of the runs in seconds: last,
+                 max, mean and jitter (standard deviation)
+        '''
+        ticks = max(self.runs, 1)
+        mean_lateness = self._sum_lateness / ticks
+        jitter = math.sqrt(max(self._sum_squared_lateness / ticks - mean_lateness ** 2, 0))
+        return {'runs': self.runs,
+                'errors': self.errors,
+                'overruns': self.overruns,
+                'last_lateness': self.last_lateness,
+                'max_lateness': self.max_lateness,
+                'mean_lateness': mean_lateness,
+                'jitter': jitter}
+
+    def stop(self):
+        '''
+        Stop the poller, the task is not interrupted if it's running
+        '''
+        self.stop_event.set()
@@ -0,0 +1,134 @@
+'''
+This module includes the class Screen used by ApiExchange to screen the pairs of an exchange with filter and sort
+expressions over the columns of the market snapshot, i.e. "spread < 0.5% and volume_usd > 10k" sorted by "-range_24h".
+Expressions are parsed once when the Screen is built, and each filter is a vectorized comparison of a whole column, so
+screening doesn't loop over the pairs. Besides the fields of the stats, columns derived from them can be used, see
+DERIVED_COLUMNS, and volume_<currency> for the volume in any currency.
+Created: rggentil
+Date: 06/13/18
+'''
+
+
+from collections import namedtuple, OrderedDict
+import logging
+import numpy as np
+import re
+
+
+DERIVED_COLUMNS = ('mid_price', 'spread', 'range_24h')
+VOLUME_COLUMN_PREFIX = 'volume_'
+OPERATORS = OrderedDict([('<=', np.less_equal), ('>=', np.greater_equal), ('==', np.equal), ('!=', np.not_equal),
+                         ('<', np.less), ('>', np.greater)])
+MULTIPLIERS = {'': 1, '%': 0.01, 'k': 1e3, 'M': 1e6}
+CONDITION_REGEX = re.compile(r'^\s*(\w+)\s*({})\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*([%kM]?)\s*$'.format(
+    '|'.join(re.escape(operator) for operator in OPERATORS)))
+AND_REGEX = re.compile(r'\s+and\s+', re.IGNORECASE)
+
+
+logger = logging.getLogger('rodbot')
+
+
+Condition = namedtuple('Condition', ['column', 'operator', 'value'])
+
+
+class ScreenerError(ValueError):
+    '''
+    Error raised when a screen expression or column is not valid
+    '''
+
+
+class Screen(object):
+    '''
+    Screen of pairs: filters that all the pairs selected match, and the order of the pairs selected
+    '''
+
+    def __init__(self, filters='', sort_by=None, limit=None):
+        '''
+        Constructor
+        :param filters: str with conditions "column operator value" joined by "and", or list of str with the conditions.
+                        Operators are <, <=, >, >=, == and !=, and values can have a suffix % (percent), k (thousands)
+                        or M (millions). Pairs with nan in a column don't match any condition on it
+        :param sort_by: str, column to sort the pairs in ascending order, with prefix - for descending order. Optional,
+                        by default the pairs are in the order of the snapshot. Pairs with nan are the last ones
+        :param limit: int, max number of pairs selected. Optional
+        :raise: ScreenerError if any condition is not valid
+        '''
+        if isinstance(filters, basestring):
+            filters = AND_REGEX.split(filters.strip()) if filters.strip() else []
+        self.conditions = tuple(parse_condition(condition) for condition in filters)
+        self.sort_by = sort_by
+        self.descending = sort_by is not None and sort_by.startswith('-')
+        self.sort_column = sort_by.lstrip('-') if sort_by is not None else None
+        self.limit = limit
+        self.key = (self.conditions, sort_by, limit)
+
+    def __repr__(self):
+        return 'Screen({!r}, sort_by={!r}, limit={!r})'.format(
+            ' and '.join('{} {} {!r}'.format(*condition) for condition in self.conditions), self.sort_by, self.limit)
+
+    def get_columns(self):
+        '''
+        :return: set of str with the columns used by the screen
+        '''
+        columns = {condition.column for condition in self.conditions}
+        if self.sort_column is not None:
+            columns.add(self.sort_column)
+        return columns
+
+    def run(self, get_column, pairs):
+        '''
+        Screen the pairs
+        :param get_column: callable(name) that returns the numpy array of a column, with a value for each pair
+        :param pairs: list of str with the pairs of the columns
+        :return: list of str with the pairs selected
+        '''
+        selected = np.ones(len(pairs), dtype=bool)
+        with np.errstate(invalid='ignore'):
+            for column, operator, value in self.conditions:
+                selected &= OPERATORS[operator](get_column(column), value)
+        positions = np.flatnonzero(selected)
+        if self.sort_column is not None:
+            values = get_column(self.sort_column)[positions]
+            positions = positions[np.argsort(-values if self.descending else values, kind='mergesort')]
+        if self.limit is not None:
+            positions = positions[:self.limit]
+        logger.debug('%r selected %d of %d pairs', self, len(positions), len(pairs))
+        return [pairs[i] for i in positions]
+
+
+def parse_condition(condition):
+    '''
+    Function to parse a condition of a screen
+    :param condition: str "column operator value", i.e. "spread < 0.5%"
+    :return: Condition
+    :raise: ScreenerError if the condition is not valid
+    '''
+    match = CONDITION_REGEX.match(condition)
+    if match is None:
+        raise ScreenerError('Invalid screen condition "{}"'.format(condition))
+    column, operator, value, suffix = match.groups()
+    return Condition(column, operator, float(value) * MULTIPLIERS[suffix])
+
+
+def compute_column(columns, name):
+    '''
+    Function to compute a column derived from the fields of the stats of the pairs
+    :param columns: dict field-numpy array with the columns of a MarketSnapshot
+    :param name: str, one of DERIVED_COLUMNS
+    :return: read-only numpy array with a value for each pair, nan for the pairs without the fields needed
+    :raise: ScreenerError if the column is not known
+    '''
+    with np.errstate(invalid='ignore', divide='ignore'):
+        if name == 'mid_price':
+            quoted = (columns['highest_bid'] > 0) & (columns['lowest_ask'] > 0)
+            column = np.where(quoted, (columns['highest_bid'] + columns['lowest_ask']) / 2, np.nan)
+        elif name == 'spread':
+            mid_prices = compute_column(columns, 'mid_price')
+            column = (columns['lowest_ask'] - columns['highest_bid']) / mid_prices
+        elif name == 'range_24h':
+            traded = columns['last_price'] > 0
+            column = np.where(traded, (columns['high_24hr'] - columns['low_24hr']) / columns['last_price'], np.nan)
+        else:
+            raise ScreenerError('Unknown screen column "{}"'.format(name))
+    column.flags.writeable = False
+    return column
@@ -0,0 +1,149 @@
+'''
+This module includes the class SnapshotWriter that writes the output files of rodbot in a background thread, so the
+polling of the exchanges is not delayed by serializing and writing them. Files are written atomically: readers always
+see either the previous file or the new one, never a half written file.
+Created: rggentil
+Date: 05/25/18
+'''
+
+
+from collections import OrderedDict
+import json
+import logging
+import os
+import tempfile
+import threading
+from time import time
+
+
+DEFAULT_MAX_PENDING = 16
+FILE_MODE = 0o644
+
+
+logger = logging.getLogger('rodbot')
+
+
+class SnapshotWriter(threading.Thread):
+    '''
+    Thread that serializes and writes files from a bounded queue of pending writes
+    '''
+
+    def __init__(self, max_pending=DEFAULT_MAX_PENDING, serializer=json.dumps):
+        '''
+        Constructor
+        :param max_pending: int, max number of files pending to be written. When the queue is full the oldest pending
+                            file is discarded
+        :param serializer: callable that gets the data submitted and returns the str to write. json by default
+        '''
+        threading.Thread.__init__(self, name='snapshot_writer')
+        self.daemon = True
+        self.max_pending = max_pending
+        self.serializer = serializer
+        self._pending = OrderedDict()  # file_path-(data, serializer, submit time)
+        self._condition = threading.Condition()
+        self._stopping = False
+        self.written = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.errors = 0
+        self.last_write_latency = 0
+        self.max_write_latency = 0
+        self.total_write_latency = 0
+        self.last_queue_latency = 0
+
+    def submit(self, file_path, data, serializer=None):
+        '''
+        Queue a file to be written. If a write of the same file is pending, it's replaced by this one, only the latest
+        data of a file is written. Data must not be modified after submitting it.
+        :param file_path: str, path of the file
+        :param data: data of the file, it's serialized in the writer thread
+        :param serializer: callable to serialize data. Optional, serializer of the writer by default
+        '''
+        with self._condition:
+            if file_path in self._pending:
+                del self._pending[file_path]
+                self.coalesced += 1
+            elif len(self._pending) >= self.max_pending:
+                discarded_path, _ = self._pending.popitem(last=False)
+                self.dropped += 1
+                logger.warning('Snapshot writer queue full, discarding write of %s', discarded_path)
+            self._pending[file_path] = (data, serializer or self.serializer, time())
+            self._condition.notify()
+
+    def run(self):
+        '''
+        Write the pending files until the writer is stopped. Pending files are written before stopping.
+        '''
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopping:
+                    self._condition.wait()
+                if not self._pending:
+                    break
+                file_path, (data, serializer, submit_time) = self._pending.popitem(last=False)
+            start_time = time()
+            try:
+                write_atomic(file_path, serializer(data))
+            except Exception:
+                self.errors += 1
+                logger.error('Error writing file %s', file_path, exc_info=True)
+                continue
+            end_time = time()
+            self.written += 1
+            self.last_write_latency = end_time - start_time
+            self.max_write_latency = max(self.max_write_latency, self.last_write_latency)
+            self.total_write_latency += self.last_write_latency
+            self.last_queue_latency = end_time - submit_time
+
+    def stop(self, timeout=None):
+        '''
+        Stop the writer once the pending files are written
+        :param timeout: float, max seconds to wait for the writer. Optional, wait until it finishes by default
+        '''
+        with self._condition:
+            self._stopping = True
+            self._condition.notify()
+        self.join(timeout)
+
+    def get_metrics(self):
+        '''
+        Get the metrics of the writer
+        :return: dict with the queue depth, the number of files written, coalesced, dropped and failed, and the
+                 latencies of the writes in seconds
+        '''
+        with self._condition:
+            queue_depth = len(self._pending)
+        return {'queue_depth': queue_depth,
+                'written': self.written,
+                'coalesced': self.coalesced,
+                'dropped': self.dropped,
+                'errors': self.errors,
+                'last_write_latency': self.last_write_latency,
+                'max_write_latency': self.max_write_latency,
+                'avg_write_latency': self.total_write_latency / self.written if self.written else 0,
+                'last_queue_latency': self.last_queue_latency}
+
+
+def write_atomic(file_path, content):
+    '''
+    Function to write a file atomically. Content is written to a temporary file in the same directory that is renamed
+    to the final path once it's complete.
+    :param file_path: str, path of the file
+    :param content: str with the content of the file
+    '''
+    directory, file_name = os.path.split(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(prefix='.{}.'.format(file_name), dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(content)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp creates the file only readable by the owner, keep the permissions of a regular file instead
+        os.chmod(temp_path, os.stat(file_path).st_mode if os.path.exists(file_path) else FILE_MODE)
+        if os.name == 'nt' and os.path.exists(file_path):  # Windows can't rename over an existing file
+            os.remove(file_path)
+        os.rename(temp_path, file_path)
+    except Exception:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
@@ -0,0 +1,123 @@
+'''
+This module contains the unit tests for module analytics.
+Created by: rggentil
+Date: 18/06/06
+'''
+
+
+import unittest
+import numpy as np
+from analytics import RollingAnalytics, RingBuffer
+from market_snapshot import FIELDS, MarketSnapshot
+
+
+def get_snapshot(prices, volumes):
+    '''
+    Get a snapshot with the last price and base volume of some pairs
+    :param prices: dict pair-float
+    :param volumes: dict pair-float
+    :return: MarketSnapshot
+    '''
+    pairs = sorted(prices)
+    columns = {field: np.zeros(len(pairs)) for field in FIELDS}
+    columns['last_price'] = np.array([prices[pair_id] for pair_id in pairs], dtype=np.float64)
+    columns['base_volume'] = np.array([volumes[pair_id] for pair_id in pairs], dtype=np.float64)
+    return MarketSnapshot(pairs, columns)
+
+
+class TestRingBuffer(unittest.TestCase):
+    '''
+    Tests for RingBuffer class
+    '''
+
+    def test_running_sums(self):
+        ring_buffer = RingBuffer(3, columns=2)
+        for position, values in enumerate([[1., np.nan], [2., 4.], [3., 6.], [10., np.nan]]):
+            old_values = ring_buffer.push(position % 3, np.array(values))
+        np.testing.assert_array_equal(old_values, [1., np.nan])
+        np.testing.assert_array_equal(ring_buffer.counts, [3, 2])
+        np.testing.assert_allclose(ring_buffer.get_mean(), [5., 5.])
+        np.testing.assert_allclose(ring_buffer.get_std(), [np.std([2., 3., 10.], ddof=1), np.std([4., 6.], ddof=1)])
+
+        sums = ring_buffer.sums.copy()
+        ring_buffer.resync()
+        np.testing.assert_allclose(ring_buffer.sums, sums)
+
+    def test_add_columns(self):
+        ring_buffer = RingBuffer(2, columns=1)
+        ring_buffer.push(0, np.array([1.]))
+        ring_buffer.add_columns(2)
+        self.assertEquals(ring_buffer.values.shape, (2, 3))
+        np.testing.assert_array_equal(ring_buffer.get_mean(), [1., np.nan, np.nan])
+
+
+class TestRollingAnalytics(unittest.TestCase):
+    '''
+    Tests for RollingAnalytics class
+    '''
+
+    def test_stats_over_window(self):
+        window = 5
+        analytics = RollingAnalytics(window=window, ema_span=3)
+        random = np.random.RandomState(0)
+        prices = 1 + random.rand(3 * window + 2, 2)
+        volumes = random.rand(3 * window + 2, 2) * 100
+        ema = prices[0].copy()
+        for i in range(len(prices)):
+            analytics.update(get_snapshot(dict(zip(['AAA-BTC', 'BBB-BTC'], prices[i])),
+                                          dict(zip(['AAA-BTC', 'BBB-BTC'], volumes[i]))))
+            ema += 0.5 * (prices[i] - ema)
+
+        columns = analytics.get_columns()
+        np.testing.assert_allclose(columns['volume_ma'], volumes[-window:].mean(axis=0))
+        np.testing.assert_allclose(columns['price_ema'], ema)
+        returns = np.log(prices[1:] / prices[:-1])
+        np.testing.assert_allclose(columns['volatility'], returns[-window:].std(axis=0, ddof=1))
+        np.testing.assert_array_equal(columns['price_min'], prices[-window:].min(axis=0))
+        np.testing.assert_array_equal(columns['price_max'], prices[-window:].max(axis=0))
+        self.assertEquals(analytics.samples, len(prices))
+
+    def test_min_max_leaving_window(self):
+        analytics = RollingAnalytics(window=3)
+        for price in [5., 1., 3., 4., 2.]:
+            analytics.update(get_snapshot({'AAA-BTC': price}, {'AAA-BTC': 1.}))
+        stats = analytics.get_pair_stats('AAA-BTC')
+        self.assertEquals((stats['price_min'], stats['price_max']), (2., 4.))
+
+    def test_min_max_with_missing_prices(self):
+        window = 4
+        analytics = RollingAnalytics(window=window)
+        prices = 1 + np.random.RandomState(1).rand(3 * window + 1, 2)
+        prices[::3, 0] = np.nan  # Missing in some samples
+        prices[:window + 2, 1] = np.nan  # Without prices until the window is full
+        for i in range(len(prices)):
+            analytics.update(get_snapshot(dict(zip(['AAA-BTC', 'BBB-BTC'], prices[i])), {'AAA-BTC': 1., 'BBB-BTC': 1.}))
+            columns = analytics.get_columns()
+            with np.errstate(invalid='ignore'):
+                expected_min, expected_max = [np.array([function(column) if not np.isnan(column).all() else np.nan
+                                                        for column in prices[max(0, i - window + 1):i + 1].T])
+                                              for function in (np.nanmin, np.nanmax)]
+            np.testing.assert_array_equal(columns['price_min'], expected_min)
+            np.testing.assert_array_equal(columns['price_max'], expected_max)
+
+    def test_pairs_changing(self):
+        analytics = RollingAnalytics(window=4)
+        analytics.update(get_snapshot({'AAA-BTC': 1., 'BBB-BTC': 2.}, {'AAA-BTC': 10., 'BBB-BTC': 20.}))
+        analytics.update(get_snapshot({'AAA-BTC': 1., 'CCC-BTC': 3.}, {'AAA-BTC': 30., 'CCC-BTC': 40.}))
+        self.assertEquals(analytics.pairs, ['AAA-BTC', 'BBB-BTC', 'CCC-BTC'])
+        self.assertEquals(analytics.get_pair_stats('AAA-BTC')['volume_ma'], 20.)
+        self.assertEquals(analytics.get_pair_stats('BBB-BTC')['volume_ma'], 20.)  # Missing samples are not counted
+        self.assertEquals(analytics.get_pair_stats('CCC-BTC')['price_max'], 3.)
+        self.assertTrue(np.isnan(analytics.get_pair_stats('CCC-BTC')['volatility']))
+
+    def test_pair_without_trades(self):
+        analytics = RollingAnalytics(window=4)
+        for price in [2., 0., 4.]:
+            analytics.update(get_snapshot({'AAA-BTC': price}, {'AAA-BTC': 1.}))
+        stats = analytics.get_pair_stats('AAA-BTC')
+        self.assertEquals((stats['price_min'], stats['price_max']), (2., 4.))
+        self.assertTrue(np.isnan(stats['volatility']))  # Only one return, between 2 and 4
+
+
+if __name__ == '__main__':
+    unittest.main()
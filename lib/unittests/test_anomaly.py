@@ -0,0 +1,85 @@
+'''
+This module contains the unit tests for module anomaly.
+Created by: rggentil
+Date: 18/06/08
+'''
+
+
+import unittest
+import numpy as np
+from anomaly import AnomalyDetector, AnomalyEvent
+from market_snapshot import FIELDS, MarketSnapshot
+
+
+def get_snapshot(volumes, changes=None):
+    '''
+    Get a snapshot with the base volume and the change in 24h of some pairs
+    :param volumes: dict pair-float
+    :param changes: dict pair-float. Optional, 0 for all the pairs by default
+    :return: MarketSnapshot
+    '''
+    pairs = sorted(volumes)
+    columns = {field: np.zeros(len(pairs)) for field in FIELDS}
+    columns['base_volume'] = np.array([volumes[pair_id] for pair_id in pairs], dtype=np.float64)
+    if changes is not None:
+        columns['percent_changed_24hr'] = np.array([changes[pair_id] for pair_id in pairs], dtype=np.float64)
+    return MarketSnapshot(pairs, columns)
+
+
+class TestAnomalyDetector(unittest.TestCase):
+    '''
+    Tests for AnomalyDetector class
+    '''
+
+    def test_streaming_stats(self):
+        detector = AnomalyDetector()
+        volumes = np.random.RandomState(0).rand(20, 2) * 100
+        for row in volumes:
+            detector.update(get_snapshot({'AAA-BTC': row[0], 'BBB-BTC': row[1]}))
+        count, mean, std = detector.get_stats('BBB-BTC', 'base_volume')
+        self.assertEquals(count, 20)
+        self.assertAlmostEqual(mean, volumes[:, 1].mean())
+        self.assertAlmostEqual(std, volumes[:, 1].std(ddof=1))
+
+    def test_spike_reported(self):
+        detector = AnomalyDetector(min_samples=5)
+        for volume in [10., 11., 9., 10., 11., 9.]:
+            self.assertEquals(detector.update(get_snapshot({'AAA-BTC': volume, 'BBB-BTC': 5.},
+                                                           {'AAA-BTC': 1., 'BBB-BTC': volume})), [])
+        events = detector.update(get_snapshot({'AAA-BTC': 100., 'BBB-BTC': 5.}, {'AAA-BTC': 1., 'BBB-BTC': 10.}))
+        self.assertEquals([(event.pair, event.field, event.value, event.mean) for event in events],
+                          [('AAA-BTC', 'base_volume', 100., 10.)])
+        self.assertAlmostEqual(events[0].z_score, 90 / np.std([10., 11., 9., 10., 11., 9.], ddof=1))
+        self.assertEquals(detector.last_events, events)
+
+    def test_min_samples(self):
+        detector = AnomalyDetector(min_samples=5)
+        for volume in [10., 11., 100.]:
+            self.assertEquals(detector.update(get_snapshot({'AAA-BTC': volume})), [])
+
+    def test_same_snapshot_counted_once(self):
+        detector = AnomalyDetector(min_samples=2)
+        for volume in [10., 11., 100.]:
+            snapshot = get_snapshot({'AAA-BTC': volume})
+            events = detector.update(snapshot)
+        self.assertEquals(len(events), 1)
+        self.assertEquals(detector.update(snapshot), [])
+        self.assertEquals(detector.get_stats('AAA-BTC', 'base_volume')[0], 3)
+
+    def test_pairs_changing(self):
+        detector = AnomalyDetector(min_samples=2, threshold=2.)
+        detector.update(get_snapshot({'AAA-BTC': 10., 'BBB-BTC': 1.}))
+        detector.update(get_snapshot({'AAA-BTC': 11., 'CCC-BTC': 1.}))
+        detector.update(get_snapshot({'AAA-BTC': 10., 'BBB-BTC': 2., 'CCC-BTC': 1.}))
+        self.assertEquals(detector.pairs, ['AAA-BTC', 'BBB-BTC', 'CCC-BTC'])
+        self.assertEquals(detector.get_stats('BBB-BTC', 'base_volume')[0], 2)
+        self.assertEquals(detector.get_stats('CCC-BTC', 'base_volume'), (2, 1., 0.))
+        events = detector.update(get_snapshot({'AAA-BTC': 10., 'BBB-BTC': 1., 'CCC-BTC': 2.}))
+        self.assertEquals(events, [])  # CCC-BTC has no deviation
+        events = detector.update(get_snapshot({'AAA-BTC': 20., 'BBB-BTC': 1., 'CCC-BTC': 1.}))
+        self.assertEquals([event.pair for event in events], ['AAA-BTC'])
+        self.assertIsInstance(events[0], AnomalyEvent)
+
+
+if __name__ == '__main__':
+    unittest.main()
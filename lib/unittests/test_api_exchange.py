@@ -1,6 +1,6 @@
 '''
 This module contains the unit tests for module api_exchange.
-In general the requests.get method is mocked to returned a pre-defined json instead of requesting exchange for
+In general the requests.Session.get method is mocked to returned a pre-defined json instead of requesting exchange for
 performance reasons and not depending on third parties.
 Created by: rggentil
 Date: 18/04/16
@@ -8,11 +8,31 @@ Date: 18/04/16
 
 
 import json
+import os
+import shutil
+import tempfile
 import unittest
-from mock import patch
+import warnings
+from mock import patch, MagicMock
 import requests
 import ut_constants
-from api_exchange import ApiExchange, COBINHOOD, get_currency_multiplier, ApiExchangeError
+from api_exchange import ApiExchange, COBINHOOD, get_currency_multiplier, ApiExchangeError, API_URLS, \
+    get_quote_rates, is_currency_available, parse_retry_after
+from market_delta import DeltaStream, read_market
+from screener import Screen, ScreenerError
+
+
+def set_response(mock_get, data, headers=None):
+    '''
+    Set the response returned by the mock of requests.Session.get
+    :param mock_get: mock of requests.Session.get
+    :param data: json of the response
+    :param headers: dict with the headers of the response. Optional
+    '''
+    mock_get.return_value.status_code = 200
+    mock_get.return_value.headers = headers or {}
+    mock_get.return_value.content = json.dumps(data)
+    mock_get.return_value.json.return_value = data
 
 
 class TestApiExchange(unittest.TestCase):
@@ -21,21 +41,38 @@ class TestApiExchange(unittest.TestCase):
     '''
 
     def setUp(self):
-        self.mock_get_json = patch('api_exchange.requests.get')
+        self.mock_get_json = patch('api_exchange.requests.Session.get')
         # self.addCleanup(self.mock_get_json.stop) We supposed need this in order to avoid mock on if set up fails
         # but if I leave this the tests don't work. NEET TO BE STUDY
         self.mock_get = self.mock_get_json.start()
-        self.mock_get.return_value.json.return_value = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+        self.mock_sleep = patch('resilience.sleep')  # Retries don't wait
+        self.mock_sleep.start()
+        set_response(self.mock_get, json.loads(ut_constants.COBINHOOD_PAIRS_STATS))
         self.api_cobinhood = ApiExchange(COBINHOOD)
         self.cobinhood_pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)['result']
 
     def tearDown(self):
         self.mock_get_json.stop()
+        self.mock_sleep.stop()
 
     def test_get_pairs_stats(self):
         self.assertEquals(self.api_cobinhood.get_pairs_stats(), self.cobinhood_pairs_stats)
         self.assertEquals(self.api_cobinhood.get_pairs_stats('all'), self.cobinhood_pairs_stats)
         self.assertEquals(self.api_cobinhood.get_pairs_stats('BTC-USDT'), self.cobinhood_pairs_stats['BTC-USDT'])
+        self.assertRaises(KeyError, self.api_cobinhood.get_pairs_stats, 'XXX-BTC')
+
+    def test_get_pairs_stats_of_pairs_decoded_once(self):
+        decoder = self.api_cobinhood.decoder
+        with patch.object(decoder, 'loads', wraps=decoder.loads) as mock_loads:
+            for pair_id in ['ETH-BTC', 'BTC-USDT']:
+                self.assertEquals(self.api_cobinhood.get_pairs_stats(pair_id), self.cobinhood_pairs_stats[pair_id])
+            self.assertFalse(mock_loads.called)  # Same stats decoded by the constructor
+            stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+            stats['result']['ETH-BTC']['last_price'] = '1'
+            set_response(self.mock_get, stats)
+            for pair_id in ['ETH-BTC', 'BTC-USDT']:
+                self.assertEquals(self.api_cobinhood.get_pairs_stats(pair_id), stats['result'][pair_id])
+            self.assertEquals(mock_loads.call_count, 1)
 
     def test_get_pairs_by_volume(self):
         # Volume by pair itself
@@ -49,7 +86,48 @@ class TestApiExchange(unittest.TestCase):
                             for k, v in json.loads(ut_constants.COBINHOOD_PAIRS_STATS)['result'].iteritems()}
             self.assertEquals(self.api_cobinhood.get_pairs_by_volume(currency=currency), pairs_volume)
 
-        self.assertRaises(AttributeError, self.api_cobinhood.get_pairs_by_volume, currency='ENJ')
+        self.assertRaises(AttributeError, self.api_cobinhood.get_pairs_by_volume, currency='EUR')
+
+    def test_get_pairs_by_volumes(self):
+        pairs_volumes = self.api_cobinhood.get_pairs_by_volumes()
+        self.assertItemsEqual(pairs_volumes.keys(), ['USD', 'BTC', 'ETH'])
+        for currency, pairs_volume in pairs_volumes.iteritems():
+            self.assertEquals(pairs_volume, self.api_cobinhood.get_pairs_by_volume(currency=currency))
+        self.assertEquals(self.api_cobinhood.get_volumes(['BTC', 'ETH']).shape, (2, len(self.cobinhood_pairs_stats)))
+        self.assertRaises(AttributeError, self.api_cobinhood.get_pairs_by_volumes, ['USD', 'EUR'])
+
+    def test_update_stats_delta(self):
+        self.assertEquals(self.api_cobinhood.last_delta.added, tuple(sorted(self.cobinhood_pairs_stats)))
+        self.assertFalse(self.api_cobinhood.update_stats())
+
+        pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+        pairs_stats['result']['ETH-BTC']['last_price'] = '0.1'
+        set_response(self.mock_get, pairs_stats)
+        delta = self.api_cobinhood.update_stats()
+        self.assertEquals(delta.sequence, 2)
+        self.assertEquals(delta.changed_pairs, set(['ETH-BTC']))
+        self.assertEquals(self.api_cobinhood.eth_btc.last_price, 0.1)
+
+    def test_rebuild_market_from_delta_stream(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        file_path = os.path.join(temp_dir, 'delta.jsonl')
+        stream = DeltaStream(file_path, self.api_cobinhood.get_full_delta())
+        pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+        for pair_id, field, value in [('ETH-BTC', 'last_price', '0.1'), ('COB-ETH', 'base_volume', '10'),
+                                      ('NEW-BTC', None, None), ('ABT-ETH', None, None)]:
+            if field is not None:
+                pairs_stats['result'][pair_id][field] = value
+            elif pair_id in pairs_stats['result']:
+                del pairs_stats['result'][pair_id]
+            else:
+                pairs_stats['result'][pair_id] = dict(pairs_stats['result']['COB-BTC'], id=pair_id)
+            set_response(self.mock_get, pairs_stats)
+            stream.write(self.api_cobinhood.update_stats())
+        stream.close()
+        snapshot = self.api_cobinhood.snapshot
+        self.assertEquals(read_market(file_path), {pair_id: snapshot.get_pair_values(pair_id)
+                                                   for pair_id in snapshot.pairs})
 
     def test_update_basic_pairs(self):
         self.assertEquals(self.api_cobinhood.btc_usd.last_price,
@@ -59,6 +137,164 @@ class TestApiExchange(unittest.TestCase):
         self.assertEquals(self.api_cobinhood.eth_btc.last_price,
                           float(self.cobinhood_pairs_stats['ETH-BTC']["last_price"]))
 
+    def test_track_pairs(self):
+        cob_eth, eth_btc = self.api_cobinhood.track(['COB-ETH', 'ETH-BTC'])
+        self.assertIs(eth_btc, self.api_cobinhood.eth_btc)
+        self.assertEquals(cob_eth.volume, float(self.cobinhood_pairs_stats['COB-ETH']['base_volume']))
+        self.assertRaises(AttributeError, self.api_cobinhood.track, ['BTCUSDT'])
+
+        pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+        pairs_stats['result']['COB-ETH']['base_volume'] = '10'
+        set_response(self.mock_get, pairs_stats)
+        self.api_cobinhood.update_stats()
+        self.assertEquals(cob_eth.volume, 10)
+
+        self.api_cobinhood.untrack(['COB-ETH'])
+        self.assertNotIn('COB-ETH', self.api_cobinhood.tracked_pairs)
+        self.assertIsNone(cob_eth.volume)
+
+    def test_track_callbacks(self):
+        changes, failing_callback = [], MagicMock(side_effect=ValueError)
+        callback = lambda tracked_pair, pair_changes: changes.append((tracked_pair.pair_name, pair_changes))
+        self.api_cobinhood.track(['COB-ETH', 'ETH-BTC'], callback)
+        self.api_cobinhood.track(['ETH-BTC'], failing_callback)
+
+        pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+        old_last_price = float(pairs_stats['result']['ETH-BTC']['last_price'])
+        pairs_stats['result']['ETH-BTC']['last_price'] = '0.1'
+        pairs_stats['result']['ABT-ETH']['last_price'] = '0.1'  # Not tracked
+        set_response(self.mock_get, pairs_stats)
+        self.api_cobinhood.update_stats()
+        self.assertEquals(changes, [('ETH-BTC', {'last_price': (old_last_price, 0.1)})])
+        self.assertEquals(failing_callback.call_count, 1)
+
+        self.api_cobinhood.untrack(['ETH-BTC'], callback)
+        pairs_stats['result']['ETH-BTC']['last_price'] = '0.2'
+        set_response(self.mock_get, pairs_stats)
+        self.api_cobinhood.update_stats()
+        self.assertEquals(len(changes), 1)
+        self.assertEquals(failing_callback.call_count, 2)
+        self.assertEquals(self.api_cobinhood.eth_btc.last_price, 0.2)
+
+    def test_untrack_shared_pairs(self):
+        cob_eth, = self.api_cobinhood.track(['COB-ETH'])
+        self.api_cobinhood.track(['COB-ETH', 'ABT-ETH'])
+        self.api_cobinhood.untrack(['COB-ETH', 'ABT-ETH'])
+        self.assertIn('COB-ETH', self.api_cobinhood.tracked_pairs)  # Still tracked by the first call
+        self.assertNotIn('ABT-ETH', self.api_cobinhood.tracked_pairs)
+        self.assertIsNotNone(cob_eth.volume)
+        self.api_cobinhood.untrack(['COB-ETH', 'ETH-BTC'])
+        self.assertNotIn('COB-ETH', self.api_cobinhood.tracked_pairs)
+        self.assertIn('ETH-BTC', self.api_cobinhood.tracked_pairs)  # Basic pairs are always tracked
+        self.assertIsNotNone(self.api_cobinhood.eth_btc.last_price)
+
+    def test_untrack_more_than_tracked(self):
+        self.api_cobinhood.untrack(['ETH-BTC'])
+        self.api_cobinhood.untrack(['ETH-BTC'])
+        self.api_cobinhood.track(['ETH-BTC'])
+        self.api_cobinhood.untrack(['ETH-BTC'])
+        self.assertEquals(self.api_cobinhood._track_counts['ETH-BTC'], 0)
+        self.assertIn('ETH-BTC', self.api_cobinhood.tracked_pairs)
+        self.api_cobinhood.track(['COB-ETH'])
+        self.api_cobinhood.track(['COB-ETH'])
+        self.api_cobinhood.untrack(['COB-ETH'])
+        self.api_cobinhood.untrack(['COB-ETH'])
+        self.api_cobinhood.untrack(['COB-ETH'])
+        self.assertNotIn('COB-ETH', self.api_cobinhood.tracked_pairs)
+        self.assertNotIn('COB-ETH', self.api_cobinhood._track_counts)
+
+    def test_track_removed_pair(self):
+        callback = MagicMock()
+        self.api_cobinhood.track(['COB-ETH'], callback)
+        old_volume = float(self.cobinhood_pairs_stats['COB-ETH']['base_volume'])
+        pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+        del pairs_stats['result']['COB-ETH']
+        set_response(self.mock_get, pairs_stats)
+        self.api_cobinhood.update_stats()
+        tracked_pair, changes = callback.call_args[0]
+        self.assertEquals(tracked_pair.pair_name, 'COB-ETH')
+        self.assertEquals(changes['base_volume'], (old_volume, None))
+        self.assertIsNone(tracked_pair.volume)
+
+    def test_update_basic_pairs_deprecated(self):
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always')
+            self.api_cobinhood.update_basic_pairs()
+        self.assertEquals([warning.category for warning in caught], [DeprecationWarning])
+
+    def test_get_order_books(self):
+        orderbook = {'sequence': 7, 'bids': [['0.05', '1', '2.5'], ['0.049', '2', '1']], 'asks': [['0.051', '1', '3']]}
+        set_response(self.mock_get, {'success': True, 'result': {'orderbook': orderbook}})
+        order_books = self.api_cobinhood.get_order_books(['ETH-BTC', 'COB-ETH'], limit=10)
+        self.assertEquals(sorted(order_books), ['COB-ETH', 'ETH-BTC'])
+        self.assertEquals(order_books['ETH-BTC'].sequence, 7)
+        self.assertEquals(order_books['ETH-BTC'].bids.get_best_price(), 0.05)
+        requested_urls = sorted(call[0][0] for call in self.mock_get.call_args_list[-2:])
+        self.assertEquals(requested_urls, [API_URLS[COBINHOOD] + '/market/orderbooks/COB-ETH?limit=10',
+                                           API_URLS[COBINHOOD] + '/market/orderbooks/ETH-BTC?limit=10'])
+
+        set_response(self.mock_get, {'success': False, 'error': {'error_code': 'invalid_trading_pair'}})
+        self.assertRaises(ApiExchangeError, self.api_cobinhood.get_order_book, 'XXX-BTC')
+
+    def test_get_order_books_failing(self):
+        book_content = json.dumps({'success': True, 'result': {'orderbook': {'bids': [], 'asks': []}}})
+
+        def get(url, **kwargs):
+            if 'XXX-BTC' in url:
+                raise requests.ConnectionError
+            return MagicMock(status_code=200, headers={}, content=book_content)
+
+        self.mock_get.side_effect = get
+        self.assertEquals(sorted(self.api_cobinhood.get_order_books(['ETH-BTC', 'XXX-BTC', 'COB-ETH'])),
+                          ['COB-ETH', 'ETH-BTC'])
+        for _ in range(self.api_cobinhood.order_book_breaker.failure_threshold):
+            self.assertEquals(self.api_cobinhood.get_order_books(['XXX-BTC']), {})
+        self.assertEquals(self.api_cobinhood.order_book_breaker.state, 'open')
+        self.assertEquals(self.api_cobinhood.circuit_breaker.state, 'closed')  # Stats are still requested
+
+    def test_screen(self):
+        stats = self.cobinhood_pairs_stats
+        volumes_usd = dict(self.api_cobinhood.get_pairs_volume_sorted(currency='USD'))
+        spreads = {pair_id: (float(pair_stats['lowest_ask']) - float(pair_stats['highest_bid'])) * 2 /
+                   (float(pair_stats['lowest_ask']) + float(pair_stats['highest_bid']))
+                   for pair_id, pair_stats in stats.iteritems() if float(pair_stats['highest_bid']) > 0}
+        expected_pairs = [pair_id for pair_id, spread in spreads.iteritems()
+                          if spread < 0.02 and volumes_usd[pair_id] > 10000]
+        expected_pairs.sort(key=lambda pair_id: -float(stats[pair_id]['base_volume']))
+        self.assertTrue(expected_pairs)
+        pairs = self.api_cobinhood.screen('spread < 2% and volume_usd > 10k', sort_by='-base_volume')
+        self.assertEquals(pairs, expected_pairs)
+        self.assertIs(self.api_cobinhood.screen(Screen(['spread < 2%', 'volume_usd > 10k'], '-base_volume')), pairs)
+        self.assertEquals(self.api_cobinhood.screen('spread < 2% and volume_usd > 10k', '-base_volume', limit=1),
+                          expected_pairs[:1])
+
+        self.assertRaises(ScreenerError, self.api_cobinhood.screen, 'liquidity > 10')
+        self.assertRaises(ScreenerError, self.api_cobinhood.screen, 'volume_xyz > 10')
+
+    def test_stats_listeners(self):
+        listener, failing_listener = MagicMock(), MagicMock(side_effect=ValueError)
+        self.api_cobinhood.add_stats_listener(failing_listener)
+        self.api_cobinhood.add_stats_listener(listener)
+        pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+        set_response(self.mock_get, pairs_stats)
+        delta = self.api_cobinhood.update_stats()
+        listener.assert_called_once_with(self.api_cobinhood.snapshot, delta)
+
+        self.api_cobinhood.update_stats()  # Unchanged stats are a sample too
+        self.assertEquals(listener.call_count, 2)
+
+        self.mock_get.side_effect = requests.ConnectionError
+        self.api_cobinhood.update_stats()  # Stale stats are not
+        self.assertEquals(listener.call_count, 2)
+        self.assertEquals(failing_listener.call_count, 2)
+
+        self.api_cobinhood.remove_stats_listener(listener)
+        self.mock_get.side_effect = None
+        pairs_stats['result']['ETH-BTC']['last_price'] = '0.1'
+        set_response(self.mock_get, pairs_stats)
+        self.api_cobinhood.update_stats()
+        self.assertEquals(listener.call_count, 2)
+
     def test_currency_multiplier(self):
         self.assertEquals(get_currency_multiplier(self.cobinhood_pairs_stats, 'BTC')['LTC-BTC'], 1)
         self.assertEquals(get_currency_multiplier(self.cobinhood_pairs_stats, 'BTC')['COB-BTC'], 1)
@@ -78,7 +314,29 @@ class TestApiExchange(unittest.TestCase):
                           1 / self.api_cobinhood.eth_usd.last_price)
         self.assertEquals(get_currency_multiplier(self.cobinhood_pairs_stats, 'BTC')['CMT-COB'],
                           float(self.cobinhood_pairs_stats['COB-BTC']["last_price"]))
-        self.assertRaises(AttributeError, get_currency_multiplier, self.cobinhood_pairs_stats, 'ENJ')
+        self.assertRaises(AttributeError, get_currency_multiplier, self.cobinhood_pairs_stats, 'EUR')
+
+    def test_currency_multiplier_any_currency(self):
+        cob_multiplier = get_currency_multiplier(self.cobinhood_pairs_stats, 'COB')
+        self.assertEquals(cob_multiplier['CMT-COB'], 1)
+        self.assertEquals(cob_multiplier['LTC-BTC'], 1 / float(self.cobinhood_pairs_stats['COB-BTC']["last_price"]))
+        self.assertEquals(cob_multiplier['ENJ-ETH'], 1 / float(self.cobinhood_pairs_stats['COB-ETH']["last_price"]))
+        self.assertEquals(cob_multiplier['LTC-USDT'], 1 / float(self.cobinhood_pairs_stats['COB-USDT']["last_price"]))
+
+        # ENJ only has last price against ETH, so BTC is converted to ETH and then to ENJ
+        enj_eth_rate = 1 / float(self.cobinhood_pairs_stats['ENJ-ETH']["last_price"])
+        enj_multiplier = get_currency_multiplier(self.cobinhood_pairs_stats, 'ENJ')
+        self.assertEquals(enj_multiplier['COB-ETH'], enj_eth_rate)
+        self.assertEquals(enj_multiplier['COB-BTC'], 1 / self.api_cobinhood.eth_btc.last_price * enj_eth_rate)
+
+        eos_volume = self.api_cobinhood.get_pairs_by_volume(currency='EOS')
+        self.assertAlmostEqual(eos_volume['EOS-BTC'], float(self.cobinhood_pairs_stats['EOS-BTC']["base_volume"]))
+
+    def test_currency_available(self):
+        for currency in ['USD', 'BTC', 'ETH', 'COB']:
+            self.assertTrue(is_currency_available(self.api_cobinhood.snapshot, currency))
+        self.assertFalse(is_currency_available(self.api_cobinhood.snapshot, 'XXX'))
+        self.assertRaises(AttributeError, get_quote_rates, self.api_cobinhood.snapshot, 'XXX')
 
     def test_get_pairs_volume_sorted(self):
         list_pairs_volume = [(k, v) for k, v in
@@ -98,15 +356,98 @@ class TestApiExchange(unittest.TestCase):
         self.assertEquals(self.api_cobinhood.get_pairs_volume_sorted(currency='ETH', reverse=False),
                           sorted(list_pairs_volume, key=lambda x: x[1], reverse=False))
 
+    def test_get_pairs_volume_sorted_without_conversion(self):
+        pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+        pairs_stats['result']['AAA-XXX'] = dict(pairs_stats['result']['COB-BTC'], id='AAA-XXX')  # XXX not connected
+        set_response(self.mock_get, pairs_stats)
+        self.api_cobinhood.update_stats()
+        pairs_volume_sorted = self.api_cobinhood.get_pairs_volume_sorted(currency='USD')
+        self.assertNotIn('AAA-XXX', [pair_id for pair_id, _ in pairs_volume_sorted])
+        self.assertEquals(len(pairs_volume_sorted), len(self.cobinhood_pairs_stats))
+        json.dumps(pairs_volume_sorted, allow_nan=False)  # Valid json, without NaN
+
+    def test_get_top_pairs(self):
+        pairs_volume_sorted = self.api_cobinhood.get_pairs_volume_sorted(currency='USD')
+        top_pairs = self.api_cobinhood.get_top_pairs(10, currency='USD')
+        self.assertEquals(top_pairs, pairs_volume_sorted[:10])
+
+        bottom_pairs = self.api_cobinhood.get_top_pairs(5, currency='BTC', bottom=True)
+        self.assertEquals([v for _, v in bottom_pairs],
+                          sorted(self.api_cobinhood.get_pairs_by_volume(currency='BTC').values())[:5])
+
+        self.assertEquals(len(self.api_cobinhood.get_top_pairs(1000)), len(self.cobinhood_pairs_stats))
+        self.assertEquals(self.api_cobinhood.get_top_pairs(0), [])
+
+    def test_volumes_computed_once(self):
+        with patch('api_exchange.get_quote_rates', wraps=get_quote_rates) as mock_get_quote_rates:
+            self.api_cobinhood.get_top_pairs(10, currency='USD')
+            self.api_cobinhood.get_pairs_by_volume(currency='USD')
+            self.api_cobinhood.get_pairs_volume_sorted(currency='USD')
+            self.assertEquals(mock_get_quote_rates.call_count, 1)
+
+            self.api_cobinhood.update_stats()  # Same stats, volumes are kept
+            self.api_cobinhood.get_top_pairs(10, currency='USD')
+            self.assertEquals(mock_get_quote_rates.call_count, 1)
+
+            pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+            pairs_stats['result']['ETH-BTC']['base_volume'] = '1000'
+            set_response(self.mock_get, pairs_stats)
+            self.api_cobinhood.update_stats()
+            self.api_cobinhood.get_top_pairs(10, currency='USD')
+            self.assertEquals(mock_get_quote_rates.call_count, 2)
+
+    def test_views_cached_per_snapshot(self):
+        e = self.api_cobinhood
+        with patch('api_exchange.get_currency_multiplier', wraps=get_currency_multiplier) as mock_multiplier:
+            views = [e.get_pairs_by_volume(), e.get_pairs_volume_sorted(), e.get_pairs_without_volume(),
+                     e.get_top_pairs(5), e.get_currency_multiplier('BTC')]
+            self.assertTrue(all(view is cached_view for view, cached_view in zip(
+                views, [e.get_pairs_by_volume(), e.get_pairs_volume_sorted(), e.get_pairs_without_volume(),
+                        e.get_top_pairs(5), e.get_currency_multiplier('BTC')])))
+            self.assertEquals(mock_multiplier.call_count, 1)
+
+            pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+            pairs_stats['result']['ETH-BTC']['base_volume'] = '0'
+            set_response(self.mock_get, pairs_stats)
+            e.update_stats()
+            self.assertIsNot(e.get_pairs_without_volume(), views[2])
+            self.assertIn('ETH-BTC', e.get_pairs_without_volume())
+            e.get_currency_multiplier('BTC')
+            self.assertEquals(mock_multiplier.call_count, 2)
+
     @patch('api_exchange.ApiExchange.get_all_pairs')
     def test_is_pair_in_exchange(self, mock_get_all_pairs):
         mock_get_all_pairs.return_value = ut_constants.COBINHOOD_PAIRS
         self.assertTrue(self.api_cobinhood.is_pair_in_exchange('BTC-USDT'))
         self.assertFalse(self.api_cobinhood.is_pair_in_exchange('PST-EUR'))
         self.assertFalse(self.api_cobinhood.is_pair_in_exchange('MORTADELOS-EUR'))
+        self.assertEquals(mock_get_all_pairs.call_count, 1)
+        self.assertEquals(self.api_cobinhood.are_pairs_in_exchange(['BTC-USDT', 'ETH-BTC', 'PST-EUR', 'BTCUSDT']),
+                          {'BTC-USDT': True, 'ETH-BTC': True, 'PST-EUR': False, 'BTCUSDT': False})
+        self.assertEquals(mock_get_all_pairs.call_count, 1)
+
+    @patch('api_exchange.time')
+    @patch('api_exchange.ApiExchange.get_all_pairs')
+    def test_pairs_index_expiry(self, mock_get_all_pairs, mock_time):
+        mock_get_all_pairs.return_value = ut_constants.COBINHOOD_PAIRS
+        mock_time.return_value = 1000
+        self.assertEquals(self.api_cobinhood.get_pairs_index(), frozenset(ut_constants.COBINHOOD_PAIRS))
+        mock_time.return_value = 1000 + self.api_cobinhood.pairs_ttl - 1
+        self.assertTrue(self.api_cobinhood.is_pair_in_exchange('BTC-USDT'))
+        self.assertEquals(mock_get_all_pairs.call_count, 1)
+
+        mock_time.return_value = 1000 + self.api_cobinhood.pairs_ttl
+        mock_get_all_pairs.return_value = ['ETH-BTC']
+        self.assertFalse(self.api_cobinhood.is_pair_in_exchange('BTC-USDT'))
+        self.assertEquals(mock_get_all_pairs.call_count, 2)
 
-    @patch('api_exchange.requests.get')
+        self.api_cobinhood.invalidate_pairs_index()
+        self.assertTrue(self.api_cobinhood.is_pair_in_exchange('ETH-BTC'))
+        self.assertEquals(mock_get_all_pairs.call_count, 3)
+
+    @patch('api_exchange.requests.Session.get')
     def test_error_connection(self, mock_connection_error):
+        set_response(mock_connection_error, json.loads(ut_constants.COBINHOOD_PAIRS_STATS))
         e = ApiExchange(COBINHOOD)
 
         mock_connection_error.side_effect = requests.ConnectionError
@@ -115,6 +456,103 @@ class TestApiExchange(unittest.TestCase):
 
         self.assertRaises(ApiExchangeError, ApiExchange, COBINHOOD)
 
+    def test_retry_transient_error(self):
+        response = self.mock_get.return_value
+        self.mock_get.side_effect = [requests.ConnectionError, requests.Timeout, response]
+        self.assertEquals(self.api_cobinhood.get_pairs_stats(), self.cobinhood_pairs_stats)
+        self.assertEquals(self.mock_get.call_count, 4)
+
+    def test_retry_status_code(self):
+        response = self.mock_get.return_value
+        unavailable_response = MagicMock(status_code=503, headers={'Retry-After': '0.1'})
+        self.mock_get.side_effect = [unavailable_response, response]
+        self.assertEquals(self.api_cobinhood.get_pairs_stats(), self.cobinhood_pairs_stats)
+        self.assertEquals(self.mock_get.call_count, 3)
+
+        self.mock_get.side_effect = None
+        self.mock_get.return_value = unavailable_response
+        self.assertRaises(ApiExchangeError, self.api_cobinhood.get_pairs_stats)
+        self.assertEquals(self.api_cobinhood.circuit_breaker.failures, 1)
+        self.assertEquals(parse_retry_after('Wed, 21 Oct 2015 07:28:00 GMT'), 0)
+        self.assertIsNone(parse_retry_after('soon'))
+
+    def test_error_status_code(self):
+        self.mock_get.return_value = MagicMock(status_code=404, headers={})
+        calls = self.mock_get.call_count
+        self.assertRaises(ApiExchangeError, self.api_cobinhood.get_pairs_stats)
+        self.assertEquals(self.mock_get.call_count, calls + 1)  # Not retried
+        self.assertEquals(self.api_cobinhood.circuit_breaker.failures, 1)
+
+    def test_unknown_error(self):
+        self.mock_get.side_effect = TypeError
+        self.assertRaises(ApiExchangeError, self.api_cobinhood.get_pairs_stats)
+        self.assertEquals(self.mock_get.call_count, 2)  # Not retried
+        self.mock_get.side_effect = None
+        self.mock_get.return_value.content = 'invalid json'
+        self.mock_get.return_value.json.side_effect = ValueError
+        self.assertRaises(ApiExchangeError, self.api_cobinhood.get_pairs_stats)
+
+    def test_circuit_breaker_serves_stale_stats(self):
+        snapshot = self.api_cobinhood.snapshot
+        self.mock_get.side_effect = requests.ConnectionError
+        for _ in range(self.api_cobinhood.circuit_breaker.failure_threshold):
+            self.assertFalse(self.api_cobinhood.update_stats())
+            self.assertTrue(self.api_cobinhood.stale)
+            self.assertIs(self.api_cobinhood.snapshot, snapshot)
+        calls = self.mock_get.call_count
+        self.assertFalse(self.api_cobinhood.update_stats())
+        self.assertEquals(self.mock_get.call_count, calls)  # Breaker open, exchange not requested
+        self.assertEquals(self.api_cobinhood.get_pairs_by_volume()['ETH-BTC'],
+                          float(self.cobinhood_pairs_stats['ETH-BTC']['base_volume']))
+
+        self.mock_get.side_effect = None
+        self.api_cobinhood.circuit_breaker.opened_at -= self.api_cobinhood.circuit_breaker.reset_timeout
+        self.api_cobinhood.update_stats()
+        self.assertFalse(self.api_cobinhood.stale)
+        self.assertEquals(self.api_cobinhood.circuit_breaker.state, 'closed')
+
+    def test_requests_share_session(self):
+        session = self.api_cobinhood.session
+        self.api_cobinhood.update_stats()
+        self.api_cobinhood.update_stats()
+        self.assertIs(self.api_cobinhood.session, session)
+        self.mock_get.assert_called_with('{}/market/stats'.format(API_URLS[COBINHOOD]),
+                                         timeout=self.api_cobinhood.timeout, headers={})
+
+    def test_session_pool_size(self):
+        e = ApiExchange(COBINHOOD, pool_size=3, timeout=1)
+        adapter = e.session.get_adapter(API_URLS[COBINHOOD])
+        self.assertEquals(adapter._pool_maxsize, 3)
+        self.assertEquals(e.timeout, 1)
+        self.assertEquals(e.session.headers['Connection'], 'keep-alive')
+        self.assertIn('gzip', e.session.headers['Accept-Encoding'])
+
+    def test_conditional_request(self):
+        pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+        pairs_stats['result']['ETH-BTC']['last_price'] = '0.1'
+        set_response(self.mock_get, pairs_stats, {'ETag': '"v1"', 'Last-Modified': 'Wed, 30 May 2018 10:00:00 GMT'})
+        self.assertTrue(self.api_cobinhood.update_stats())
+        snapshot = self.api_cobinhood.snapshot
+
+        self.mock_get.return_value.status_code = 304
+        self.mock_get.return_value.json.reset_mock()
+        self.assertFalse(self.api_cobinhood.update_stats())
+        self.assertEquals(self.mock_get.call_args[1]['headers'],
+                          {'If-None-Match': '"v1"', 'If-Modified-Since': 'Wed, 30 May 2018 10:00:00 GMT'})
+        self.assertFalse(self.mock_get.return_value.json.called)
+        self.assertIs(self.api_cobinhood.snapshot, snapshot)
+        self.assertEquals(self.api_cobinhood.transfer_stats['not_modified'], 1)
+
+    def test_unchanged_body_not_parsed(self):
+        self.mock_get.return_value.json.reset_mock()
+        snapshot = self.api_cobinhood.snapshot
+        delta = self.api_cobinhood.update_stats()
+        self.assertFalse(delta)
+        self.assertEquals(delta.sequence, 1)
+        self.assertFalse(self.mock_get.return_value.json.called)
+        self.assertIs(self.api_cobinhood.snapshot, snapshot)
+        self.assertEquals(self.api_cobinhood.transfer_stats['unchanged'], 1)
+
     def test_get_pairs_without_volume(self):
         pairs_no_volume = [k for k, v in self.cobinhood_pairs_stats.iteritems() if float(v['base_volume']) == 0]
         self.assertItemsEqual(self.api_cobinhood.get_pairs_without_volume(), pairs_no_volume)
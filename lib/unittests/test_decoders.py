@@ -0,0 +1,31 @@
+'''
+This module contains the unit tests for module decoders.
+Created by: rggentil
+Date: 18/06/01
+'''
+
+
+import json
+import unittest
+import ut_constants
+from decoders import JsonDecoder, BACKENDS, DEFAULT_BACKEND
+
+
+class TestJsonDecoder(unittest.TestCase):
+    '''
+    Tests for JsonDecoder class
+    '''
+
+    def setUp(self):
+        self.pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
+
+    def test_backends(self):
+        self.assertIn('json', BACKENDS)
+        self.assertEquals(JsonDecoder().backend, DEFAULT_BACKEND)
+        for backend in BACKENDS:
+            self.assertEquals(JsonDecoder(backend).loads(ut_constants.COBINHOOD_PAIRS_STATS), self.pairs_stats)
+        self.assertRaises(ValueError, JsonDecoder, 'unknown')
+
+
+if __name__ == "__main__":
+    unittest.main()
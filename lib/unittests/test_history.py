@@ -0,0 +1,166 @@
+'''
+This module contains the unit tests for module history.
+Created by: rggentil
+Date: 18/05/22
+'''
+
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import ut_constants
+from history import HistoryStore, HistoryReader, CHUNK_DIR, FIELD_BY_PAIR_FILE, FIELD_FILE
+from market_snapshot import MarketSnapshot, FIELDS
+
+
+class TestHistoryStore(unittest.TestCase):
+    '''
+    Tests for HistoryStore class
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)['result']
+        self.store = HistoryStore('cobinhood', directory=self.directory, chunk_rows=4)
+        self.addCleanup(self.store.close)
+
+    def get_snapshot(self, last_price):
+        self.pairs_stats['BTC-USDT']['last_price'] = str(last_price)
+        return MarketSnapshot.from_stats(self.pairs_stats)
+
+    def test_append_and_read(self):
+        for i in range(10):
+            self.store.append(self.get_snapshot(1000 + i), timestamp=100 + i)
+        self.assertTrue(os.path.isdir(os.path.join(self.store.path, CHUNK_DIR.format(2))))
+        self.assertEquals(self.store.get_chunk_times().tolist(), [100, 104, 108])
+
+        times, values = self.store.read('BTC-USDT')
+        self.assertEquals(times.tolist(), range(100, 110))
+        self.assertEquals(values['last_price'].tolist(), range(1000, 1010))
+        self.assertEquals(sorted(values), sorted(FIELDS))
+        self.assertEquals(values['base_volume'].tolist(), [float(self.pairs_stats['BTC-USDT']['base_volume'])] * 10)
+
+        times, values = self.store.read('BTC-USDT', start=103, end=106, fields=['last_price'])
+        self.assertEquals(times.tolist(), [103, 104, 105])
+        self.assertEquals(values, {'last_price': values['last_price']})
+        self.assertEquals(values['last_price'].tolist(), [1003, 1004, 1005])
+
+        times, values = self.store.read('NOT-FOUND')
+        self.assertEquals(len(times), 0)
+        self.assertEquals(len(values['last_price']), 0)
+
+    def test_reopen_store(self):
+        self.store.append(self.get_snapshot(1), timestamp=1)
+        self.store.close()
+        store = HistoryStore('cobinhood', directory=self.directory, chunk_rows=4)
+        self.addCleanup(store.close)
+        store.append(self.get_snapshot(2), timestamp=2)
+        self.assertEquals(store.get_chunk_times().tolist(), [1])
+        self.assertEquals(store.read('BTC-USDT', fields=['last_price'])[1]['last_price'].tolist(), [1, 2])
+
+    def test_reopen_after_crash(self):
+        self.store.append(self.get_snapshot(1), timestamp=1)
+        self.store.close()
+        chunk_path = os.path.join(self.store.path, CHUNK_DIR.format(0))
+        with open(os.path.join(chunk_path, 'last_price.f64'), 'ab') as f:
+            f.write(np.zeros(3).tobytes())  # Partial row without time
+        os.makedirs(os.path.join(self.store.path, CHUNK_DIR.format(1)))  # Chunk without index
+        store = HistoryStore('cobinhood', directory=self.directory, chunk_rows=2)
+        self.addCleanup(store.close)
+        for i in range(2, 5):
+            store.append(self.get_snapshot(i), timestamp=i)
+        self.assertEquals(store.get_chunk_times().tolist(), [1, 3])
+        self.assertEquals(store.read('BTC-USDT', fields=['last_price'])[1]['last_price'].tolist(), [1, 2, 3, 4])
+
+    def test_finished_chunks_by_pair(self):
+        for i in range(5):
+            self.store.append(self.get_snapshot(i), timestamp=i)
+        for chunk, finished in [(0, True), (1, False)]:
+            chunk_path = os.path.join(self.store.path, CHUNK_DIR.format(chunk))
+            for field in FIELDS:
+                self.assertEquals(os.path.exists(os.path.join(chunk_path, FIELD_BY_PAIR_FILE.format(field))), finished)
+                self.assertEquals(os.path.exists(os.path.join(chunk_path, FIELD_FILE.format(field))), not finished)
+        by_pair = np.fromfile(os.path.join(self.store.path, CHUNK_DIR.format(0), FIELD_BY_PAIR_FILE.format(
+            'last_price')), dtype=np.float64).reshape(-1, 4)
+        position = sorted(self.pairs_stats).index('BTC-USDT')
+        self.assertEquals(by_pair[position].tolist(), [0, 1, 2, 3])
+
+    def test_reopen_while_finishing_chunk(self):
+        for i in range(4):
+            self.store.append(self.get_snapshot(i), timestamp=i)
+        self.store.close()
+        chunk_path = os.path.join(self.store.path, CHUNK_DIR.format(0))
+        rows = np.fromfile(os.path.join(chunk_path, FIELD_FILE.format('last_price')), dtype=np.float64).reshape(4, -1)
+        with open(os.path.join(chunk_path, FIELD_BY_PAIR_FILE.format('last_price')), 'wb') as f:
+            f.write(rows.T.tobytes())  # Process died after rewriting only one field of the full chunk
+        store = HistoryStore('cobinhood', directory=self.directory, chunk_rows=4)
+        self.addCleanup(store.close)
+        for field in FIELDS:
+            self.assertTrue(os.path.exists(os.path.join(chunk_path, FIELD_BY_PAIR_FILE.format(field))))
+            self.assertFalse(os.path.exists(os.path.join(chunk_path, FIELD_FILE.format(field))))
+        store.append(self.get_snapshot(4), timestamp=4)
+        self.assertEquals(store.get_chunk_times().tolist(), [0, 4])
+        self.assertEquals(store.read('BTC-USDT', fields=['last_price'])[1]['last_price'].tolist(), range(5))
+
+    def test_pairs_changes(self):
+        self.store.append(self.get_snapshot(1), timestamp=1)
+        removed_pair_stats = self.pairs_stats.pop('ETH-BTC')
+        self.store.append(self.get_snapshot(2), timestamp=2)
+        self.pairs_stats['NEW-BTC'] = removed_pair_stats
+        self.store.append(self.get_snapshot(3), timestamp=3)
+
+        self.assertEquals(self.store.get_chunk_times().tolist(), [1, 3])
+        times, values = self.store.read('ETH-BTC', fields=['last_price'])
+        self.assertEquals(times.tolist(), [1, 2])
+        self.assertTrue(np.isnan(values['last_price'][1]))
+        times, values = self.store.read('NEW-BTC', fields=['last_price'])
+        self.assertEquals(times.tolist(), [3])
+
+
+class TestHistoryReader(unittest.TestCase):
+    '''
+    Tests for HistoryReader class
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)['result']
+        self.store = HistoryStore('cobinhood', directory=self.directory, chunk_rows=4)
+        self.addCleanup(self.store.close)
+        for i in range(6):
+            self.append(i)
+        self.reader = HistoryReader('cobinhood', directory=self.directory)
+
+    def append(self, i):
+        self.pairs_stats['BTC-USDT']['last_price'] = str(1000 + i)
+        self.store.append(MarketSnapshot.from_stats(self.pairs_stats), timestamp=100 + i)
+
+    def test_zero_copy_slices(self):
+        slices = list(self.reader.iter_slices('BTC-USDT', start=102, fields=['last_price']))
+        self.assertEquals(len(slices), 2)
+        self.assertEquals([times.tolist() for times, _ in slices], [[102, 103], [104, 105]])
+        self.assertEquals([values['last_price'].tolist() for _, values in slices], [[1002, 1003], [1004, 1005]])
+        for times, values in slices:
+            self.assertIsInstance(values['last_price'], np.memmap)
+            self.assertFalse(values['last_price'].flags.owndata)
+            self.assertFalse(values['last_price'].flags.writeable)
+        # Values of the finished chunk are contiguous, in the last chunk they are a column of its rows
+        self.assertEquals([values['last_price'].flags.c_contiguous for _, values in slices], [True, False])
+
+    def test_read_last_chunk_grows(self):
+        self.assertEquals(self.reader.read('BTC-USDT', fields=['last_price'])[1]['last_price'].tolist(),
+                          range(1000, 1006))
+        self.append(6)
+        times, values = self.reader.read('BTC-USDT', start=103)
+        self.assertEquals(times.tolist(), [103, 104, 105, 106])
+        self.assertEquals(values['last_price'].tolist(), [1003, 1004, 1005, 1006])
+        self.assertEquals(values['base_volume'].tolist(), [float(self.pairs_stats['BTC-USDT']['base_volume'])] * 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
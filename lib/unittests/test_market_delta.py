@@ -0,0 +1,117 @@
+'''
+This module contains the unit tests for module market_delta.
+Created by: rggentil
+Date: 18/05/18
+'''
+
+
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+import unittest
+import ut_constants
+from market_snapshot import MarketSnapshot
+from market_delta import MarketDelta, DeltaStream, DeltaTracker, get_market_delta, read_delta_stream, read_market
+
+
+class TestMarketDelta(unittest.TestCase):
+    '''
+    Tests for MarketDelta class and get_market_delta function
+    '''
+
+    def setUp(self):
+        self.cobinhood_pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)['result']
+        self.snapshot = MarketSnapshot.from_stats(self.cobinhood_pairs_stats)
+
+    def test_no_changes(self):
+        delta = get_market_delta(self.snapshot, MarketSnapshot.from_stats(self.cobinhood_pairs_stats))
+        self.assertFalse(delta)
+        self.assertEquals(delta.changed_pairs, set())
+
+    def test_first_snapshot(self):
+        delta = get_market_delta(None, self.snapshot)
+        self.assertEquals(delta.added, self.snapshot.pairs)
+        self.assertEquals(delta.changed_pairs, set(self.snapshot.pairs))
+
+    def test_changed_fields(self):
+        self.cobinhood_pairs_stats['BTC-USDT']['last_price'] = '10000'
+        self.cobinhood_pairs_stats['BTC-USDT']['base_volume'] = '0.5'
+        self.cobinhood_pairs_stats['COB-ETH']['high_24hr'] = '1'
+        delta = get_market_delta(self.snapshot, MarketSnapshot.from_stats(self.cobinhood_pairs_stats), sequence=3)
+        self.assertEquals(delta.sequence, 3)
+        self.assertEquals(delta.changed_pairs, set(['BTC-USDT', 'COB-ETH']))
+        self.assertEquals(sorted(delta.changed['BTC-USDT']), ['base_volume', 'last_price'])
+        self.assertEquals(delta.changed['BTC-USDT']['last_price'],
+                          (self.snapshot.get_value('BTC-USDT', 'last_price'), 10000))
+        self.assertEquals(delta.changed['COB-ETH'].keys(), ['high_24hr'])
+
+        delta = get_market_delta(self.snapshot, MarketSnapshot.from_stats(self.cobinhood_pairs_stats),
+                                 thresholds={'base_volume': 1e9, 'last_price': 1e9})
+        self.assertEquals(delta.changed_pairs, set(['COB-ETH']))
+
+    def test_tracker_drift(self):
+        tracker = DeltaTracker(thresholds={'last_price': 1.5})
+        tracker.update(self.snapshot)
+        old_price = self.snapshot.get_value('BTC-USDT', 'last_price')
+        deltas = []
+        for i in range(1, 5):
+            self.cobinhood_pairs_stats['BTC-USDT']['last_price'] = str(old_price + i)
+            if i == 2:
+                del self.cobinhood_pairs_stats['ETH-BTC']  # Pairs changing don't lose the reported values
+            deltas.append(tracker.update(MarketSnapshot.from_stats(self.cobinhood_pairs_stats), sequence=i))
+        self.assertEquals([bool(delta.changed) for delta in deltas], [False, True, False, True])
+        self.assertEquals(deltas[1].changed['BTC-USDT']['last_price'], (old_price, old_price + 2))
+        self.assertEquals(deltas[3].changed['BTC-USDT']['last_price'], (old_price + 2, old_price + 4))
+        self.assertEquals(deltas[1].removed, ('ETH-BTC',))
+
+    def test_added_removed_pairs(self):
+        del self.cobinhood_pairs_stats['BTC-USDT']
+        self.cobinhood_pairs_stats['NEW-BTC'] = dict(self.cobinhood_pairs_stats['COB-BTC'], id='NEW-BTC')
+        self.cobinhood_pairs_stats['COB-BTC']['lowest_ask'] = '1'
+        delta = get_market_delta(self.snapshot, MarketSnapshot.from_stats(self.cobinhood_pairs_stats))
+        self.assertEquals(delta.added, ('NEW-BTC',))
+        self.assertEquals(delta.removed, ('BTC-USDT',))
+        self.assertEquals(delta.changed.keys(), ['COB-BTC'])
+        self.assertEquals(delta.changed_pairs, set(['COB-BTC', 'NEW-BTC']))
+
+    def test_delta_stream(self):
+        self.cobinhood_pairs_stats['BTC-USDT']['last_price'] = '10000'
+        deltas = [get_market_delta(None, self.snapshot),
+                  get_market_delta(self.snapshot, MarketSnapshot.from_stats(self.cobinhood_pairs_stats), sequence=1)]
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        stream = DeltaStream(os.path.join(temp_dir, 'delta.jsonl'))
+        for delta in deltas:
+            stream.write(delta)
+        stream.close()
+        self.assertEquals(list(read_delta_stream(stream.file_path)), deltas)
+        self.assertEquals(MarketDelta.from_dict(deltas[1].to_dict()).changed, deltas[1].changed)
+
+    def test_delta_stream_restart(self):
+        temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, temp_dir)
+        file_path = os.path.join(temp_dir, 'delta.jsonl')
+        stream = DeltaStream(file_path, get_market_delta(None, self.snapshot))
+        self.cobinhood_pairs_stats['COB-BTC']['last_price'] = 'nan'
+        del self.cobinhood_pairs_stats['ETH-BTC']
+        new_snapshot = MarketSnapshot.from_stats(self.cobinhood_pairs_stats)
+        stream.write(get_market_delta(self.snapshot, new_snapshot, sequence=1))
+        stream.write(get_market_delta(new_snapshot, new_snapshot, sequence=2))  # Empty, not written
+        stream.close()
+        self.assertEquals(len(list(read_delta_stream(file_path))), 2)
+        market = read_market(file_path)
+        self.assertEquals(sorted(market), list(new_snapshot.pairs))
+        self.assertTrue(np.isnan(market['COB-BTC']['last_price']))
+
+        # After a restart the stream starts again from a full delta
+        DeltaStream(file_path, get_market_delta(None, self.snapshot)).close()
+        self.assertEquals(read_market(file_path), {pair_id: self.snapshot.get_pair_values(pair_id)
+                                                   for pair_id in self.snapshot.pairs})
+        with open(file_path) as f:
+            self.assertNotIn('NaN', f.read())
+
+
+if __name__ == "__main__":
+    unittest.main()
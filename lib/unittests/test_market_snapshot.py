@@ -0,0 +1,83 @@
+'''
+This module contains the unit tests for module market_snapshot.
+Created by: rggentil
+Date: 18/05/08
+'''
+
+
+import json
+import unittest
+import ut_constants
+from market_snapshot import MarketSnapshot, FIELDS
+
+
+class TestMarketSnapshot(unittest.TestCase):
+    '''
+    Tests for MarketSnapshot class
+    '''
+
+    def setUp(self):
+        self.cobinhood_pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)['result']
+        self.snapshot = MarketSnapshot.from_stats(self.cobinhood_pairs_stats)
+
+    def test_columns(self):
+        self.assertEquals(len(self.snapshot), len(self.cobinhood_pairs_stats))
+        for field in FIELDS:
+            self.assertEquals(len(self.snapshot.columns[field]), len(self.snapshot))
+        for pair_id, pair_stats in self.cobinhood_pairs_stats.iteritems():
+            self.assertIn(pair_id, self.snapshot)
+            for field in FIELDS:
+                self.assertEquals(self.snapshot.get_value(pair_id, field), float(pair_stats[field]))
+
+    def test_stable_index(self):
+        other_snapshot = MarketSnapshot.from_stats(json.loads(ut_constants.COBINHOOD_PAIRS_STATS)['result'])
+        self.assertEquals(self.snapshot.index, other_snapshot.index)
+        self.assertEquals(self.snapshot.pairs, tuple(sorted(self.cobinhood_pairs_stats)))
+
+    def test_quote_currencies(self):
+        self.assertIn('BTC', self.snapshot.quote_currencies)
+        self.assertIn('USDT', self.snapshot.quote_currencies)
+        for pair_id, i in self.snapshot.index.iteritems():
+            self.assertEquals(self.snapshot.quote_currencies[self.snapshot.quote_index[i]], pair_id.split('-')[1])
+
+    def test_conversion_rates(self):
+        def pair_stats(last_price, base_volume):
+            stats = {field: '1' for field in FIELDS}
+            stats.update(last_price=str(last_price), base_volume=str(base_volume))
+            return stats
+
+        # AAA can be converted to CCC through BBB or through DDD, the path through DDD has more liquidity
+        snapshot = MarketSnapshot.from_stats({'AAA-BBB': pair_stats(2, 10), 'BBB-CCC': pair_stats(4, 10),
+                                              'AAA-DDD': pair_stats(3, 100), 'CCC-DDD': pair_stats(0.5, 100),
+                                              'EEE-FFF': pair_stats(1, 1), 'GGG-CCC': pair_stats(0, 0)})
+        rates = snapshot.get_conversion_rates('CCC')
+        self.assertEquals(rates['CCC'], 1)
+        self.assertEquals(rates['BBB'], 4)
+        self.assertEquals(rates['DDD'], 2)
+        self.assertEquals(rates['AAA'], 6)
+        self.assertNotIn('EEE', rates)
+        self.assertNotIn('GGG', rates)
+        self.assertIs(snapshot.get_conversion_rates('CCC'), rates)
+
+        # Liquidity of AAA-BBB is 20 BBB, 2000 CCC, and liquidity of AAA-DDD is 300 DDD, only 3 CCC
+        snapshot = MarketSnapshot.from_stats({'AAA-BBB': pair_stats(2, 10), 'BBB-CCC': pair_stats(100, 10),
+                                              'AAA-DDD': pair_stats(3, 100), 'CCC-DDD': pair_stats(100, 100)})
+        self.assertEquals(snapshot.get_conversion_rates('CCC')['AAA'], 200)
+
+    def test_get_pair_values(self):
+        pair_values = self.snapshot.get_pair_values('BTC-USDT')
+        self.assertEquals(sorted(pair_values), sorted(FIELDS))
+        self.assertEquals(pair_values['last_price'], float(self.cobinhood_pairs_stats['BTC-USDT']['last_price']))
+
+    def test_to_dict(self):
+        pairs_volume = self.snapshot.to_dict(self.snapshot.columns['base_volume'])
+        self.assertEquals(pairs_volume, {k: float(v['base_volume']) for k, v in self.cobinhood_pairs_stats.iteritems()})
+
+    def test_empty_snapshot(self):
+        snapshot = MarketSnapshot.from_stats({})
+        self.assertEquals(len(snapshot), 0)
+        self.assertNotIn('BTC-USDT', snapshot)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+'''
+This module contains the unit tests for module order_book.
+Created by: rggentil
+Date: 18/06/11
+'''
+
+
+import unittest
+import numpy as np
+from order_book import OrderBook, BookSide
+
+
+class TestBookSide(unittest.TestCase):
+    '''
+    Tests for BookSide class
+    '''
+
+    def test_levels_sorted(self):
+        bids = BookSide([['9', '1', '1'], ['10', '2', '3'], ['8', '1', '0']], descending=True)
+        np.testing.assert_array_equal(bids.prices, [10., 9.])
+        np.testing.assert_array_equal(bids.sizes, [3., 1.])
+        asks = BookSide([['12', '1', '2'], ['11', '1', '1']])
+        np.testing.assert_array_equal(asks.prices, [11., 12.])
+        np.testing.assert_array_equal(asks.get_cumulative_sizes(), [1., 3.])
+
+    def test_apply_update(self):
+        bids = BookSide([['10', '1', '1'], ['8', '1', '1']], descending=True)
+        bids.apply_update(9., 2., 1)  # Inserted between the levels
+        bids.apply_update(10., 5., 3)  # Replaced
+        bids.apply_update(8., 0.)  # Deleted
+        bids.apply_update(7., 0.)  # Not in the book
+        np.testing.assert_array_equal(bids.prices, [10., 9.])
+        np.testing.assert_array_equal(bids.sizes, [5., 2.])
+        np.testing.assert_array_equal(bids.counts, [3., 1.])
+
+    def test_apply_update_over_capacity(self):
+        asks = BookSide()
+        prices = np.random.RandomState(0).permutation(100) + 1.
+        for price in prices:
+            asks.apply_update(price, price)
+        np.testing.assert_array_equal(asks.prices, np.arange(1., 101.))
+        np.testing.assert_array_equal(asks.sizes, np.arange(1., 101.))
+        for price in prices[:50]:
+            asks.apply_update(price, 0)
+        np.testing.assert_array_equal(asks.prices, np.sort(prices[50:]))
+
+
+class TestOrderBook(unittest.TestCase):
+    '''
+    Tests for OrderBook class
+    '''
+
+    def setUp(self):
+        self.order_book = OrderBook.from_json('AAA-BTC', {
+            'sequence': 3,
+            'bids': [['99', '1', '1'], ['98', '1', '2'], ['90', '1', '4']],
+            'asks': [['101', '1', '1'], ['102', '1', '3'], ['103', '1', '5']]})
+
+    def test_depth(self):
+        self.assertEquals(self.order_book.get_mid_price(), 100.)
+        bid_depths, ask_depths = self.order_book.get_depth([0.005, 0.01, 0.02, 0.5])
+        np.testing.assert_array_equal(bid_depths, [0., 1., 3., 7.])
+        np.testing.assert_array_equal(ask_depths, [0., 1., 4., 9.])
+
+    def test_gap_metrics(self):
+        self.assertEquals(self.order_book.get_gap_metrics(), {'spread': 0.02, 'max_bid_gap': 0.08, 'bid_gap_depth': 3.,
+                                                              'max_ask_gap': 0.01, 'ask_gap_depth': 1.})
+        self.assertEquals(OrderBook('AAA-BTC', asks=[['101', '1', '1']]).get_gap_metrics(), {})
+
+    def test_apply_updates(self):
+        self.assertTrue(self.order_book.apply_updates(bids=[['95', '1', '2']], asks=[['101', '0', '0']], sequence=4))
+        self.assertEquals(self.order_book.sequence, 4)
+        self.assertEquals(self.order_book.asks.get_best_price(), 102.)
+        self.assertAlmostEqual(self.order_book.get_gap_metrics()['max_bid_gap'], 5 / 100.5)
+
+        self.assertFalse(self.order_book.apply_updates(bids=[['99', '0', '0']], sequence=4))  # Old update
+        self.assertEquals(self.order_book.bids.get_best_price(), 99.)
+
+
+if __name__ == '__main__':
+    unittest.main()
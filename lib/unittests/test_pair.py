@@ -1,6 +1,6 @@
 '''
 This module contains the unit tests for module pair.
-In general the requests.get method is mocked to returned a pre-defined json instead of requesting exchange for
+In general the requests.Session.get method is mocked to returned a pre-defined json instead of requesting exchange for
 performance reasons and not depending on third parties.
 Created by: rggentil
 Date: 18/04/16
@@ -12,6 +12,7 @@ import pair
 from api_exchange import COBINHOOD
 import unittest2 as unittest
 from mock import patch
+from market_snapshot import MarketSnapshot
 import ut_constants
 
 
@@ -67,7 +68,7 @@ class TestPair(unittest.TestCase):
 
         self.assertRaises(KeyError, my_pair.update_values, values_data=my_pair_values_error)
 
-    @patch('lib.api_exchange.requests.get')
+    @patch('lib.api_exchange.requests.Session.get')
     def test_update_pair_with_request(self, mock_get_json):
         mock_get_json.return_value.json.return_value = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)
 
@@ -92,6 +93,77 @@ class TestPair(unittest.TestCase):
         check_pair_data(my_pair1, pair_data1)
         check_pair_data(my_pair2, pair_data2)
 
+    def test_update_pair_with_market_dict(self):
+        my_pair = pair.Pair(pair_name='ETH-BTC', exchange=COBINHOOD, registry=pair.PairRegistry(COBINHOOD))
+        self.assertIsNone(my_pair.last_price)
+        pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)['result']
+        my_pair.update_values(pairs_stats)
+        self.assertEquals(my_pair.last_price, float(pairs_stats['ETH-BTC']['last_price']))
+
+    def test_pair_slots(self):
+        my_pair = pair.Pair(pair_name='ETH-BTC', exchange=COBINHOOD)
+        self.assertFalse(hasattr(my_pair, '__dict__'))
+        self.assertRaises(AttributeError, setattr, my_pair, 'unknown', 1)
+        self.assertEquals((my_pair.base_currency, my_pair.quote_currency), ('ETH', 'BTC'))
+        self.assertIs(my_pair.base_currency, pair.Pair(pair_name='ETH-USDT', exchange=COBINHOOD).base_currency)
+
+
+class TestPairRegistry(unittest.TestCase):
+    '''
+    Tests for PairRegistry class
+    '''
+
+    def setUp(self):
+        self.registry = pair.PairRegistry(COBINHOOD)
+        self.pairs_stats = json.loads(ut_constants.COBINHOOD_PAIRS_STATS)['result']
+        self.snapshot = MarketSnapshot.from_stats(self.pairs_stats)
+
+    def test_pairs_share_row(self):
+        pair1 = pair.Pair(pair_name='ETH-BTC', exchange=COBINHOOD, registry=self.registry)
+        pair2 = pair.Pair(pair_name='ETH-BTC', exchange=COBINHOOD, registry=self.registry)
+        pair1.last_price = 0.5
+        self.assertEquals(pair2.last_price, 0.5)
+        self.assertEquals(len(self.registry), 1)
+
+    def test_pairs_without_registry(self):
+        pair1 = pair.Pair(pair_name='ETH-BTC', exchange=COBINHOOD)
+        pair2 = pair.Pair(pair_name='ETH-BTC', exchange=COBINHOOD)
+        pair1.last_price = 0.5
+        self.assertIsNone(pair2.last_price)
+        self.assertIsNot(pair1.registry, pair2.registry)
+
+    def test_update_from_snapshot(self):
+        pair_ids = sorted(self.pairs_stats)[:pair.INITIAL_CAPACITY + 4] + ['XXX-BTC']  # More than initial capacity
+        pairs = [pair.Pair(pair_name=pair_id, exchange=COBINHOOD, registry=self.registry) for pair_id in pair_ids]
+        self.assertEquals(self.registry.update_from_snapshot(self.snapshot), ['XXX-BTC'])
+        for my_pair in pairs[:-1]:
+            self.assertEquals(my_pair.volume, float(self.pairs_stats[my_pair.pair_name]['base_volume']))
+            self.assertEquals(my_pair.lowest_ask, float(self.pairs_stats[my_pair.pair_name]['lowest_ask']))
+        self.assertIsNone(pairs[-1].volume)
+
+        self.pairs_stats['ETH-BTC']['last_price'] = '0.5'
+        new_pair = pair.Pair(pair_name='ETH-BTC', exchange=COBINHOOD, registry=self.registry)
+        self.registry.update_from_snapshot(MarketSnapshot.from_stats(self.pairs_stats))
+        self.assertEquals(new_pair.last_price, 0.5)
+
+    def test_remove_reuses_rows(self):
+        pair_ids = sorted(self.pairs_stats)
+        for _ in range(3):  # Churn of pairs, the array doesn't grow
+            pairs = [pair.Pair(pair_name=pair_id, exchange=COBINHOOD, registry=self.registry) for pair_id in pair_ids]
+            self.registry.update_from_snapshot(self.snapshot)
+            for my_pair in pairs:
+                self.assertEquals(my_pair.volume, float(self.pairs_stats[my_pair.pair_name]['base_volume']))
+            for pair_id in pair_ids:
+                self.registry.remove(pair_id)
+            self.assertEquals(len(self.registry), 0)
+        self.assertEquals(len(self.registry.pairs), len(pair_ids))
+
+        self.registry.remove('ETH-BTC')  # Not in the registry anymore
+        new_pair = pair.Pair(pair_name='XXX-BTC', exchange=COBINHOOD, registry=self.registry)
+        self.assertIsNone(new_pair.volume)
+        self.assertEquals(self.registry.update_from_snapshot(self.snapshot), ['XXX-BTC'])
+        self.assertEquals(len(self.registry.pairs), len(pair_ids))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,72 @@
+'''
+This module contains the unit tests for module ranking.
+Created by: rggentil
+Date: 18/05/15
+'''
+
+
+import json
+import unittest
+import numpy as np
+import ut_constants
+from market_snapshot import MarketSnapshot
+from ranking import VolumeRanking, RankEvent, ENTERED, DROPPED, UP, DOWN
+
+
+class TestVolumeRanking(unittest.TestCase):
+    '''
+    Tests for VolumeRanking class
+    '''
+
+    def setUp(self):
+        self.pairs = ('AAA-BTC', 'BBB-BTC', 'CCC-BTC', 'DDD-BTC')
+        self.ranking = VolumeRanking(top_n=2)
+
+    def test_first_update(self):
+        events = self.ranking.update(self.pairs, np.array([1., 4., 3., 2.]))
+        self.assertEquals(events, [RankEvent(ENTERED, 'BBB-BTC', None, 1), RankEvent(ENTERED, 'CCC-BTC', None, 2)])
+        self.assertEquals(self.ranking.get_top(), [('BBB-BTC', 4), ('CCC-BTC', 3)])
+        self.assertEquals(self.ranking.get_rank('AAA-BTC'), 4)
+        self.assertEquals(len(self.ranking), 4)
+
+    def test_rank_changes(self):
+        self.ranking.update(self.pairs, np.array([1., 4., 3., 2.]))
+        events = self.ranking.update(self.pairs, np.array([5., 4., 3., 2.]))
+        self.assertEquals(events, [RankEvent(ENTERED, 'AAA-BTC', None, 1), RankEvent(DOWN, 'BBB-BTC', 1, 2),
+                                   RankEvent(DROPPED, 'CCC-BTC', 2, None)])
+        events = self.ranking.update(self.pairs, np.array([5., 4., 3., 6.]))
+        self.assertEquals(events, [RankEvent(ENTERED, 'DDD-BTC', None, 1), RankEvent(DOWN, 'AAA-BTC', 1, 2),
+                                   RankEvent(DROPPED, 'BBB-BTC', 2, None)])
+        events = self.ranking.update(self.pairs, np.array([7., 4., 3., 6.]))
+        self.assertEquals(events, [RankEvent(UP, 'AAA-BTC', 2, 1), RankEvent(DOWN, 'DDD-BTC', 1, 2)])
+        self.assertEquals(self.ranking.update(self.pairs, np.array([7., 4., 3., 6.])), [])
+
+    def test_threshold(self):
+        ranking = VolumeRanking(top_n=2, threshold=0.1)
+        ranking.update(self.pairs, np.array([1., 4., 3., 2.]))
+        self.assertEquals(ranking.update(self.pairs, np.array([1., 4.2, 3.2, 2.])), [])
+        self.assertEquals(ranking.get_top(), [('BBB-BTC', 4), ('CCC-BTC', 3)])
+        ranking.update(self.pairs, np.array([1., 4., 4.5, 2.]))
+        self.assertEquals(ranking.get_top(), [('CCC-BTC', 4.5), ('BBB-BTC', 4)])
+
+    def test_pairs_changed(self):
+        self.ranking.update(self.pairs, np.array([1., 4., 3., 2.]))
+        events = self.ranking.update(('AAA-BTC', 'CCC-BTC', 'EEE-BTC'), np.array([1., 3., np.nan]))
+        self.assertEquals(events, [RankEvent(UP, 'CCC-BTC', 2, 1), RankEvent(ENTERED, 'AAA-BTC', None, 2),
+                                   RankEvent(DROPPED, 'BBB-BTC', 1, None)])
+        self.assertIsNone(self.ranking.get_rank('BBB-BTC'))
+        self.assertIsNone(self.ranking.get_rank('EEE-BTC'))
+        self.assertEquals(len(self.ranking), 2)
+
+    def test_same_order_as_sort(self):
+        snapshot = MarketSnapshot.from_stats(json.loads(ut_constants.COBINHOOD_PAIRS_STATS)['result'])
+        ranking = VolumeRanking(top_n=20)
+        volumes = snapshot.columns['base_volume']
+        ranking.update(snapshot.pairs, volumes)
+        volumes = volumes * np.linspace(0.5, 1.5, len(volumes))
+        ranking.update(snapshot.pairs, volumes)
+        self.assertEquals([v for _, v in ranking.get_top()], sorted(volumes.tolist(), reverse=True)[:20])
+
+
+if __name__ == "__main__":
+    unittest.main()
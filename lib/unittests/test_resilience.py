@@ -0,0 +1,88 @@
+'''
+This module contains the unit tests for module resilience.
+Created by: rggentil
+Date: 18/05/30
+'''
+
+
+import unittest
+from mock import patch, MagicMock
+from resilience import RetryPolicy, CircuitBreaker, CircuitOpenError, CLOSED, OPEN, HALF_OPEN
+
+
+class TestRetryPolicy(unittest.TestCase):
+    '''
+    Tests for RetryPolicy class
+    '''
+
+    def test_delay_backoff(self):
+        policy = RetryPolicy(base_delay=1, max_delay=5)
+        with patch('resilience.random.uniform', side_effect=lambda low, high: high):
+            self.assertEquals([policy.get_delay(retry) for retry in range(5)], [1, 2, 4, 5, 5])
+        for retry in range(5):
+            self.assertTrue(0 <= policy.get_delay(retry) <= 5)
+
+    @patch('resilience.sleep')
+    def test_call_retries(self, mock_sleep):
+        func = MagicMock(side_effect=[IOError, IOError, 'ok'])
+        self.assertEquals(RetryPolicy(retry_on=(IOError,)).call(func, 1, key=2), 'ok')
+        self.assertEquals(func.call_count, 3)
+        func.assert_called_with(1, key=2)
+        self.assertEquals(mock_sleep.call_count, 2)
+
+    @patch('resilience.sleep')
+    def test_call_gives_up(self, mock_sleep):
+        func = MagicMock(side_effect=IOError)
+        self.assertRaises(IOError, RetryPolicy(max_retries=2, retry_on=(IOError,)).call, func)
+        self.assertEquals(func.call_count, 3)
+
+        func = MagicMock(side_effect=ValueError)
+        self.assertRaises(ValueError, RetryPolicy(retry_on=(IOError,)).call, func)
+        self.assertEquals(func.call_count, 1)
+
+    @patch('resilience.sleep')
+    def test_call_retry_after(self, mock_sleep):
+        error = IOError()
+        error.retry_after = 3
+        func = MagicMock(side_effect=[error, 'ok'])
+        self.assertEquals(RetryPolicy(base_delay=0.1, retry_on=(IOError,)).call(func), 'ok')
+        mock_sleep.assert_called_once_with(3)
+
+        func = MagicMock(side_effect=error)
+        self.assertRaises(IOError, RetryPolicy(max_delay=2, retry_on=(IOError,)).call, func)
+        self.assertEquals(func.call_count, 1)  # The service asks to wait more than max_delay
+
+
+class TestCircuitBreaker(unittest.TestCase):
+    '''
+    Tests for CircuitBreaker class
+    '''
+
+    @patch('resilience.time')
+    def test_breaker_states(self, mock_time):
+        mock_time.return_value = 1000
+        breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=10)
+        failing = MagicMock(side_effect=IOError)
+        self.assertRaises(IOError, breaker.call, failing)
+        self.assertEquals(breaker.state, CLOSED)
+        self.assertRaises(IOError, breaker.call, failing)
+        self.assertEquals(breaker.state, OPEN)
+        self.assertRaises(CircuitOpenError, breaker.call, failing)
+        self.assertEquals(failing.call_count, 2)
+
+        mock_time.return_value = 1010
+        self.assertRaises(IOError, breaker.call, failing)  # Half open, the test call fails and it's opened again
+        self.assertEquals(breaker.state, OPEN)
+        self.assertRaises(CircuitOpenError, breaker.call, failing)
+
+        mock_time.return_value = 1020
+        self.assertTrue(breaker.allow_request())
+        self.assertEquals(breaker.state, HALF_OPEN)
+        self.assertFalse(breaker.allow_request())  # Only one test call
+        breaker.record_success()
+        self.assertEquals(breaker.state, CLOSED)
+        self.assertEquals(breaker.call(lambda: 'ok'), 'ok')
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+'''
+This module contains the unit tests for module scheduler.
+Created by: rggentil
+Date: 18/05/02
+'''
+
+
+import threading
+import unittest
+import mock
+from scheduler import Poller, StopPolling
+
+
+class TestPoller(unittest.TestCase):
+    '''
+    Tests for Poller class
+    '''
+
+    def test_poller_runs_task(self):
+        done = threading.Event()
+        calls = []
+
+        def task():
+            calls.append(1)
+            if len(calls) == 3:
+                done.set()
+
+        poller = Poller('test', 0.01, task)
+        poller.start()
+        self.assertTrue(done.wait(2))
+        poller.stop()
+        poller.join(2)
+        self.assertFalse(poller.is_alive())
+        self.assertGreaterEqual(poller.runs, 3)
+
+    def test_poller_survives_errors(self):
+        done = threading.Event()
+        calls = []
+
+        def failing_task():
+            calls.append(1)
+            if len(calls) == 2:
+                done.set()
+            raise ValueError
+
+        stop_event = threading.Event()
+        poller = Poller('failing', 0.01, failing_task, stop_event)
+        poller.start()
+        self.assertTrue(done.wait(2))
+        stop_event.set()
+        poller.join(2)
+        self.assertFalse(poller.is_alive())
+        self.assertGreaterEqual(poller.errors, 2)
+
+    def test_poller_stopped_by_task(self):
+        calls = []
+
+        def task():
+            calls.append(1)
+            if len(calls) == 2:
+                raise StopPolling()
+
+        poller = Poller('test', 0.01, task)
+        poller.start()
+        poller.join(2)
+        self.assertFalse(poller.is_alive())
+        self.assertEquals(poller.runs, 2)
+        self.assertEquals(poller.errors, 0)
+
+    def test_poller_aligned_ticks(self):
+        poller = Poller('test', 0.5, lambda: None)
+        self.assertEquals(poller.get_first_tick(100.2), 100.5)
+        self.assertEquals(poller.get_first_tick(100.5), 100.5)
+        self.assertEquals(Poller('test', 0.5, lambda: None, align=False).get_first_tick(100.2), 100.2)
+
+    def test_poller_does_not_drift(self):
+        stop_event = threading.Event()
+        now = [100.2]
+        starts = []
+
+        def slow_task():
+            starts.append(now[0])
+            now[0] += 0.2  # The task takes a good part of the interval, that must not delay the next runs
+            if len(starts) == 5:
+                stop_event.set()
+
+        poller = Poller('test', 0.5, slow_task, stop_event)
+        with mock.patch('scheduler.time', side_effect=lambda: now[0]), mock.patch('scheduler.sleep') as mock_sleep:
+            mock_sleep.side_effect = lambda seconds: now.__setitem__(0, now[0] + seconds)
+            stop_event.wait = lambda timeout: now.__setitem__(0, now[0] + timeout) or stop_event.is_set()
+            poller.run()
+        self.assertEquals(len(starts), 5)
+        for start, tick in zip(starts, [100.5, 101., 101.5, 102., 102.5]):
+            self.assertAlmostEqual(start, tick)
+        self.assertEquals(poller.overruns, 0)
+        metrics = poller.get_metrics()
+        self.assertAlmostEqual(metrics['max_lateness'], 0)
+        self.assertGreaterEqual(metrics['max_lateness'], metrics['mean_lateness'])
+        self.assertGreaterEqual(metrics['jitter'], 0)
+
+    def test_poller_skips_overrun_ticks(self):
+        stop_event = threading.Event()
+        now = [100.0]
+
+        def task():
+            now[0] += 1.25  # Run takes 2.5 intervals, ticks 100.5 and 101 are skipped and next run is at 101.5
+            if len(calls) == 2:
+                stop_event.set()
+            calls.append(now[0])
+
+        calls = []
+        poller = Poller('test', 0.5, task, stop_event)
+        with mock.patch('scheduler.time', side_effect=lambda: now[0]), mock.patch('scheduler.sleep') as mock_sleep:
+            mock_sleep.side_effect = lambda seconds: now.__setitem__(0, now[0] + seconds)
+            stop_event.wait = lambda timeout: now.__setitem__(0, now[0] + timeout) or stop_event.is_set()
+            poller.run()
+        self.assertEquals(poller.runs, 3)
+        self.assertEquals(calls, [101.25, 102.75, 104.25])
+        self.assertEquals(poller.overruns, 6)
+        self.assertEquals(poller.max_lateness, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+'''
+This module contains the unit tests for module screener.
+Created by: rggentil
+Date: 18/06/13
+'''
+
+
+import unittest
+import numpy as np
+from screener import Screen, ScreenerError, Condition, parse_condition, compute_column
+
+
+class TestScreen(unittest.TestCase):
+    '''
+    Tests for Screen class
+    '''
+
+    def setUp(self):
+        self.pairs = ('AAA-BTC', 'BBB-BTC', 'CCC-BTC', 'DDD-BTC')
+        self.columns = {'spread': np.array([0.001, 0.01, 0.004, np.nan]),
+                        'volume_usd': np.array([20000., 50000., 15000., 90000.]),
+                        'range_24h': np.array([0.1, 0.3, 0.2, 0.5])}
+
+    def test_parse_condition(self):
+        self.assertEquals(parse_condition('spread < 0.5%'), Condition('spread', '<', 0.005))
+        self.assertEquals(parse_condition(' volume_usd>=10k'), Condition('volume_usd', '>=', 10000.))
+        self.assertEquals(parse_condition('base_volume != 1.5e2'), Condition('base_volume', '!=', 150.))
+        self.assertEquals(parse_condition('quote_volume > 2M'), Condition('quote_volume', '>', 2e6))
+        for condition in ['spread <', 'spread ~ 1', '< 1', 'spread < 1 and', 'spread < 1x']:
+            self.assertRaises(ScreenerError, parse_condition, condition)
+
+    def test_run(self):
+        screen = Screen('spread < 0.5% AND volume_usd > 10k', sort_by='-range_24h')
+        self.assertEquals(screen.conditions, (Condition('spread', '<', 0.005), Condition('volume_usd', '>', 10000.)))
+        self.assertEquals(screen.get_columns(), {'spread', 'volume_usd', 'range_24h'})
+        self.assertEquals(screen.run(self.columns.get, self.pairs), ['CCC-BTC', 'AAA-BTC'])  # nan spread excluded
+        self.assertEquals(Screen(['volume_usd > 10k'], sort_by='range_24h', limit=2).run(self.columns.get, self.pairs),
+                          ['AAA-BTC', 'CCC-BTC'])
+        self.assertEquals(Screen().run(self.columns.get, self.pairs), list(self.pairs))
+        self.assertEquals(Screen('spread > 1').run(self.columns.get, self.pairs), [])
+
+    def test_sort_nan_last(self):
+        for sort_by in ['spread', '-spread']:
+            self.assertEquals(Screen(sort_by=sort_by).run(self.columns.get, self.pairs)[-1], 'DDD-BTC')
+
+
+class TestComputeColumn(unittest.TestCase):
+    '''
+    Tests for compute_column function
+    '''
+
+    def test_derived_columns(self):
+        columns = {'highest_bid': np.array([99., 0., 10.]), 'lowest_ask': np.array([101., 5., 11.]),
+                   'high_24hr': np.array([110., 6., 12.]), 'low_24hr': np.array([90., 4., 9.]),
+                   'last_price': np.array([100., 0., 10.])}
+        np.testing.assert_allclose(compute_column(columns, 'mid_price'), [100., np.nan, 10.5])
+        np.testing.assert_allclose(compute_column(columns, 'spread'), [0.02, np.nan, 1 / 10.5])
+        np.testing.assert_allclose(compute_column(columns, 'range_24h'), [0.2, np.nan, 0.3])
+        self.assertFalse(compute_column(columns, 'spread').flags.writeable)
+        self.assertRaises(ScreenerError, compute_column, columns, 'liquidity')
+
+
+if __name__ == '__main__':
+    unittest.main()
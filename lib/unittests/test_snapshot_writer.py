@@ -0,0 +1,99 @@
+'''
+This module contains the unit tests for module snapshot_writer.
+Created by: rggentil
+Date: 18/05/25
+'''
+
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from snapshot_writer import SnapshotWriter, write_atomic
+
+
+class TestSnapshotWriter(unittest.TestCase):
+    '''
+    Tests for SnapshotWriter class
+    '''
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.file_path = os.path.join(self.directory, 'pairs_volume.json')
+
+    def test_write_atomic(self):
+        write_atomic(self.file_path, 'old')
+        write_atomic(self.file_path, 'new')
+        with open(self.file_path) as f:
+            self.assertEquals(f.read(), 'new')
+        self.assertEquals(os.listdir(self.directory), ['pairs_volume.json'])
+
+    def test_write_atomic_error_keeps_file(self):
+        write_atomic(self.file_path, 'old')
+        with self.assertRaises(TypeError):
+            write_atomic(self.file_path, None)
+        with open(self.file_path) as f:
+            self.assertEquals(f.read(), 'old')
+        self.assertEquals(os.listdir(self.directory), ['pairs_volume.json'])
+
+    def test_writer_writes_json(self):
+        writer = SnapshotWriter()
+        writer.start()
+        writer.submit(self.file_path, {'pairs_volume': {'ETH-BTC': 1.5}})
+        writer.stop(timeout=2)
+        self.assertFalse(writer.is_alive())
+        with open(self.file_path) as f:
+            self.assertEquals(json.load(f), {'pairs_volume': {'ETH-BTC': 1.5}})
+        metrics = writer.get_metrics()
+        self.assertEquals(metrics['written'], 1)
+        self.assertEquals(metrics['queue_depth'], 0)
+        self.assertGreaterEqual(metrics['max_write_latency'], metrics['last_write_latency'])
+
+    def test_writer_coalesces_pending_writes(self):
+        blocked, release = threading.Event(), threading.Event()
+
+        def slow_serializer(data):
+            blocked.set()
+            release.wait(2)
+            return json.dumps(data)
+
+        writer = SnapshotWriter(serializer=slow_serializer)
+        writer.start()
+        writer.submit(self.file_path, 0)
+        self.assertTrue(blocked.wait(2))  # Writer is busy with the first write, the next ones are queued
+        for i in range(1, 5):
+            writer.submit(self.file_path, i)
+        self.assertEquals(writer.get_metrics()['queue_depth'], 1)
+        release.set()
+        writer.stop(timeout=2)
+        with open(self.file_path) as f:
+            self.assertEquals(json.load(f), 4)
+        self.assertEquals(writer.written, 2)
+        self.assertEquals(writer.coalesced, 3)
+
+    def test_writer_bounded_queue(self):
+        writer = SnapshotWriter(max_pending=2)  # Not started, so nothing is written
+        for i in range(3):
+            writer.submit(os.path.join(self.directory, 'file_{}.json'.format(i)), i)
+        self.assertEquals(writer.get_metrics()['queue_depth'], 2)
+        self.assertEquals(writer.dropped, 1)
+        writer.start()
+        writer.stop(timeout=2)
+        self.assertEquals(sorted(os.listdir(self.directory)), ['file_1.json', 'file_2.json'])
+
+    def test_writer_survives_errors(self):
+        writer = SnapshotWriter()
+        writer.start()
+        writer.submit(os.path.join(self.directory, 'missing', 'file.json'), {})
+        writer.submit(self.file_path, {})
+        writer.stop(timeout=2)
+        self.assertEquals(writer.errors, 1)
+        self.assertEquals(writer.written, 1)
+        self.assertTrue(os.path.exists(self.file_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,59 @@
+'''
+This module contains the unit tests for module view_cache.
+Created by: rggentil
+Date: 18/06/04
+'''
+
+
+import unittest
+from mock import MagicMock
+from view_cache import ViewCache
+
+
+class TestViewCache(unittest.TestCase):
+    '''
+    Tests for ViewCache class
+    '''
+
+    def test_view_computed_once_per_generation(self):
+        cache = ViewCache()
+        compute = MagicMock(return_value=[1, 2])
+        self.assertIs(cache.get('view', compute), cache.get('view', compute))
+        self.assertEquals(compute.call_count, 1)
+        self.assertEquals((cache.hits, cache.misses), (1, 1))
+
+        cache.bump()
+        self.assertNotIn('view', cache)
+        cache.get('view', compute)
+        self.assertEquals(compute.call_count, 2)
+
+    def test_view_of_old_generation(self):
+        cache = ViewCache()
+
+        def compute():
+            cache.bump()  # Data changes while the view is computed
+            return 'old view'
+
+        self.assertEquals(cache.get('view', compute), 'old view')
+        self.assertNotIn('view', cache)
+        self.assertEquals(cache.get('view', lambda: 'new view'), 'new view')
+
+    def test_lru_eviction(self):
+        cache = ViewCache(max_size=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a', lambda: 10)  # a is the most recently used now
+        cache.put('c', 3)
+        self.assertEquals(len(cache), 2)
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertEquals(cache.get('a', lambda: 10), 1)
+
+    def test_errors_not_cached(self):
+        cache = ViewCache()
+        self.assertRaises(ValueError, cache.get, 'view', MagicMock(side_effect=ValueError))
+        self.assertNotIn('view', cache)
+
+
+if __name__ == "__main__":
+    unittest.main()
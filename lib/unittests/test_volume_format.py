@@ -0,0 +1,77 @@
+'''
+This module contains the unit tests for module volume_format.
+Created by: rggentil
+Date: 18/05/28
+'''
+
+
+import json
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+from volume_format import pack_volumes, unpack_volumes, load_volumes, VolumeFormatError
+
+
+TIME = '2018-05-28T10:00:00.000000'
+PAIRS = ('ABT-BTC', 'ETH-BTC', 'ETH-USDT', 'ZRX-ETH')
+BASE_VOLUMES = np.array([0.0, 10.0, 2.0, 0.0])
+VOLUMES = np.array([0.0, 80000.0, 1000.0, 0.0])
+VOLUME_PAIRS_DICT = {'time': TIME,
+                     'pairs_volume': {'ABT-BTC': 0.0, 'ETH-BTC': 10.0, 'ETH-USDT': 2.0, 'ZRX-ETH': 0.0},
+                     'pairs_volume_sorted': [['ETH-BTC', 80000.0], ['ETH-USDT', 1000.0], ['ABT-BTC', 0.0],
+                                             ['ZRX-ETH', 0.0]],
+                     'pairs_withouth_volume': ['ABT-BTC', 'ZRX-ETH']}
+
+
+class TestVolumeFormat(unittest.TestCase):
+    '''
+    Tests for the binary format of the volume file
+    '''
+
+    def test_pack_roundtrip(self):
+        self.assertEquals(unpack_volumes(pack_volumes(TIME, PAIRS, BASE_VOLUMES, VOLUMES)), VOLUME_PAIRS_DICT)
+
+    def test_pack_compressed_roundtrip(self):
+        data = pack_volumes(TIME, PAIRS, BASE_VOLUMES, VOLUMES, compress=True)
+        self.assertEquals(unpack_volumes(data), VOLUME_PAIRS_DICT)
+
+    def test_pack_stale_roundtrip(self):
+        last_update = '2018-05-28T09:50:00.000000'
+        data = pack_volumes(TIME, PAIRS, BASE_VOLUMES, VOLUMES, compress=True, last_update=last_update, stale=True)
+        self.assertEquals(unpack_volumes(data), dict(VOLUME_PAIRS_DICT, last_update=last_update, stale=True))
+
+    def test_pack_ranks(self):
+        data = pack_volumes(TIME, PAIRS, BASE_VOLUMES, VOLUMES, ranks=np.array([1, 2, 3, 0]))
+        self.assertEquals(unpack_volumes(data)['pairs_volume_sorted'],
+                          [['ETH-BTC', 80000.0], ['ETH-USDT', 1000.0], ['ZRX-ETH', 0.0], ['ABT-BTC', 0.0]])
+
+    def test_pack_without_conversion(self):
+        volumes = np.array([0.0, np.nan, 1000.0, 0.0])  # Volume of ETH-BTC can't be converted to the currency
+        volume_pairs_dict = unpack_volumes(pack_volumes(TIME, PAIRS, BASE_VOLUMES, volumes))
+        self.assertEquals(volume_pairs_dict['pairs_volume_sorted'],
+                          [['ETH-USDT', 1000.0], ['ABT-BTC', 0.0], ['ZRX-ETH', 0.0]])
+        self.assertEquals(volume_pairs_dict['pairs_volume']['ETH-BTC'], 10.0)
+        json.dumps(volume_pairs_dict, allow_nan=False)  # Same valid json as the json file
+
+    def test_binary_smaller_than_json(self):
+        self.assertLess(len(pack_volumes(TIME, PAIRS, BASE_VOLUMES, VOLUMES)), len(json.dumps(VOLUME_PAIRS_DICT)))
+
+    def test_unpack_unknown_format(self):
+        with self.assertRaises(VolumeFormatError):
+            unpack_volumes(json.dumps(VOLUME_PAIRS_DICT))
+
+    def test_load_any_format(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        json_path, binary_path = os.path.join(directory, 'volume.json'), os.path.join(directory, 'volume.bin')
+        with open(json_path, 'w') as f:
+            json.dump(VOLUME_PAIRS_DICT, f)
+        with open(binary_path, 'wb') as f:
+            f.write(pack_volumes(TIME, PAIRS, BASE_VOLUMES, VOLUMES, compress=True))
+        self.assertEquals(load_volumes(json_path), load_volumes(binary_path))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,80 @@
+'''
+This module includes the class ViewCache that keeps the views derived from the market snapshot of an exchange, like the
+volumes in a currency or the pairs sorted by volume, so each view is computed only once for each snapshot no matter how
+many times it's requested. Views are stamped with the generation of the snapshot they were computed from, and the cache
+is bounded, the least recently used views are evicted first.
+Created: rggentil
+Date: 06/04/18
+'''
+
+
+from collections import OrderedDict
+import logging
+
+
+DEFAULT_MAX_SIZE = 64
+
+
+logger = logging.getLogger('rodbot')
+
+
+class ViewCache(object):
+    '''
+    LRU cache of views stamped with the generation of the data they are derived from
+    '''
+
+    def __init__(self, max_size=DEFAULT_MAX_SIZE):
+        '''
+        Constructor
+        :param max_size: int, max number of views in the cache
+        '''
+        self.max_size = max_size
+        self.generation = 0
+        self._views = OrderedDict()  # key-tuple (generation, view), from least to most recently used
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._views)
+
+    def __contains__(self, key):
+        entry = self._views.get(key)
+        return entry is not None and entry[0] == self.generation
+
+    def bump(self):
+        '''
+        Start a new generation, the views of the previous ones are not valid anymore
+        '''
+        self.generation += 1
+        self._views.clear()
+
+    def get(self, key, compute):
+        '''
+        Get a view, computing it if it's not in the cache for the current generation
+        :param key: hashable key of the view, i.e. ('volumes', 'USD')
+        :param compute: callable without arguments that computes the view
+        :return: the view. It's shared by all the callers, so it must not be modified
+        '''
+        generation = self.generation  # A view computed while the generation changes is stamped with the old one
+        entry = self._views.pop(key, None)
+        if entry is not None and entry[0] == generation:
+            self.hits += 1
+            view = entry[1]
+        else:
+            self.misses += 1
+            view = compute()
+        self.put(key, view, generation)
+        return view
+
+    def put(self, key, view, generation=None):
+        '''
+        Store a view
+        :param key: hashable key of the view
+        :param view: the view
+        :param generation: int, generation of the data of the view. Optional, the current one by default
+        '''
+        self._views.pop(key, None)
+        self._views[key] = (self.generation if generation is None else generation, view)
+        while len(self._views) > self.max_size:
+            evicted_key, _ = self._views.popitem(last=False)
+            logger.debug('View %s evicted from cache', evicted_key)
@@ -0,0 +1,136 @@
+'''
+This module includes the compact binary format of the volume file of rodbot. The json file repeats the pairs in the dict
+of volumes, in the sorted list and in the list of pairs without volume; the binary file has the pairs only once, in a
+table, and the rest are packed arrays with a value for each pair of the table:
+
+    magic 'RDBV', version (uint8), flags (uint8, FLAG_ZLIB if the rest of the file is compressed with zlib, FLAG_STALE
+                if the stats couldn't be updated)
+    time        uint16 length + utf-8 str, the same iso time of the json file
+    pairs       uint32 number of pairs + uint32 length + utf-8 pairs separated by new lines
+    volumes     float64 base volume of each pair
+    sorted      float64 volume in the currency of each pair, nan if it can't be converted to the currency
+    ranks       uint32 position in the table of each pair, in descending order of volume, nan volumes the last ones
+    last update uint16 length + utf-8 str, iso time of the stats. Optional, files without it can still be read
+
+load_volumes gets back the same dict that is written in the json file, so consumers don't depend on the format.
+Created: rggentil
+Date: 05/28/18
+'''
+
+
+import json
+import logging
+import numpy as np
+import struct
+import zlib
+
+
+MAGIC = b'RDBV'
+VERSION = 1
+FLAG_ZLIB = 0x01
+FLAG_STALE = 0x02
+HEADER = struct.Struct('<4sBB')
+LENGTH_16 = struct.Struct('<H')
+LENGTH_32 = struct.Struct('<I')
+
+
+logger = logging.getLogger('rodbot')
+
+
+class VolumeFormatError(Exception):
+    pass
+
+
+def pack_volumes(time, pairs, base_volumes, volumes, ranks=None, compress=False, last_update=None, stale=False):
+    '''
+    Function to pack the volumes of the pairs of an exchange in the binary format
+    :param time: str, iso time of the volumes
+    :param pairs: list of str with the pairs
+    :param base_volumes: numpy array with the base volume of each pair
+    :param volumes: numpy array with the volume of each pair in the currency of rodbot, nan for the pairs whose volume
+                    can't be converted to the currency
+    :param ranks: numpy array with the positions of the pairs in descending order of volume. Optional, by default
+                  computed from volumes with a stable sort, with nan volumes at the end
+    :param compress: boolean, True to compress with zlib
+    :param last_update: str, iso time of the stats. Optional
+    :param stale: boolean, True if the stats couldn't be updated and are the ones of last_update
+    :return: str with the packed volumes
+    '''
+    volumes = np.asarray(volumes, dtype=np.float64)
+    if ranks is None:
+        ranks = np.argsort(-volumes, kind='mergesort')
+    time = time.encode('utf-8')
+    pairs_table = '\n'.join(pairs).encode('utf-8')
+    body = b''.join([LENGTH_16.pack(len(time)), time,
+                     LENGTH_32.pack(len(pairs)), LENGTH_32.pack(len(pairs_table)), pairs_table,
+                     np.asarray(base_volumes, dtype='<f8').tobytes(),
+                     volumes.astype('<f8').tobytes(),
+                     np.asarray(ranks, dtype='<u4').tobytes()])
+    if last_update is not None:
+        last_update = last_update.encode('utf-8')
+        body += LENGTH_16.pack(len(last_update)) + last_update
+    if compress:
+        body = zlib.compress(body)
+    return HEADER.pack(MAGIC, VERSION, (FLAG_ZLIB if compress else 0) | (FLAG_STALE if stale else 0)) + body
+
+
+def unpack_volumes(data):
+    '''
+    Function to unpack volumes packed in the binary format
+    :param data: str with the packed volumes
+    :return: dict with time, pairs_volume, pairs_volume_sorted and pairs_withouth_volume, and last_update and stale
+             if they were packed, as in the json file. As in the json file, pairs with nan volume are not in
+             pairs_volume_sorted
+    '''
+    if len(data) < HEADER.size:
+        raise VolumeFormatError('Volume data too short')
+    magic, version, flags = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise VolumeFormatError('Unknown volume format {!r} version {}'.format(magic, version))
+    body = data[HEADER.size:]
+    if flags & FLAG_ZLIB:
+        body = zlib.decompress(body)
+    offset = 0
+    time_length, = LENGTH_16.unpack_from(body, offset)
+    offset += LENGTH_16.size
+    time = body[offset:offset + time_length].decode('utf-8')
+    offset += time_length
+    n_pairs, table_length = struct.unpack_from('<II', body, offset)
+    offset += 2 * LENGTH_32.size
+    pairs_table = body[offset:offset + table_length].decode('utf-8')
+    offset += table_length
+    pairs = pairs_table.split('\n') if pairs_table else []
+    if len(pairs) != n_pairs:
+        raise VolumeFormatError('Expected {} pairs, got {}'.format(n_pairs, len(pairs)))
+    base_volumes = np.frombuffer(body, dtype='<f8', count=n_pairs, offset=offset)
+    offset += base_volumes.nbytes
+    volumes = np.frombuffer(body, dtype='<f8', count=n_pairs, offset=offset)
+    offset += volumes.nbytes
+    ranks = np.frombuffer(body, dtype='<u4', count=n_pairs, offset=offset)
+    offset += ranks.nbytes
+    volumes_list = volumes.tolist()
+    volume_pairs_dict = {'time': time,
+                         'pairs_volume': dict(zip(pairs, base_volumes.tolist())),
+                         'pairs_volume_sorted': [[pairs[i], volumes_list[i]] for i in ranks.tolist()
+                                                 if not np.isnan(volumes_list[i])],
+                         'pairs_withouth_volume': [pairs[i] for i in np.flatnonzero(base_volumes == 0)]}
+    if offset < len(body):
+        last_update_length, = LENGTH_16.unpack_from(body, offset)
+        offset += LENGTH_16.size
+        volume_pairs_dict['last_update'] = body[offset:offset + last_update_length].decode('utf-8')
+        volume_pairs_dict['stale'] = bool(flags & FLAG_STALE)
+    return volume_pairs_dict
+
+
+def load_volumes(file_path):
+    '''
+    Function to load a volume file written by rodbot, either in json or in the binary format
+    :param file_path: str, path of the file
+    :return: dict with time, pairs_volume, pairs_volume_sorted and pairs_withouth_volume, and last_update and stale
+             if the file has them
+    '''
+    with open(file_path, 'rb') as f:
+        data = f.read()
+    if data.startswith(MAGIC):
+        return unpack_volumes(data)
+    return json.loads(data)
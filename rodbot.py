@@ -5,18 +5,35 @@ Date: 03/27/18
 '''
 
 import argparse
+from collections import OrderedDict
+import lib.analytics as analytics
+import lib.anomaly as anomaly
 import lib.api_exchange as api_exchange
+import lib.history as history
+import lib.market_delta as market_delta
 import json
 import logging
 from logging.config import dictConfig
 from datetime import datetime
 import os
+import lib.ranking as ranking
+import lib.scheduler as scheduler
+import lib.screener as screener
+import lib.snapshot_writer as snapshot_writer
+import lib.volume_format as volume_format
 from time import sleep
 import sys
+import threading
 
 
-VOLUME_PAIRS_FILE = os.path.join('out', 'pairs_volume.json')
+VOLUME_PAIRS_FILE = os.path.join('out', 'pairs_volume_{}.json')
+VOLUME_PAIRS_BINARY_FILE = os.path.join('out', 'pairs_volume_{}.bin')
+DELTA_STREAM_FILE = os.path.join('out', 'pairs_delta_{}.jsonl')
 TRADING_LOG = os.path.join('log', 'rodbot.{}')
+TOP_PAIRS = 10
+WRITER_STOP_TIMEOUT = 10
+JSON_FORMAT = 'json'
+BINARY_FORMAT = 'binary'
 
 
 dict_log_config = {
@@ -64,21 +81,61 @@ dictConfig(dict_log_config)
 logger = logging.getLogger('rodbot')
 
 
-def get_parsed_args():
+def get_parser():
     '''
-    Function to manage parsed arguments
-    :return: parse args
+    Function to get the parser of the arguments
+    :return: ArgumentParser
     '''
     parser = argparse.ArgumentParser(description='Simple script/bot to manage trading in exchanges')
 
-    parser.add_argument('-x', '--exchange', default='cobinhood', choices=['cobinhood', 'simulator'],
-                        help='Select exchange to operate with.')
-    parser.add_argument('-c', '--currency', default='USD', choices=['USD', 'BTC', 'ETH'],
-                        help='Select exchange to operate with.')
-    parser.add_argument('-i', '--interval', default=600, type=int, help='checking interval')
+    parser.add_argument('-x', '--exchange', default=[api_exchange.COBINHOOD], nargs='+',
+                        choices=sorted(api_exchange.API_URLS), help='Select exchanges to operate with.')
+    parser.add_argument('-c', '--currency', default='USD', type=str.upper,
+                        help='Select currency of the volume, any currency listed in the exchange, i.e. USD, BTC, ETH.')
+    parser.add_argument('-i', '--interval', default=[600], type=float, nargs='+',
+                        help='checking interval in seconds, it can be less than a second, one for all the exchanges or '
+                             'one for each exchange. Exchanges with the same interval are checked at the same time')
+    parser.add_argument('-d', '--delta-stream', action='store_true',
+                        help='write the changes of the stats of each update in {}'.format(
+                            DELTA_STREAM_FILE.format('<exchange>')))
+    parser.add_argument('-f', '--format', default=JSON_FORMAT, choices=[JSON_FORMAT, BINARY_FORMAT],
+                        help='format of the volume file, {} in {} or compact {} in {}'.format(
+                            JSON_FORMAT, VOLUME_PAIRS_FILE.format('<exchange>'), BINARY_FORMAT,
+                            VOLUME_PAIRS_BINARY_FILE.format('<exchange>')))
+    parser.add_argument('-z', '--compress', action='store_true', help='compress the volume file in binary format')
+    parser.add_argument('-b', '--order-books', action='store_true',
+                        help='get the order books of the top {} pairs and log their depth gaps'.format(TOP_PAIRS))
+    parser.add_argument('-s', '--screen',
+                        help='log the top {} pairs by volume that match some filters over the stats, i.e. '
+                             '"spread < 0.5%% and volume_usd > 10k". Columns are the fields of the stats, {} and '
+                             'volume_<currency>'.format(TOP_PAIRS, ', '.join(screener.DERIVED_COLUMNS)))
     parser.add_argument('-v', '--verbosity', action='count', help='increase output verbosity')
+    return parser
 
-    return parser.parse_args()
+
+def get_parsed_args(parser):
+    '''
+    Function to manage parsed arguments
+    :param parser: ArgumentParser, see get_parser
+    :return: parse args
+    '''
+    parsed_args = parser.parse_args()
+    if len(parsed_args.interval) == 1:
+        parsed_args.interval = parsed_args.interval * len(parsed_args.exchange)
+    elif len(parsed_args.interval) != len(parsed_args.exchange):
+        parser.error('Number of intervals must be 1 or the same as the number of exchanges')
+    intervals = OrderedDict()  # Repeated exchanges are only started once
+    for exchange, interval in zip(parsed_args.exchange, parsed_args.interval):
+        if intervals.setdefault(exchange, interval) != interval:
+            parser.error('Exchange {} repeated with different intervals'.format(exchange))
+    parsed_args.exchange, parsed_args.interval = list(intervals), list(intervals.values())
+    if parsed_args.screen is not None:
+        try:
+            parsed_args.screen = screener.Screen(parsed_args.screen, limit=TOP_PAIRS,
+                                                 sort_by='-volume_{}'.format(parsed_args.currency.lower()))
+        except screener.ScreenerError as error:
+            parser.error(str(error))
+    return parsed_args
 
 
 def setup_log_level(verbosity):
@@ -99,50 +156,173 @@ def setup_log_level(verbosity):
 
 
 def main():
-    parsed_args = get_parsed_args()
+    parser = get_parser()
+    parsed_args = get_parsed_args(parser)
 
     setup_log_level(parsed_args.verbosity)
     logger.debug('Parsed args: %s', parsed_args)
 
-    logger.debug('Prepare requesting api exchange')
-
-    try:
-        e = api_exchange.ApiExchange(exchange=parsed_args.exchange)
-    except api_exchange.ApiExchangeError:
-        logger.error('Error when trying to start connection with exchange "%s"', parsed_args.exchange)
-        sys.exit(1)
+    # Each poller starts the connection with its exchange, so a slow or failing exchange doesn't delay the others
+    writer = snapshot_writer.SnapshotWriter()
+    writer.start()
+    stop_event = threading.Event()
+    pollers = [scheduler.Poller(name=exchange, interval=interval, stop_event=stop_event,
+                                task=volume_task(exchange, parsed_args, writer))
+               for exchange, interval in zip(parsed_args.exchange, parsed_args.interval)]
+    for poller in pollers:
+        poller.start()
 
     try:
-        while True:
-            try:
-                get_volume(e, parsed_args)
-            except api_exchange.ApiExchangeError:
-                logger.error('Error getting volume in exchange "%s"', parsed_args.exchange)
-            sleep(parsed_args.interval)
+        while any(poller.is_alive() for poller in pollers):
+            sleep(1)  # Main thread must keep alive (and not blocked in a join) to receive KeyboardInterrupt
     except KeyboardInterrupt:
         print
         logger.info('Stopping rodbot...\n')
+        stop_event.set()
+        for poller in pollers:
+            logger.debug('Poller %s metrics: %s', poller.name, poller.get_metrics())
+        writer.stop(timeout=WRITER_STOP_TIMEOUT)
+        logger.debug('Snapshot writer metrics: %s', writer.get_metrics())
         sys.exit(0)
+    # All the pollers stopped by themselves, none of the exchanges can be used
+    writer.stop(timeout=WRITER_STOP_TIMEOUT)
+    sys.exit(1)
+
+
+def volume_task(exchange, parsed_args, writer=None):
+    '''
+    Get the task that the poller of an exchange runs every interval. The connection with the exchange is started in the
+    first run of the task, and tried again in the next runs while it fails. The poller is stopped if the currency is not
+    available in the exchange.
+    :param exchange: str with the exchange
+    :param parsed_args: parser object with arguments
+    :param writer: SnapshotWriter shared by all the exchanges. Optional, files are written by the poller by default
+    :return: callable without arguments
+    '''
+    volume_ranking = ranking.VolumeRanking(top_n=TOP_PAIRS)
+    history_store = history.HistoryStore(exchange)
+    rolling_analytics = analytics.RollingAnalytics()
+    anomaly_detector = anomaly.AnomalyDetector()
+    started = {}  # ApiExchange and DeltaStream of the exchange, once the connection is started
 
+    def start_exchange():
+        logger.debug('Prepare requesting api exchange "%s"', exchange)
+        try:
+            e = api_exchange.ApiExchange(exchange=exchange)
+        except api_exchange.ApiExchangeError:
+            logger.error('Error when trying to start connection with exchange "%s", retrying in the next run', exchange)
+            return
+        # The currency can only be checked with the pairs listed in the exchange
+        if not api_exchange.is_currency_available(e.snapshot, parsed_args.currency):
+            logger.error('Currency %s not available in exchange "%s"', parsed_args.currency, exchange)
+            raise scheduler.StopPolling()
+        e.add_stats_listener(rolling_analytics.update)
+        e.add_stats_listener(anomaly_detector.update)
+        started['exchange'] = e
+        if parsed_args.delta_stream:
+            started['delta_stream'] = market_delta.DeltaStream(DELTA_STREAM_FILE.format(exchange), e.get_full_delta())
 
-def get_volume(e, parsed_args):
+    def task():
+        if 'exchange' not in started:
+            start_exchange()
+            if 'exchange' not in started:
+                return
+        try:
+            get_volume(started['exchange'], parsed_args, volume_ranking, started.get('delta_stream'), history_store,
+                       writer, rolling_analytics, anomaly_detector)
+        except api_exchange.ApiExchangeError:
+            logger.error('Error getting volume in exchange "%s"', exchange)
+    return task
+
+
+def get_volume(e, parsed_args, volume_ranking=None, delta_stream=None, history_store=None, writer=None,
+               rolling_analytics=None, anomaly_detector=None):
     '''
     Function to log volume of trading pairs
     :param e: ApiExchange object
     :param parsed_args: parser object with arguments
+    :param volume_ranking: VolumeRanking of the exchange. Optional, if provided changes in the ranking are logged
+    :param delta_stream: DeltaStream of the exchange. Optional, if provided the delta of the update is written in it
+    :param history_store: HistoryStore of the exchange. Optional, if provided the snapshot is appended to the history
+    :param writer: SnapshotWriter. Optional, if provided the volume file is written in its thread instead of this one
+    :param rolling_analytics: RollingAnalytics fed by the updates of the exchange. Optional, if provided the rolling
+                              stats of the top pairs are logged
+    :param anomaly_detector: AnomalyDetector fed by the updates of the exchange. Optional, if provided the anomalies
+                             found in the update are logged
     '''
-    e.update_stats()
-    pairs_volume = e.get_pairs_by_volume()
-    pairs_volume_sorted = e.get_pairs_volume_sorted(currency=parsed_args.currency)
-    volume_pairs_dict = {'time': datetime.isoformat(datetime.now()),
-                         'pairs_volume': pairs_volume,
-                         'pairs_volume_sorted': pairs_volume_sorted,
-                         'pairs_withouth_volume': e.get_pairs_without_volume()}
-    logger.debug('Storing pairs volume data in %s', VOLUME_PAIRS_FILE)
-    with open(VOLUME_PAIRS_FILE, 'w') as f:
-        json.dump(volume_pairs_dict, f, indent=4)
-
-    logger.info('-trading- Top 10 pairs by volume %s', pairs_volume_sorted[0:9])
+    delta = e.update_stats()
+    last_update = datetime.fromtimestamp(e.last_update_time).isoformat()
+    if e.stale:
+        # The volume file is still written with the last stats, marked as stale, so readers know they are old
+        logger.warning('Stats of exchange "%s" not updated, last update at %s', e.exchange, last_update)
+    else:
+        logger.debug('Transfer stats of exchange "%s": %s', e.exchange, e.transfer_stats)
+        if anomaly_detector is not None:
+            for event in anomaly_detector.last_events:
+                logger.info('-trading- Anomaly in %s of pair %s in %s: %s, mean %s, z-score %.1f', event.field,
+                            event.pair, e.exchange, event.value, event.mean, event.z_score)
+        if delta_stream is not None:
+            delta_stream.write(delta)
+        if history_store is not None:
+            history_store.append(e.snapshot)
+    # Volumes in the currency and in the rest of volume currencies are computed at once for the update, the file, the
+    # ranking and the screen take them from the views of the exchange
+    currencies = [parsed_args.currency] + [c for c in api_exchange.VOLUME_CURRENCIES if c != parsed_args.currency]
+    volumes = e.get_volumes(currencies)[0]
+    if parsed_args.format == BINARY_FORMAT:
+        # The binary file is packed from the columns of the snapshot, without building the dicts of the json file
+        volume_pairs_file = VOLUME_PAIRS_BINARY_FILE.format(e.exchange)
+        volume_pairs_data = {'time': datetime.isoformat(datetime.now()),
+                             'pairs': e.snapshot.pairs,
+                             'base_volumes': e.snapshot.columns['base_volume'],
+                             'volumes': volumes,
+                             'compress': parsed_args.compress,
+                             'last_update': last_update,
+                             'stale': e.stale}
+        serializer = lambda data: volume_format.pack_volumes(**data)
+    else:
+        volume_pairs_file = VOLUME_PAIRS_FILE.format(e.exchange)
+        volume_pairs_data = {'time': datetime.isoformat(datetime.now()),
+                             'pairs_volume': e.get_pairs_by_volume(),
+                             'pairs_volume_sorted': e.get_pairs_volume_sorted(currency=parsed_args.currency),
+                             'pairs_withouth_volume': e.get_pairs_without_volume(),
+                             'last_update': last_update,
+                             'stale': e.stale}
+        serializer = json.dumps
+    logger.debug('Storing pairs volume data in %s', volume_pairs_file)
+    if writer is not None:
+        writer.submit(volume_pairs_file, volume_pairs_data, serializer)
+        logger.debug('Snapshot writer metrics: %s', writer.get_metrics())
+    else:
+        snapshot_writer.write_atomic(volume_pairs_file, serializer(volume_pairs_data))
+    if e.stale:
+        return
+
+    top_pairs = e.get_top_pairs(TOP_PAIRS, currency=parsed_args.currency)
+    logger.info('-trading- Top %d pairs by volume in %s %s', TOP_PAIRS, e.exchange, top_pairs)
+    if rolling_analytics is not None:
+        for pair_id, _ in top_pairs:
+            logger.debug('Rolling stats of pair %s in %s: %s', pair_id, e.exchange,
+                         rolling_analytics.get_pair_stats(pair_id))
+    if parsed_args.screen is not None:
+        try:
+            logger.info('-trading- Pairs of screen %r in %s: %s', parsed_args.screen, e.exchange,
+                        e.screen(parsed_args.screen))
+        except screener.ScreenerError as error:
+            logger.error('Error screening pairs in exchange "%s": %s', e.exchange, error)
+
+    if volume_ranking is not None and (delta or not len(volume_ranking)):
+        for event in volume_ranking.update(e.snapshot.pairs, volumes):
+            logger.info('-trading- Pair %s %s in top %d of %s: %s -> %s', event.pair, event.kind, TOP_PAIRS,
+                        e.exchange, event.old_rank, event.new_rank)
+
+    if parsed_args.order_books:
+        # Books that can't be got are left out, they don't stop the rest of the update
+        order_books = e.get_order_books([pair_id for pair_id, _ in top_pairs])
+        for pair_id, _ in top_pairs:
+            if pair_id in order_books:
+                logger.info('-trading- Depth gaps of pair %s in %s: %s', pair_id, e.exchange,
+                            order_books[pair_id].get_gap_metrics())
 
 
 if __name__ == '__main__':